@@ -0,0 +1,342 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import linopy
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from LiPEM.f_tools import get_solution
+from LiPEM.f_scenario_tools import get_max_parallel_workers
+from LiPEM.f_weather_year_tools import split_weather_years, concat_weather_year_solutions
+from LiPEM.model_single_horizon_multi_energy import build_single_horizon_multi_energy_LEAP_model, get_single_horizon_variable_bounds
+
+#### planning variables fixed in the dispatch windows
+fixed_planning_variables = ["planning_conversion_power_capacity", "planning_storage_energy_capacity",
+                            "planning_storage_power_capacity", "planning_flexible_demand_max_power_increase"]
+
+
+def solve_rolling_horizon_dispatch (
+        parameters,
+        capacities,
+        window_length: int = 168,
+        look_ahead: int = 24,
+        storage_level = None,
+        solver_name: str = "highs",
+        solver_options: dict = None,
+        max_workers: int = None,
+        memory_per_window_GB: float = 2.,
+        verbose: bool = False
+    ):
+    """
+    Computes the hourly dispatch of the year for given capacities, by splitting the year into windows of window_length
+    hours extended by look_ahead hours, solved at the same time in a pool of processes.
+    Each window is built with build_single_horizon_multi_energy_LEAP_model with the capacities fixed
+    (fixed_planning_variables). Storage levels at the beginning and at the end (look-ahead included) of each window are
+    fixed to the levels of a full-year trajectory (e.g. the one of a solution on representative periods expanded with
+    expand_time_slice_solution), and the cyclic storage constraint of the year is dropped. The results of the first
+    window_length hours of each window are stitched together.
+    The windows are independent, so that couplings beyond a window are approximated : ramps between windows are not
+    constrained, flexible demands keep their weekly and yearly energy within each window (use windows made of whole
+    weeks), and the yearly budget of operation_conversion_maximum_working_hours is shared between the windows in
+    proportion to their number of hours (look-ahead included), instead of being used freely over the year.
+    Usage :
+        model = build_single_horizon_multi_energy_LEAP_model(cluster_representative_periods(parameters, 12))
+        model.solve(solver_name='highs')
+        capacities = expand_time_slice_solution(model, reduced_parameters)
+        dispatch = solve_rolling_horizon_dispatch(parameters, capacities)
+        extractEnergyCapacity_l(dispatch)
+
+    :param parameters: xarray dataset with the hourly parameters of the year
+    :param capacities: solved linopy model or solution dataset with the planning variables
+    :param window_length: number of hours of the results of each window
+    :param look_ahead: number of hours added at the end of each window (except the last one)
+    :param storage_level: operation_storage_internal_energy_level over the year [date, area_to, energy_vector_out, storage_technology].
+    Default to the one of capacities.
+    :param solver_name: name of the solver
+    :param solver_options: other arguments of model.solve
+    :param max_workers: maximum number of windows solved at the same time, default to the number allowed by cores and
+    memory. With 1 the windows are solved one after the other in the current process.
+    :param memory_per_window_GB: memory needed by one window
+    :param verbose: default to False. If True print the windows.
+    :return: xarray dataset with the same variables as the solution of the full model, usable in extractCosts_l,
+    extractEnergyCapacity_l and EnergyAndExchange2Prod
+    """
+    if "time_slice_weight" in parameters:
+        raise ValueError("solve_rolling_horizon_dispatch expects the hourly parameters of the year, not time slices")
+    capacities = get_solution(capacities)
+    date = parameters.get_index("date")
+    if "storage_technology" in parameters and storage_level is None:
+        if not "operation_storage_internal_energy_level" in capacities:
+            raise ValueError("storage_level is needed as capacities do not contain operation_storage_internal_energy_level")
+        storage_level = capacities["operation_storage_internal_energy_level"]
+
+    windows = list()
+    for start in range(0, len(date), window_length):
+        end = min(start + window_length + look_ahead, len(date))
+        window_date = date[start:end]
+        window_parameters = parameters.sel(date=window_date)
+        if "operation_conversion_maximum_working_hours" in parameters:
+            # yearly working hours budget (stockCtr of each window) in proportion to the hours of the window
+            window_share = float(window_parameters["time_stamp_length"].sum() / parameters["time_stamp_length"].sum())
+            window_parameters["operation_conversion_maximum_working_hours"] = parameters["operation_conversion_maximum_working_hours"] * window_share
+        window = dict(parameters=window_parameters,
+                      capacities=capacities[[name for name in fixed_planning_variables if name in capacities]],
+                      storage_level=None if storage_level is None else storage_level.sel(date=[window_date[0], window_date[-1]]),
+                      solver_name=solver_name,
+                      solver_options=solver_options)
+        windows.append((date[start:min(start + window_length, len(date))], window))
+    if verbose: print(f"Dispatch of {len(date)} hours in {len(windows)} windows of {window_length}+{look_ahead} hours")
+
+    n_workers = min(len(windows), get_max_parallel_workers(1, memory_per_window_GB))
+    if max_workers is not None:
+        n_workers = min(n_workers, max_workers)
+    if n_workers <= 1:
+        solutions = [solve_dispatch_window(**window) for _, window in windows]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(solve_dispatch_window, **window) for _, window in windows]
+            solutions = [future.result() for future in futures]
+
+    # stitching : hourly variables on the first window_length hours of each window, planning variables are the same in all windows
+    dispatch = dict()
+    for name in solutions[0].data_vars:
+        if "date" in solutions[0][name].dims:
+            dispatch[name] = xr.concat([solution[name].sel(date=window_date)
+                                        for (window_date, _), solution in zip(windows, solutions)], dim="date")
+        else:
+            dispatch[name] = solutions[0][name]
+
+    # yearly operation variables recomputed from the hourly dispatch (as in Ctr_Op_conso_yearly_1 and Ctr_Op_operation_costs)
+    energy_vector_in = parameters["operation_energy_unit_cost"]["energy_vector_in"]
+    is_imported = ~energy_vector_in.isin(parameters.get_index("energy_vector_out"))
+    conversion_mean_energy_vector_in = xr.where(parameters["energy_vector_in"] == parameters["energy_vector_in_value"],
+                                                1 / parameters["operation_conversion_efficiency"], 0).where(is_imported, 0)
+    importation = (conversion_mean_energy_vector_in * parameters["time_stamp_length"] * dispatch["operation_conversion_power"].fillna(0)).\
+        sum(["date", "energy_vector_out", "conversion_technology"])
+    dispatch["operation_yearly_importation"] = importation.where(is_imported, sum(solution["operation_yearly_importation"] for solution in solutions)).\
+        transpose(*solutions[0]["operation_yearly_importation"].dims)
+    dispatch["operation_energy_cost"] = (parameters["operation_energy_unit_cost"] * dispatch["operation_yearly_importation"]).\
+        transpose(*solutions[0]["operation_energy_cost"].dims)
+    return xr.Dataset(dispatch)
+
+
+def solve_dispatch_window (parameters, capacities, storage_level=None, solver_name="highs", solver_options=None):
+    """
+    Solves the dispatch of one window of solve_rolling_horizon_dispatch
+    :param parameters: parameters of the dates of the window
+    :param capacities: dataset with the fixed planning variables
+    :param storage_level: storage levels at the first and last dates of the window
+    :return: solution dataset of the window
+    """
+    model = build_single_horizon_multi_energy_LEAP_model(parameters)
+    for name in capacities.data_vars:
+        if name in model.variables:
+            model.add_constraints(model.variables[name] == capacities[name].fillna(0), name=f"Ctr_fixed_{name}",
+                                  mask=capacities[name].notnull())
+    if storage_level is not None:
+        model.remove_constraints("Ctr_Op_storage_initial_level")
+        model.add_constraints(model.variables["operation_storage_internal_energy_level"].sel(date=storage_level["date"]) == storage_level,
+                              name="Ctr_Op_storage_window_boundary_level")
+    model.solve(solver_name=solver_name, **(solver_options or dict()))
+    return model.solution
+
+
+#### unit cost parameter of the planning variables with a cost in the objective
+planning_unit_cost = {"planning_conversion_power_capacity": "planning_conversion_unit_cost",
+                      "planning_storage_energy_capacity": "planning_storage_energy_unit_cost",
+                      "planning_flexible_demand_max_power_increase": "flexible_demand_planning_unit_cost"}
+#### planning variables with capacity limits (see get_single_horizon_variable_bounds)
+bounded_planning_variables = ["planning_conversion_power_capacity", "planning_storage_energy_capacity"]
+
+
+def solve_benders (
+        parameters,
+        weights = None,
+        tolerance: float = 1e-4,
+        max_iterations: int = 100,
+        solver_name: str = "highs",
+        solver_options: dict = None,
+        max_workers: int = None,
+        threads_per_subproblem: int = 1,
+        memory_per_subproblem_GB: float = 2.,
+        stabilisation: float = 0.5,
+        verbose: bool = False
+    ):
+    """
+    Solves build_single_horizon_multi_energy_LEAP_model with a Benders decomposition between planning and operation.
+    The master problem chooses the capacities with a planning cost (see planning_unit_cost) with their costs and
+    bounds, and a lower bound of the operation cost of each subproblem. The operation subproblems (e.g. one per weather
+    year) are built once with zero planning costs and these capacities fixed to the master ones, and solved at the same
+    time in a pool of threads at each iteration. The duals of the fixed capacities give the optimality cuts added to the
+    master. The capacities without planning cost (e.g. demand_not_served) are operation choices left to each
+    subproblem : they make the subproblems feasible for any capacities of the master, so that no feasibility cut is
+    needed. Parameters without such a technology can give infeasible subproblems, a ValueError is then raised.
+    The cuts are stabilised (in-out) : from the second iteration, the subproblems are solved for capacities between the
+    master ones and the ones of the best upper bound (see stabilisation), which avoids the oscillations of the master
+    capacities between iterations.
+    The iterations stop when (upper bound - lower bound) / upper bound <= tolerance.
+    Subproblems have to be independent operation problems : with one subproblem per period of a year, each period has
+    its own cyclic storage and flexible demand constraints.
+    Parameters with weather years (see f_weather_year_tools.add_weather_years) are split into one subproblem per
+    weather year weighted by its probability.
+    Usage :
+        solutions, report = solve_benders(parameters, verbose=True)
+        extractCosts_l(solutions[0])
+
+    :param parameters: xarray dataset, or list of xarray datasets (one per subproblem) with the same planning parameters
+    :param weights: weight of the operation cost of each subproblem in the objective (e.g. probability of each weather
+    year), default to 1 for all, or to weather_year_weight for parameters with weather years
+    :param tolerance: relative gap between upper and lower bounds at convergence
+    :param max_iterations: maximum number of iterations
+    :param solver_name: name of the solver, it has to give the duals
+    :param solver_options: other arguments of model.solve
+    :param max_workers: maximum number of subproblems solved at the same time, default to the number allowed by cores
+    and memory
+    :param threads_per_subproblem: number of cores used by the solver of one subproblem (set the matching solver option,
+    e.g. threads for highs)
+    :param memory_per_subproblem_GB: memory needed by the solve of one subproblem
+    :param stabilisation: weight of the capacities of the best upper bound in the capacities of the subproblems, between
+    0 (master capacities, classical Benders iterations) and 1 excluded
+    :param verbose: default to False. If True print the bounds at each iteration.
+    :return: list of solution datasets (one per subproblem, with the capacities of the best upper bound, the largest ones
+    of the subproblems for the capacities without planning cost), usable in extractCosts_l, extractEnergyCapacity_l and
+    EnergyAndExchange2Prod, and pandas table with the bounds and times of each iteration.
+    For parameters with weather years, the solutions are gathered in one dataset with a weather_year dimension (see
+    f_weather_year_tools.concat_weather_year_solutions), as the solution of the model built on these parameters.
+    """
+    is_weather_year = not isinstance(parameters, list) and "weather_year_weight" in parameters
+    if is_weather_year:
+        weather_year = parameters.get_index("weather_year")
+        parameters, weather_year_weights = split_weather_years(parameters)
+        weights = weather_year_weights if weights is None else weights
+    parameters_list = parameters if isinstance(parameters, list) else [parameters]
+    weights = np.ones(len(parameters_list)) if weights is None else np.asarray(weights, dtype=float)
+    solver_options = solver_options or dict()
+
+    start_time = time.perf_counter()
+    subproblems = [_build_benders_subproblem(subproblem_parameters) for subproblem_parameters in parameters_list]
+    master = _build_benders_master(parameters_list[0], subproblems[0], weights)
+    build_time = time.perf_counter() - start_time
+    if verbose: print(f"Benders master and {len(subproblems)} subproblems built in {build_time:.1f} s")
+
+    report = list()
+    upper_bound, best_solutions, best_capacities = np.inf, None, None
+    n_workers = min(len(subproblems), get_max_parallel_workers(threads_per_subproblem, memory_per_subproblem_GB))
+    if max_workers is not None:
+        n_workers = min(n_workers, max_workers)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for iteration in range(max_iterations):
+            start_time = time.perf_counter()
+            master.solve(solver_name=solver_name, **solver_options)
+            if master.status != "ok":
+                raise ValueError(f"Benders master not solved : {master.termination_condition}")
+            master_time = time.perf_counter() - start_time
+            capacities = master.solution[[name for name in planning_unit_cost if name in master.variables]]
+            lower_bound = master.objective.value
+            if best_capacities is not None:
+                # in-out stabilisation : subproblems solved between the master capacities and the best ones
+                capacities = stabilisation * best_capacities + (1 - stabilisation) * capacities
+            planning_cost = sum(float((parameters_list[0][planning_unit_cost[name]] * capacities[name]).sum()) for name in capacities.data_vars)
+
+            start_time = time.perf_counter()
+            subproblem_times = list(executor.map(lambda subproblem: _solve_benders_subproblem(subproblem, capacities, solver_name, solver_options), subproblems))
+            subproblems_time = time.perf_counter() - start_time
+
+            operation_costs = np.array([subproblem.objective.value for subproblem in subproblems])
+            if planning_cost + (weights * operation_costs).sum() < upper_bound:
+                upper_bound = planning_cost + (weights * operation_costs).sum()
+                best_capacities, best_solutions = capacities, _benders_solutions(subproblems, capacities, parameters_list[0])
+            gap = (upper_bound - lower_bound) / abs(upper_bound) if upper_bound != 0 else 0.
+            report.append(dict(iteration=iteration, lower_bound=lower_bound, upper_bound=upper_bound, gap=gap,
+                               master_time_s=master_time, subproblems_time_s=subproblems_time,
+                               max_subproblem_time_s=max(subproblem_times)))
+            if verbose: print(f"Iteration {iteration} : lower bound {lower_bound:.6g}, upper bound {upper_bound:.6g}, gap {gap:.2e}")
+            if gap <= tolerance:
+                break
+            for k, subproblem in enumerate(subproblems):
+                _add_benders_cut(master, k, subproblem, capacities, operation_costs[k], name=f"Ctr_Benders_cut_{iteration}_{k}")
+
+    report = pd.DataFrame(report)
+    report.attrs["build_time_s"] = build_time
+    if verbose and report["gap"].iloc[-1] > tolerance: print(f"Benders not converged after {max_iterations} iterations")
+    if is_weather_year:
+        return concat_weather_year_solutions(best_solutions, weather_year), report
+    return best_solutions, report
+
+
+def _build_benders_subproblem (parameters):
+    # operation problem : zero planning costs, capacities of the master fixed by equality constraints (rhs set at each iteration)
+    zero_cost_parameters = parameters.copy()
+    for name in planning_unit_cost.values():
+        if name in zero_cost_parameters:
+            zero_cost_parameters[name] = zero_cost_parameters[name] * 0
+    model = build_single_horizon_multi_energy_LEAP_model(zero_cost_parameters)
+    for name in planning_unit_cost:
+        if name in model.variables:
+            variable = model.variables[name]
+            model.add_constraints(variable == 0, name=f"Ctr_Benders_capacity_{name}", mask=_is_master_capacity(parameters, variable, name))
+    return model
+
+
+def _build_benders_master (parameters, subproblem, weights):
+    # capacities with a planning cost, with their costs and bounds, and operation cost of each subproblem
+    m = linopy.Model()
+    capacities = dict()
+    for name in planning_unit_cost:
+        if name in subproblem.variables:
+            variable = subproblem.variables[name]
+            lower, upper = get_single_horizon_variable_bounds(parameters, name) if name in bounded_planning_variables else (0, np.inf)
+            capacities[name] = m.add_variables(name=name, lower=np.maximum(lower, 0), upper=upper, coords=variable.labels.coords,
+                                               mask=_is_master_capacity(parameters, variable, name))
+    operation_cost = m.add_variables(name="benders_operation_cost", lower=0, coords=[pd.Index(range(len(weights)), name="subproblem")])
+    m.add_objective(sum((parameters[planning_unit_cost[name]] * capacities[name]).sum() for name in capacities)
+                    + (xr.DataArray(weights, coords=operation_cost.labels.coords) * operation_cost).sum())
+    return m
+
+
+def _is_master_capacity (parameters, variable, name):
+    # capacities chosen by the master : the ones with a planning cost, the other ones are left to the subproblems
+    return ((variable.labels != -1) & (parameters[planning_unit_cost[name]].fillna(0) != 0)).transpose(*variable.labels.dims)
+
+
+def _solve_benders_subproblem (subproblem, capacities, solver_name, solver_options):
+    # solves the subproblem for the capacities of the master, returns the solve time
+    start_time = time.perf_counter()
+    for name in capacities.data_vars:
+        subproblem.constraints[f"Ctr_Benders_capacity_{name}"].rhs = capacities[name].fillna(0)
+    subproblem.solve(solver_name=solver_name, **solver_options)
+    if subproblem.status != "ok":
+        raise ValueError(f"Benders subproblem not solved : {subproblem.termination_condition}. The subproblems need a "
+                         f"technology without planning cost (e.g. demand_not_served) to be feasible for any capacities")
+    return time.perf_counter() - start_time
+
+
+def _add_benders_cut (master, k, subproblem, capacities, operation_cost, name):
+    # operation cost of subproblem k >= its value at the master capacities + duals of the fixed capacities * capacity changes
+    cut, constant = 0, operation_cost
+    for variable_name in capacities.data_vars:
+        dual = subproblem.constraints[f"Ctr_Benders_capacity_{variable_name}"].dual.fillna(0)
+        cut = cut + (dual * master.variables[variable_name]).sum()
+        constant = constant - float((dual * capacities[variable_name].fillna(0)).sum())
+    master.add_constraints(master.variables["benders_operation_cost"].sel(subproblem=k) - cut >= constant, name=name)
+
+
+def _benders_solutions (subproblems, capacities, parameters):
+    # solutions of the subproblems with the same capacities : the ones of the master, or the largest ones of the
+    # subproblems for the capacities without planning cost, and the planning costs of these capacities
+    solutions = [subproblem.solution.copy() for subproblem in subproblems]
+    for name in fixed_planning_variables:
+        if name in solutions[0]:
+            capacity = xr.concat([solution[name] for solution in solutions], dim="subproblem").max("subproblem")
+            if name in capacities:
+                capacity = capacities[name].fillna(capacity)
+            for solution in solutions:
+                solution[name] = capacity
+    for solution in solutions:
+        solution["planning_conversion_cost"] = parameters["planning_conversion_unit_cost"] * solution["planning_conversion_power_capacity"]
+        if "planning_storage_energy_cost" in solution:
+            solution["planning_storage_energy_cost"] = parameters["planning_storage_energy_unit_cost"] * solution["planning_storage_energy_capacity"]
+        if "planning_flexible_demand_cost" in solution:
+            solution["planning_flexible_demand_cost"] = parameters["flexible_demand_planning_unit_cost"] * solution["planning_flexible_demand_max_power_increase"]
+    return solutions
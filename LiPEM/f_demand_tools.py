@@ -22,44 +22,33 @@ from datetime import timedelta
 
 # data_df = areaConsumption.join(ConsoTempe_df)[['areaConsumption','Temperature']]
 def decompose_demand (temperature, exogenous_energy_demand, temperature_threshold = 15):
-
-    def compute_thermosens(x):
-        return xr.cov(x.temperature, x.exogenous_energy_demand) / x.temperature.var()
-    
-    demand_name = list(exogenous_energy_demand.keys())[0]  # TODO: unused variable
-
-    # Merge temperature and demand
-    hours = exogenous_energy_demand.date.dt.hour  # TODO: this produces a warning
-    temperature_and_demand = xr.merge([exogenous_energy_demand, hours, temperature])
-
-    # Build thermal sensitivity estimate array
-    thermal_sensitivity_estimate = xr.DataArray(
-        data = 0,
-        dims = ["energy_vector_out", "area_to", "hour"],
-        coords = dict(
-            hour = list(set(temperature_and_demand.hour.to_numpy())),
-            area_to = temperature_and_demand.get_index("area_to"),
-            energy_vector_out = temperature_and_demand.get_index("energy_vector_out")
-        )
-    )
-
-    cold_dates = temperature_and_demand.temperature <= temperature_threshold
-    # TODO: multi-dim groupby not implemented in xarray!!!
-    for area in temperature_and_demand.get_index("area_to"):
-        for energy_vector in temperature_and_demand.get_index("energy_vector_out"):
-            thermal_sensitivity_estimate.loc[energy_vector, area, :] = temperature_and_demand.where(cold_dates). \
-                sel({"energy_vector_out": energy_vector, "area_to": area}).groupby("hour").map(compute_thermosens)
-
-    thermal_sensitive_demand = temperature_and_demand.exogenous_energy_demand.copy()
-
-    for hour in list(set(temperature_and_demand.hour.to_numpy())):
-        hour_date = temperature_and_demand.get_index("date")[temperature_and_demand.hour == hour]
-        tmp_consumption = cold_dates.sel(date=hour_date) * thermal_sensitivity_estimate[:, :, hour] * (
-                    temperature_and_demand.temperature.sel(date=hour_date) - temperature_threshold)
-        thermal_sensitive_demand.loc[:, :, hour_date] = tmp_consumption.transpose("energy_vector_out", "area_to",
-                                                                                     "date")
-
-    not_thermal_sensitive_demand = temperature_and_demand.exogenous_energy_demand.copy() - thermal_sensitive_demand
+    """
+    splits the demand into a thermal sensitive part and a non thermal sensitive part. The thermal sensitivity of each
+    energy vector, area and hour of the day is estimated on the cold dates (temperature <= temperature_threshold) as
+    cov(temperature, demand) / var(temperature), all of them at once on the whole arrays.
+    :param temperature: xarray dataset with temperature [energy_vector_out x area_to x date] (any order)
+    :param exogenous_energy_demand: xarray dataset with exogenous_energy_demand [energy_vector_out x area_to x date]
+    :param temperature_threshold: temperature below which the demand is thermal sensitive
+    :return: xarray dataset with thermal_sensitive, non_thermal_sensitive [energy_vector_out x area_to x date] and
+    thermal_sensitivity_estimate [energy_vector_out x area_to x hour]
+    """
+    demand = exogenous_energy_demand.exogenous_energy_demand
+    temperature = temperature.temperature
+    hour = demand.date.dt.hour.rename("hour")
+    cold_dates = temperature <= temperature_threshold
+
+    # covariance (ddof=1) on the cold dates where both are known, over the variance of the cold temperatures (ddof=0)
+    is_valid = cold_dates & temperature.notnull() & demand.notnull()
+    valid_temperature, valid_demand = temperature.where(is_valid), demand.where(is_valid)
+    deviation_product = (valid_temperature.groupby(hour) - valid_temperature.groupby(hour).mean()) * \
+                        (valid_demand.groupby(hour) - valid_demand.groupby(hour).mean())
+    covariance = deviation_product.groupby(hour).sum() / (is_valid.groupby(hour).sum() - 1)
+    thermal_sensitivity_estimate = (covariance / temperature.where(cold_dates).groupby(hour).var()). \
+        fillna(0).transpose("energy_vector_out", "area_to", "hour")
+
+    thermal_sensitive_demand = (cold_dates * thermal_sensitivity_estimate.sel(hour=hour) * (temperature - temperature_threshold)). \
+        drop_vars("hour").transpose("energy_vector_out", "area_to", "date")
+    not_thermal_sensitive_demand = demand - thermal_sensitive_demand
     thermal_sensitive_demand = thermal_sensitive_demand.rename(new_name_or_name_dict="thermal_sensitive")
     not_thermal_sensitive_demand = not_thermal_sensitive_demand.rename(new_name_or_name_dict="non_thermal_sensitive")
     thermal_sensitivity_estimate=thermal_sensitivity_estimate.rename(new_name_or_name_dict="thermal_sensitivity_estimate")
@@ -68,26 +57,112 @@ def decompose_demand (temperature, exogenous_energy_demand, temperature_threshol
 
 
 def recompose_demand (decomposed_demand, temperature, thermal_sensitivity, temperature_threshold = 15):
-    # TODO: try to avoid using transpose below
+    """
+    returns the demand with the thermal sensitive part of decompose_demand rescaled to the target thermal sensitivity.
+    The hours without estimated thermal sensitivity (no cold date, e.g. a summer window of dates) keep their demand.
+    :param decomposed_demand: xarray dataset returned by decompose_demand
+    :param temperature: xarray dataset with temperature [energy_vector_out x area_to x date] (any order)
+    :param thermal_sensitivity: xarray dataset with the target thermal_sensitivity [energy_vector_out x area_to]
+    :param temperature_threshold: temperature below which the demand is thermal sensitive
+    :return: xarray dataset with exogenous_energy_demand [energy_vector_out x area_to x date]
+    """
     demand_thermal_sensitive_factor = \
-        - (thermal_sensitivity.expand_dims(dim={"hour": range(24)}, axis=1).\
-        transpose("energy_vector_out", "area_to","hour")/ \
-        decomposed_demand.thermal_sensitivity_estimate).thermal_sensitivity
-    cold_dates = (temperature.temperature <= temperature_threshold).transpose("energy_vector_out", "area_to","date")
-    res = decomposed_demand.non_thermal_sensitive*0
-    dates = decomposed_demand.get_index("date")
-
-    for hour in list(set(decomposed_demand.hour.to_numpy())):
-        #TODO understand how to remove the generated warning here
-        hour_date = dates[decomposed_demand.date.dt.hour == hour]
-        tmp_consumption = cold_dates.sel(date=hour_date) * demand_thermal_sensitive_factor[:, :, hour] * decomposed_demand.thermal_sensitive.sel(date=hour_date)
-        res.loc[:, :, hour_date] =  tmp_consumption.transpose("energy_vector_out", "area_to", "date")
-    
+        - (thermal_sensitivity.thermal_sensitivity / decomposed_demand.thermal_sensitivity_estimate). \
+        where(decomposed_demand.thermal_sensitivity_estimate != 0, 0)
+    cold_dates = temperature.temperature <= temperature_threshold
+    # factor of the hour of each date (hours as positions, as in decompose_demand)
+    hour_factor = demand_thermal_sensitive_factor.isel(hour=decomposed_demand.date.dt.hour).drop_vars("hour")
+
+    res = (cold_dates * hour_factor * decomposed_demand.thermal_sensitive).transpose("energy_vector_out", "area_to", "date")
     res = res + decomposed_demand.non_thermal_sensitive
     res = res.rename(new_name_or_name_dict="exogenous_energy_demand")  # TODO: there is certainly a better practice than having to rename things like this with datasets/dataarray
     return res.to_dataset()
 
 
+def fit_thermal_sensitivity (temperature, exogenous_energy_demand, thermal_sensitivity=None, temperature_threshold = 15):
+    """
+    fits the decomposition of the demand of a reference year (see decompose_demand) once, so that the demand of other
+    weather years is generated by apply_thermal_sensitivity without re-estimating it or re-reading the demand.
+    Usage :
+        fitted = fit_thermal_sensitivity(temperature, exogenous_energy_demand, thermal_sensitivity)
+        save_thermal_sensitivity(fitted, "case_studies/eu_7_nodes/data/thermal_sensitivity.nc")
+        ...
+        fitted = load_thermal_sensitivity("case_studies/eu_7_nodes/data/thermal_sensitivity.nc")
+        weather_year_temperature = get_weather_year_temperature(temperature_1980_2020, fitted.get_index("date"))
+        exogenous_energy_demand = apply_thermal_sensitivity(fitted, weather_year_temperature)
+    :param temperature: xarray dataset with temperature [energy_vector_out x area_to x date] of the reference year
+    :param exogenous_energy_demand: xarray dataset with exogenous_energy_demand [energy_vector_out x area_to x date]
+    :param thermal_sensitivity: xarray dataset with the target thermal_sensitivity [energy_vector_out x area_to], as in
+    recompose_demand. If None (default) the estimated thermal sensitivity is kept.
+    :param temperature_threshold: temperature below which the demand is thermal sensitive
+    :return: xarray dataset with thermal_sensitivity_estimate [energy_vector_out x area_to x hour], non_thermal_sensitive
+    [energy_vector_out x area_to x date], thermal_sensitivity [energy_vector_out x area_to] (if given) and the
+    temperature_threshold attribute
+    """
+    fitted = decompose_demand(temperature, exogenous_energy_demand, temperature_threshold)[["thermal_sensitivity_estimate", "non_thermal_sensitive"]]
+    if thermal_sensitivity is not None:
+        fitted["thermal_sensitivity"] = thermal_sensitivity.thermal_sensitivity
+    fitted.attrs["temperature_threshold"] = temperature_threshold
+    return fitted
+
+
+def save_thermal_sensitivity (fitted, file):
+    """
+    saves a thermal sensitivity fitted by fit_thermal_sensitivity in a netcdf file
+    """
+    fitted.to_netcdf(file)
+
+
+def load_thermal_sensitivity (file):
+    """
+    loads a thermal sensitivity saved by save_thermal_sensitivity
+    """
+    return xr.load_dataset(file)
+
+
+def apply_thermal_sensitivity (fitted, temperature):
+    """
+    returns the demand of the reference year of fit_thermal_sensitivity for other temperatures, e.g. several weather
+    years : non thermal sensitive demand of the reference year plus the thermal sensitive demand of the temperatures,
+    rescaled to the target thermal sensitivity as in recompose_demand. With the temperatures of the reference year it
+    gives the demand of recompose_demand(decompose_demand(...)).
+    :param fitted: xarray dataset returned by fit_thermal_sensitivity
+    :param temperature: xarray dataset with temperature [energy_vector_out x area_to x date] on the dates of the
+    reference year, with any other dimension (e.g. weather_year, see get_weather_year_temperature)
+    :return: xarray dataset with exogenous_energy_demand [... x energy_vector_out x area_to x date]
+    """
+    temperature_threshold = fitted.attrs["temperature_threshold"]
+    hours = fitted.date.dt.hour
+    cold_dates = temperature.temperature <= temperature_threshold
+    thermal_sensitive = cold_dates * fitted.thermal_sensitivity_estimate.isel(hour=hours).drop_vars("hour") * \
+                        (temperature.temperature - temperature_threshold)
+    if "thermal_sensitivity" in fitted:
+        demand_thermal_sensitive_factor = - (fitted.thermal_sensitivity / fitted.thermal_sensitivity_estimate)
+        thermal_sensitive = cold_dates * demand_thermal_sensitive_factor.isel(hour=hours).drop_vars("hour") * thermal_sensitive
+    res = (thermal_sensitive + fitted.non_thermal_sensitive).transpose(..., "energy_vector_out", "area_to", "date")
+    return res.rename(new_name_or_name_dict="exogenous_energy_demand").to_dataset()
+
+
+def get_weather_year_temperature (temperature, date):
+    """
+    returns the temperatures of a series of several years on the dates of a reference year, with a weather_year
+    dimension : each date takes the temperature of the same hour of the year of each weather year. The last day of a
+    leap reference year takes the temperature of the previous day for the other years, the dates of the years not fully
+    covered by the series are NaN.
+    :param temperature: xarray dataset with temperature [... x date] over several years
+    :param date: dates of the reference year
+    :return: xarray dataset with temperature [... x weather_year x date]
+    """
+    hour_of_year = lambda dates: np.asarray((dates - dates.to_period("Y").start_time) // pd.Timedelta(hours=1))
+    series_date = temperature.get_index("date")
+    by_year = temperature.temperature.assign_coords(weather_year=("date", np.asarray(series_date.year)),
+                                                    hour_of_year=("date", hour_of_year(series_date))). \
+        set_index(date=["weather_year", "hour_of_year"]).unstack("date")
+    by_year = by_year.reindex(hour_of_year=hour_of_year(date))
+    by_year = by_year.fillna(by_year.shift(hour_of_year=24))
+    return by_year.assign_coords(hour_of_year=np.asarray(date)).rename(hour_of_year="date").to_dataset()
+
+
 def compute_flexible_demand_to_optimise (flexible_demand_table, demand_profile, exogenous_energy_demand, temperature):
     flexible_demand = list(flexible_demand_table.get_index("flexible_demand").unique())
 
@@ -133,53 +208,42 @@ def normalize (demand):
 
 
 def generate_demand_from_profile (profile, temperature, exogenous_energy_demand, temperature_threshold = 15, minimum_temperature = 0):
-    hours = exogenous_energy_demand.date.dt.hour
-    days_of_week = exogenous_energy_demand.date.dt.weekday
-    # .drop_duplicates( ###  hours, daysofweek,  # TODO: useless line
-    temperature_and_demand = xr.merge([exogenous_energy_demand, temperature])
+    """
+    returns a demand following a weekly profile, decomposed as in decompose_demand : the non thermal sensitive part is
+    the summer profile of the hour and weekday of each date, the thermal sensitive part uses a thermal sensitivity per
+    hour estimated as the difference between the summer and winter profiles over (temperature_threshold -
+    minimum_temperature).
+    :param profile: xarray dataset with summer and winter [hour x day_of_week], hours and weekdays as positions
+    :param temperature: xarray dataset with temperature [energy_vector_out x area_to x date] (any order)
+    :param exogenous_energy_demand: xarray dataset with exogenous_energy_demand [energy_vector_out x area_to x date],
+    giving the dates, areas and energy vectors of the demand
+    :return: xarray dataset with non_thermal_sensitive, thermal_sensitive [energy_vector_out x area_to x date] and
+    thermal_sensitivity [energy_vector_out x area_to x hour]
+    """
+    demand = exogenous_energy_demand.exogenous_energy_demand
+    hours = demand.date.dt.hour
+    days_of_week = demand.date.dt.weekday
+    temperature = temperature.temperature
 
-    # Initialization
-    demand_thermal_sensitive = exogenous_energy_demand.exogenous_energy_demand.copy()*0
+    # Estimation of thermal sensitivity as the difference between summer and winter, normalized
+    thermal_sensitivity_estimate = ((profile.summer.mean("day_of_week") - profile.winter.mean("day_of_week")) /
+                                    (temperature_threshold - minimum_temperature))
+    thermal_sensitivity_estimate = thermal_sensitivity_estimate.drop_vars("hour").assign_coords(hour=np.unique(hours)). \
+        broadcast_like(demand.isel(date=0, drop=True)).transpose("energy_vector_out", "area_to", "hour"). \
+        rename(new_name_or_name_dict="thermal_sensitivity")
+
+    # thermal sensitive part on the cold dates, with the thermal sensitivity of the hour of each date
+    cold_dates = temperature <= temperature_threshold
+    demand_thermal_sensitive = (cold_dates * thermal_sensitivity_estimate.isel(hour=hours).drop_vars("hour") *
+                                (temperature - temperature_threshold)).transpose("energy_vector_out", "area_to", "date")
     demand_thermal_sensitive = demand_thermal_sensitive.rename(new_name_or_name_dict="thermal_sensitive")
-    demand_non_thermal_sensitive = exogenous_energy_demand.exogenous_energy_demand.copy()*0
+
+    # non thermal sensitive part : summer profile of the hour and weekday of each date
+    demand_non_thermal_sensitive = (xr.zeros_like(demand) + profile.summer.isel(hour=hours, day_of_week=days_of_week).drop_vars(["hour", "day_of_week"])). \
+        transpose("energy_vector_out", "area_to", "date")
     demand_non_thermal_sensitive = demand_non_thermal_sensitive.rename(new_name_or_name_dict="non_thermal_sensitive")
-    decomposed_demand = xr.merge([demand_non_thermal_sensitive,demand_thermal_sensitive])
 
-    # Estimation of thermal sensitivity as the difference between summer and winter, normalized
-    thermal_sensitivity_estimate = xr.DataArray(
-        data = 0,
-        dims = ["energy_vector_out", "area_to", "hour"],
-        coords = dict(
-            hour = list(set(hours.to_numpy())),
-            area_to = exogenous_energy_demand.get_index("area_to"),
-            energy_vector_out = exogenous_energy_demand.get_index("energy_vector_out")
-        )
-    )
-    thermal_sensitivity_estimate = thermal_sensitivity_estimate.rename(new_name_or_name_dict="thermal_sensitivity")
-    profile_df = profile.to_dataframe()
-    for area in temperature_and_demand.get_index("area_to"):
-        for energy_vector in temperature_and_demand.get_index("energy_vector_out"):
-            thermal_sensitivity_estimate.loc[energy_vector, area, :] = \
-                ((profile_df.summer.groupby("hour").mean() - profile_df.winter.groupby("hour").mean()) / (
-                        temperature_threshold - minimum_temperature)).tolist()
-
-    # Generate cold dates mask (?)
-    cold_dates = (temperature_and_demand.temperature <= temperature_threshold)
-
-    consumption_thermal_sensitive = temperature_and_demand.exogenous_energy_demand.copy()  # TODO: unused variable
-    # Fill the thermal sensitive part
-    for hour in list(set(hours.to_numpy())):
-        hour_date = temperature_and_demand.get_index("date")[hours == hour]
-        tmp_consumption = cold_dates.sel(date=hour_date) * thermal_sensitivity_estimate[:, :, hour] * (temperature_and_demand.temperature.sel(date=hour_date) - temperature_threshold)
-        decomposed_demand.thermal_sensitive.loc[:, :, hour_date] = tmp_consumption.transpose("energy_vector_out", "area_to", "date")
-    
-    # Fill the non thermal sensitive part
-    for hour in list(set(hours.to_numpy())):
-        for day in list(set(days_of_week.to_numpy())):
-            hour_day_date = temperature_and_demand.get_index("date")[(hours == hour)  & (days_of_week == day)]
-            decomposed_demand.non_thermal_sensitive.loc[:, :, hour_day_date] = profile.summer[hour,day]
-
-    return xr.merge([decomposed_demand,thermal_sensitivity_estimate])
+    return xr.merge([demand_non_thermal_sensitive, demand_thermal_sensitive, thermal_sensitivity_estimate])
 
 
 def Flexibility_data_processing (areaConsumption, year, xls_file):
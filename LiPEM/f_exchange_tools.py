@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from LiPEM.f_tools import get_solution
+
+
+def add_exchange_links (parameters, signed: bool = True):
+    """
+    Returns the parameters with an explicit list of interconnectors (exchange_link dimension) built from the non zero
+    operation_exchange_max_capacity. With these parameters build_single_horizon_multi_energy_LEAP_model creates one
+    exchange variable per link and date (exchange_link_power) instead of one per pair of areas (exchange_op_power),
+    the number of variables then scales with the number of lines instead of the square of the number of areas.
+    Added parameters :
+        - exchange_link_area_from, exchange_link_area_to : areas at the ends of each link, the power of the link is
+        positive from exchange_link_area_from to exchange_link_area_to
+        - operation_exchange_link_max_capacity : [exchange_link x energy_vector_out] max power from area_from to area_to
+        - operation_exchange_link_reverse_max_capacity : [exchange_link x energy_vector_out] max power from area_to to
+        area_from (0 for one way links)
+    Usage :
+        parameters = add_exchange_links(parameters)
+        model = build_single_horizon_multi_energy_LEAP_model(parameters)
+        model.solve(solver_name='highs')
+        EnergyAndExchange2Prod(expand_exchange_link_solution(model, parameters))
+    :param parameters: xarray dataset with operation_exchange_max_capacity [area_to x energy_vector_out x area_from],
+    max power from area_from to area_to
+    :param signed: default to True, one link per pair of connected areas with a signed power bounded by the capacities
+    of both directions (exchanges are then not penalised in the objective). If False one link per direction with a non
+    negative power, same model as exchange_op_power without the pairs of areas that are not connected.
+    :return: xarray dataset
+    """
+    areas = parameters.get_index("area_to")
+    capacity = parameters["operation_exchange_max_capacity"].reindex(area_from=areas.rename("area_from")).fillna(0). \
+        transpose("area_from", "area_to", "energy_vector_out")
+    is_connected = (capacity > 0).any("energy_vector_out").values
+    if signed:
+        is_connected = np.triu(is_connected | is_connected.T, k=1)
+    from_index, to_index = np.nonzero(is_connected)
+    exchange_link = pd.Index([f"{areas[i]}-{areas[j]}" for i, j in zip(from_index, to_index)], name="exchange_link")
+
+    as_link = lambda index: xr.DataArray(index, coords=[exchange_link])
+    max_capacity = capacity.isel(area_from=as_link(from_index), area_to=as_link(to_index)).drop_vars(["area_from", "area_to"])
+    if signed:
+        reverse_max_capacity = capacity.isel(area_from=as_link(to_index), area_to=as_link(from_index)).drop_vars(["area_from", "area_to"])
+    else:
+        reverse_max_capacity = xr.zeros_like(max_capacity)
+    return parameters.assign(
+        exchange_link_area_from=as_link(areas[from_index]),
+        exchange_link_area_to=as_link(areas[to_index]),
+        operation_exchange_link_max_capacity=max_capacity,
+        operation_exchange_link_reverse_max_capacity=reverse_max_capacity)
+
+
+def expand_exchange_link_solution (model, parameters):
+    """
+    returns the solution of a model built with exchange links (see add_exchange_links) with the power of the links
+    converted to exchange_op_power [date x area_to x area_from x energy_vector_out] (non negative power from area_from
+    to area_to), so that the results can be used as the ones of the model without links in EnergyAndExchange2Prod and
+    the graphical tools.
+    :param model: solved linopy model or its solution dataset
+    :param parameters: parameters used to build the model
+    :return: xarray dataset
+    """
+    solution = get_solution(model)
+    areas = parameters.get_index("area_to")
+    from_index = areas.get_indexer(parameters["exchange_link_area_from"].values)
+    to_index = areas.get_indexer(parameters["exchange_link_area_to"].values)
+    power = solution["exchange_link_power"].transpose("exchange_link", "date", "energy_vector_out")
+
+    # [area_to x area_from x date x energy_vector_out], positive part of the power from area_from to area_to, negative part the other way
+    exchange = np.zeros((len(areas), len(areas)) + power.shape[1:])
+    np.add.at(exchange, (to_index, from_index), np.clip(power.values, 0, None))
+    np.add.at(exchange, (from_index, to_index), np.clip(-power.values, 0, None))
+    exchange_op_power = xr.DataArray(exchange, coords=[areas, areas.rename("area_from"), power.get_index("date"), power.get_index("energy_vector_out")])
+    return solution.drop_dims("exchange_link").assign(
+        exchange_op_power=exchange_op_power.transpose("date", "area_to", "area_from", "energy_vector_out"))
@@ -0,0 +1,140 @@
+import time
+import tracemalloc
+
+import linopy
+import pandas as pd
+
+
+class BuildProfiler:
+    """
+    Opt-in instrumentation of a linopy model build. Each recorded step covers the code executed since the previous
+    step, so that the time spent building the expressions of a constraint is attributed to its add_constraints call.
+    For each step the profiler records the wall time, the peak memory increase (traced with tracemalloc), and the
+    number of variables, constraints and non-zeros added to the model.
+    Memory tracing slows down the build noticeably, use trace_memory=False to only measure times and sizes. Tracing
+    started by the profiler is stopped at the end of the build (see end_build), so that the solve is not slowed down.
+
+    Usage :
+        profiler = BuildProfiler()
+        model = build_single_horizon_multi_energy_LEAP_model(parameters, profiler=profiler)
+        profiler.to_dataframe().to_csv("build_profile.csv")
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.block = None
+        self.records = list()
+        self._constraint_nonzeros = dict()
+        self._objective_nonzeros = 0
+        self._started_tracing = False
+
+    def model(self, **kwargs):
+        """
+        returns an empty linopy model whose add_variables and add_constraints calls are recorded
+        :param kwargs: arguments of linopy.Model
+        """
+        model = _ProfiledModel(**kwargs)
+        model._build_profiler = self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._start()
+        return model
+
+    def record (self, model, name, step, n_variables=0, n_constraints=0, n_nonzeros=None):
+        """
+        records a build step ending now
+        :param model: linopy model being built
+        :param name: name of the variable, constraint or objective modified by the step
+        :param step: "add_variables", "add_constraints", "lhs +=", "objective +=" ...
+        :param n_nonzeros: non-zeros added by the step. If None, computed from the current state of the constraint
+        (or objective) called name
+        """
+        wall_time = time.perf_counter() - self._start_time
+        peak_memory = tracemalloc.get_traced_memory()[1] - self._start_memory if tracemalloc.is_tracing() else float("nan")
+        if n_nonzeros is None:
+            if name == "objective":
+                nonzeros = _count_nonzeros(model.objective.expression if hasattr(model.objective, "expression") else model.objective)
+                n_nonzeros, self._objective_nonzeros = nonzeros - self._objective_nonzeros, nonzeros
+            else:
+                nonzeros = _count_nonzeros(model.constraints[name])
+                n_nonzeros = nonzeros - self._constraint_nonzeros.get(name, 0)
+                self._constraint_nonzeros[name] = nonzeros
+        self.records.append(dict(
+            block=self.block, name=name, step=step, wall_time_s=wall_time, peak_memory_increase_MB=peak_memory / 10 ** 6,
+            n_variables=n_variables, n_constraints=n_constraints, n_nonzeros=n_nonzeros))
+        self._start()
+
+    def stop (self):
+        """
+        stops the memory tracing if it was started by the profiler
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def to_dataframe (self):
+        """
+        returns the recorded steps as a pandas table, with a final "total" row
+        """
+        profile = pd.DataFrame(self.records, columns=["block", "name", "step", "wall_time_s", "peak_memory_increase_MB",
+                                                      "n_variables", "n_constraints", "n_nonzeros"])
+        total = profile[["wall_time_s", "n_variables", "n_constraints", "n_nonzeros"]].sum()
+        total["peak_memory_increase_MB"] = profile["peak_memory_increase_MB"].max()
+        total["name"], total["step"] = "total", "total"
+        return pd.concat([profile, total.to_frame().T], ignore_index=True)
+
+    def _start (self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self._start_memory = tracemalloc.get_traced_memory()[0]
+        self._start_time = time.perf_counter()
+
+
+class _ProfiledModel (linopy.Model):
+    __slots__ = ("_build_profiler",)
+
+    def add_variables (self, *args, **kwargs):
+        variable = super().add_variables(*args, **kwargs)
+        self._build_profiler.record(self, variable.name, "add_variables",
+                                    n_variables=int((variable.labels != -1).sum()), n_nonzeros=0)
+        return variable
+
+    def add_constraints (self, *args, **kwargs):
+        constraint = super().add_constraints(*args, **kwargs)
+        self._build_profiler.record(self, constraint.name, "add_constraints",
+                                    n_constraints=int((constraint.labels != -1).sum()))
+        return constraint
+
+
+def record_build_step (profiler, model, name, step):
+    """
+    records a build step that is not an add_variables/add_constraints call (e.g. "lhs +=" on constraint name,
+    "objective +=" with name="objective"). Does nothing if profiler is None.
+    """
+    if profiler is not None:
+        profiler.record(model, name, step)
+
+
+def set_build_block (profiler, block):
+    """
+    sets the block (e.g. "3 - Storage") of the next recorded steps. Does nothing if profiler is None.
+    """
+    if profiler is not None:
+        profiler.block = block
+
+
+def end_build (profiler):
+    """
+    stops the memory tracing of the profiler at the end of a build. Does nothing if profiler is None.
+    """
+    if profiler is not None:
+        profiler.stop()
+
+
+def _count_nonzeros (expression):
+    # terms with a variable and a non zero coefficient, in non masked rows for constraints
+    nonzeros = (expression.vars != -1) & (expression.coeffs != 0)
+    if hasattr(expression, "labels"):
+        nonzeros = nonzeros & (expression.labels != -1)
+    return int(nonzeros.sum())
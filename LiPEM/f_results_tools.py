@@ -0,0 +1,169 @@
+import hashlib
+import os
+
+import numpy as np
+import xarray as xr
+import linopy
+
+from LiPEM.f_tools import get_solution
+from LiPEM.model_single_horizon_multi_energy import build_single_horizon_multi_energy_LEAP_model
+
+#### length of the chunks along the date dimension of the saved arrays (one month of hours)
+results_date_chunk = 744
+#### groups of a results store
+results_groups = ["solution", "parameters", "duals"]
+
+
+def save_results (model, file, parameters=None, date_chunk: int = results_date_chunk, compression_level: int = 4):
+    """
+    saves the solution of a solved model, its duals and the parameters used to build it in a compressed and chunked
+    store (one group per dataset, see results_groups), so that the results can be post-processed later without
+    re-solving and without loading all the hourly arrays in memory (see open_results).
+    The store is a zarr store if the file name ends with .zarr (needs the zarr package), a netcdf file otherwise.
+    Usage :
+        model.solve(solver_name='highs')
+        save_results(model, "results/reference.nc", parameters)
+        ...
+        solution, parameters, duals = open_results("results/reference.nc")
+        extractEnergyCapacity_l(solution, parameters)["Capacity_GW"]
+    :param model: solved linopy model or its solution dataset (no duals are then saved)
+    :param file: path of the netcdf file or zarr store, overwritten if it exists
+    :param parameters: parameters used to build the model, default to None (not saved)
+    :param date_chunk: length of the chunks along the date dimension, the other dimensions are not chunked
+    :param compression_level: zlib compression level of the netcdf variables (zarr uses its default compressor)
+    """
+    datasets = dict(solution=get_solution(model), parameters=parameters)
+    if isinstance(model, linopy.Model):
+        datasets["duals"] = xr.Dataset({name: constraint.dual for name, constraint in model.constraints.items()
+                                        if "dual" in constraint.data})
+
+    is_zarr = str(file).endswith(".zarr")
+    mode = "w"
+    for group, dataset in datasets.items():
+        if dataset is None:
+            continue
+        chunks = {dim: min(date_chunk, size) if dim == "date" else size for dim, size in dataset.sizes.items()}
+        if is_zarr:
+            dataset.chunk(chunks).to_zarr(file, group=group, mode=mode)
+        else:
+            encoding = {name: _netcdf_encoding(variable, chunks, compression_level) for name, variable in dataset.data_vars.items()}
+            dataset.to_netcdf(file, group=group, mode=mode, engine="netcdf4", encoding=encoding)
+        mode = "a"
+
+
+def open_results (file, chunks: dict = None):
+    """
+    opens a store written by save_results. The arrays are not loaded : with dask they are read chunk by chunk when
+    computed (e.g. by the sums of extractEnergyCapacity_l), so that the results of long horizons can be post-processed
+    with little memory. The datasets can be used in place of a solved model in the extract functions of f_tools and
+    the graphical tools.
+    :param file: path of the netcdf file or zarr store
+    :param chunks: dask chunks of the opened arrays, default to the chunks of the store
+    :return: solution, parameters, duals xarray datasets (None for a group that was not saved)
+    """
+    is_zarr = str(file).endswith(".zarr")
+    if is_zarr:
+        saved_groups = [group for group in results_groups if os.path.isdir(os.path.join(file, group))]
+    else:
+        import netCDF4
+        with netCDF4.Dataset(file) as store:
+            saved_groups = [group for group in results_groups if group in store.groups]
+    return tuple(xr.open_dataset(file, group=group, engine="zarr" if is_zarr else "netcdf4",
+                                 chunks={} if chunks is None else chunks) if group in saved_groups else None
+                 for group in results_groups)
+
+
+def solve_with_cache (
+        parameters,
+        cache_folder: str,
+        build_options: dict = None,
+        solver_name: str = "highs",
+        solver_options: dict = None,
+        max_cache_size_GB: float = 10.,
+        verbose: bool = False
+    ):
+    """
+    Builds and solves build_single_horizon_multi_energy_LEAP_model, or returns the stored results when the same
+    parameters, build options and solver settings were already solved. The results are saved with save_results in
+    cache_folder under a hash of the inputs (see get_results_hash). When the cache folder exceeds max_cache_size_GB the
+    least recently used entries are deleted.
+    Usage :
+        solution, parameters, duals = solve_with_cache(parameters, "case_studies/eu_7_nodes/cache/",
+                                                       build_options=dict(compact=True), verbose=True)
+        extractCosts_l(solution, parameters)
+    :param parameters: xarray dataset of the model parameters
+    :param cache_folder: folder of the cached results, created if needed
+    :param build_options: other arguments of build_single_horizon_multi_energy_LEAP_model (e.g. compact)
+    :param solver_name: name of the solver
+    :param solver_options: other arguments of model.solve
+    :param max_cache_size_GB: maximum size of the cache folder
+    :param verbose: default to False. If True print the hit or miss and the evicted entries.
+    :return: solution, parameters, duals xarray datasets as returned by open_results
+    """
+    build_options, solver_options = build_options or dict(), solver_options or dict()
+    key = get_results_hash(parameters, build_options=build_options, solver_name=solver_name, solver_options=solver_options)
+    file = os.path.join(cache_folder, key + ".nc")
+    if os.path.exists(file):
+        if verbose: print(f"Cache hit {key}")
+        os.utime(file)
+        return open_results(file)
+
+    if verbose: print(f"Cache miss {key}, solving")
+    model = build_single_horizon_multi_energy_LEAP_model(parameters, **build_options)
+    model.solve(solver_name=solver_name, **solver_options)
+    if model.status != "ok":
+        raise ValueError(f"Model not solved : {model.termination_condition}")
+    os.makedirs(cache_folder, exist_ok=True)
+    # written under a temporary name so that an interrupted save does not leave a corrupted entry
+    save_results(model, file + ".tmp", parameters)
+    os.replace(file + ".tmp", file)
+    _evict_cache_entries(cache_folder, max_cache_size_GB, keep=file, verbose=verbose)
+    return open_results(file)
+
+
+def get_results_hash (parameters, **options):
+    """
+    returns a sha256 hash of the parameters (names, coordinates and values of all variables) and of the options
+    (e.g. build options and solver settings), used as key of the results cache of solve_with_cache
+    :param parameters: xarray dataset
+    :param options: other inputs of the results, hashed through their repr (dictionaries are sorted)
+    :return: hexadecimal string
+    """
+    digest = hashlib.sha256()
+    for name in sorted(parameters.variables):
+        variable = parameters[name]
+        digest.update(f"{name}{variable.dims}{variable.dtype}".encode())
+        digest.update(_as_bytes(variable.values))
+    for name in sorted(options):
+        option = options[name]
+        digest.update(f"{name}={sorted(option.items()) if isinstance(option, dict) else option!r}".encode())
+    return digest.hexdigest()
+
+
+def _as_bytes (values):
+    # bytes of the values of an array, object arrays (strings, mixed types) through their str
+    if values.dtype == object:
+        return "\x00".join(map(str, values.ravel())).encode()
+    return np.ascontiguousarray(values).tobytes()
+
+
+def _evict_cache_entries (cache_folder, max_cache_size_GB, keep, verbose=False):
+    # deletes the least recently used entries until the cache folder is smaller than max_cache_size_GB
+    entries = sorted((os.path.join(cache_folder, name) for name in os.listdir(cache_folder) if name.endswith(".nc")),
+                     key=os.path.getmtime)
+    cache_size = sum(os.path.getsize(entry) for entry in entries)
+    for entry in entries:
+        if cache_size <= max_cache_size_GB * 10 ** 9:
+            break
+        if entry == keep:
+            continue
+        cache_size -= os.path.getsize(entry)
+        os.remove(entry)
+        if verbose: print(f"Cache entry {os.path.basename(entry)} evicted")
+
+
+def _netcdf_encoding (variable, chunks, compression_level):
+    # zlib compression and chunks of a numeric variable, strings are stored as is
+    if not np.issubdtype(variable.dtype, np.number) or variable.ndim == 0:
+        return dict()
+    return dict(zlib=True, complevel=compression_level, chunksizes=tuple(max(1, chunks[dim]) for dim in variable.dims))
@@ -0,0 +1,139 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import xarray as xr
+
+from LiPEM.f_tools import read_EAP_input_parameters, extractCosts_l, extractEnergyCapacity_l, get_solution_with_costs
+from LiPEM.model_single_horizon_multi_energy import build_single_horizon_multi_energy_LEAP_model
+
+#### solution variable giving the dimensions of each "type" of extractEnergyCapacity_l
+extracted_type_variable = {
+    "annual_energy": "operation_conversion_power",
+    "installed_capacity": "planning_conversion_power_capacity",
+    "flexible_demand_capacity": "planning_flexible_demand_cost",
+    "storage_capacity": "planning_storage_power_capacity",
+    "storage_in": "operation_storage_power_in",
+    "storage_out": "operation_storage_power_out",
+}
+
+
+def run_scenario_sweep (
+        scenarios,
+        input_data_folder,
+        file_id_prefix: str = "EU_7_2050_",
+        read_options: dict = None,
+        solver_name: str = "highs",
+        solver_options: dict = None,
+        max_workers: int = None,
+        threads_per_scenario: int = 1,
+        memory_per_scenario_GB: float = 8.,
+        verbose: bool = False
+    ):
+    """
+    Runs read -> build -> solve -> extract for several scenarios in a pool of processes and gathers the results of
+    extractCosts_l and extractEnergyCapacity_l in one dataset with a scenario dimension (see extract_results_dataset).
+    The number of scenarios run at the same time is capped by the number of cores (cpu_count / threads_per_scenario)
+    and by the available memory (available memory / memory_per_scenario_GB). On windows and macOS the processes are
+    spawned, the calling script should then run the sweep under if __name__ == "__main__":
+    Usage :
+        results = run_scenario_sweep(
+            scenarios={"reference": {}, "Nuke-": {}, "Nuke+": {}, "Flex+": {},
+                       "reference_slow_nuke": {"workbook": "reference",
+                                               "overrides": [("operation_max_1h_ramp_rate", {"conversion_technology": "old_nuke"}, 0.02)]}},
+            input_data_folder="case_studies/eu_7_nodes/data/", solver_name="gurobi", solver_options={"Threads": 4},
+            threads_per_scenario=4, read_options=dict(selected_conversion_technology=selected_conversion_technology))
+        results["Capacity_GW-installed_capacity"].sum("area_to").to_dataframe()
+
+    :param scenarios: list of scenario names, or dictionary {scenario name : {"workbook": ..., "overrides": ...}} where
+    workbook is the scenario name of the excel file (file_id_prefix + workbook, default to the scenario name) and
+    overrides is a list of (parameter name, selection, value) applied as parameters[name].loc[selection] = value
+    :param input_data_folder: folder of the input files, see read_EAP_input_parameters
+    :param file_id_prefix: prefix of the file_id of the scenario excel files
+    :param read_options: other arguments of read_EAP_input_parameters
+    :param solver_name: name of the solver
+    :param solver_options: other arguments of model.solve
+    :param max_workers: maximum number of scenarios run at the same time, default to the number allowed by cores and
+    memory. With 1 the scenarios are run one after the other in the current process.
+    :param threads_per_scenario: number of cores used by the solver of one scenario (set the matching solver option)
+    :param memory_per_scenario_GB: memory needed by one scenario
+    :param verbose: default to False. If True print a message for each scenario.
+    :return: xarray dataset with a scenario dimension
+    """
+    if not isinstance(scenarios, dict):
+        scenarios = {scenario: dict() for scenario in scenarios}
+    n_workers = min(len(scenarios), get_max_parallel_workers(threads_per_scenario, memory_per_scenario_GB))
+    if max_workers is not None:
+        n_workers = min(n_workers, max_workers)
+    if verbose: print(f"Running {len(scenarios)} scenarios with {n_workers} workers")
+
+    arguments = [dict(scenario=scenario,
+                      file_id=file_id_prefix + definition.get("workbook", scenario),
+                      overrides=definition.get("overrides", list()),
+                      input_data_folder=input_data_folder,
+                      read_options=read_options,
+                      solver_name=solver_name,
+                      solver_options=solver_options,
+                      verbose=verbose) for scenario, definition in scenarios.items()]
+    if n_workers <= 1:
+        results = [run_scenario(**argument) for argument in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(run_scenario, **argument) for argument in arguments]
+            results = [future.result() for future in futures]
+
+    return xr.concat(results, dim="scenario", join="outer", fill_value=float("nan")). \
+        assign_coords(scenario=list(scenarios))
+
+
+def run_scenario (scenario, file_id, overrides, input_data_folder, read_options=None, solver_name="highs",
+                  solver_options=None, verbose=False):
+    """
+    Runs read -> build -> solve -> extract for one scenario of run_scenario_sweep
+    :return: xarray dataset as returned by extract_results_dataset
+    """
+    # the sheets are parsed in the scenario process, the scenarios being already run in parallel
+    parameters = read_EAP_input_parameters(input_data_folder=input_data_folder, file_id=file_id,
+                                           **dict(read_options or dict(), max_workers=1))
+    for name, selection, value in overrides:
+        parameters[name].loc[selection] = value
+    model = build_single_horizon_multi_energy_LEAP_model(parameters)
+    model.solve(solver_name=solver_name, **(solver_options or dict()))
+    if verbose: print(f"Scenario {scenario} solved, objective {model.objective.value}")
+    return extract_results_dataset(model)
+
+
+def extract_results_dataset (model, parameters=None):
+    """
+    returns the results of extractCosts_l and extractEnergyCapacity_l as an xarray dataset :
+        - <cost name> : Cost_10e9_euros of each table of extractCosts_l
+        - Capacity_GW-<type>, Energy_TWh-<type> : capacities and energies of each type of extractEnergyCapacity_l,
+        with the dimensions of the corresponding solution variable (see extracted_type_variable)
+    :param model: solved linopy model or its solution dataset
+    :param parameters: parameters used to build the model, needed with the compact formulation
+    """
+    solution = get_solution_with_costs(model, parameters)
+    results = dict()
+    for name, table in extractCosts_l(solution, parameters).items():
+        results[name] = table["Cost_10e9_euros"].to_xarray()
+    for quantity, table in extractEnergyCapacity_l(solution, parameters).items():
+        for type_name, type_table in table[quantity].groupby(level="type"):
+            dims = [dim for dim in solution[extracted_type_variable[type_name]].dims if dim != "date"]
+            type_table = type_table.droplevel("type")
+            type_table.index = type_table.index.set_names(dims)
+            results[f"{quantity}-{type_name}"] = type_table.to_xarray()
+    return xr.Dataset(results)
+
+
+def get_max_parallel_workers (threads_per_worker, memory_per_worker_GB):
+    """
+    returns the number of processes that can run at the same time given the number of cores and the available memory
+    :param threads_per_worker: number of cores used by one process
+    :param memory_per_worker_GB: memory needed by one process
+    """
+    n_parallel = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    try:
+        available_memory_GB = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 10 ** 9
+        n_parallel = min(n_parallel, max(1, int(available_memory_GB // memory_per_worker_GB)))
+    except (AttributeError, ValueError, OSError):
+        pass # available memory unknown (e.g. windows)
+    return n_parallel
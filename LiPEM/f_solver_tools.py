@@ -0,0 +1,201 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+import xarray as xr
+from linopy import solvers
+
+#### HiGHS basis status codes (HighsBasisStatus)
+highs_basis_lower, highs_basis_basic, highs_basis_zero = 0, 1, 3
+
+
+def solve_model(model, solver_name="highs", io_api="direct", keep_files=False, verbose=False, **solver_options):
+    """
+    Solves a linopy model as model.solve and returns the time spent in each step, so that the interface to the solver
+    can be chosen for each case :
+        - export_time_s : building the solver model in memory (io_api="direct", e.g. highspy for HiGHS) or writing the
+        problem file (io_api="lp" or "mps")
+        - solver_time_s : running the solver (with a file, also reading the problem and the solution files)
+        - readback_time_s : storing the primal and dual solutions in the model
+    The solution, duals and solver model (model.solver_model) are available as after model.solve.
+    Usage :
+        timings = solve_model(model, solver_name="highs", io_api="direct")
+        print(pd.Series(timings))
+    :param model: linopy model
+    :param solver_name: name of the solver
+    :param io_api: "direct" to pass the matrices to the solver in memory (with solvers that have a direct interface,
+    otherwise the lp file is used), "lp" or "mps" to go through a file
+    :param keep_files: default to False. If True the problem and solution files are not removed.
+    :param verbose: default to False. If True print the timings.
+    :param solver_options: options of the solver
+    :return: dictionary with the io_api used and the times of the steps
+    """
+    solver_class = getattr(solvers, solvers.SolverName(solver_name).name)
+    if io_api == "direct" and not solver_class.supports(solvers.SolverFeature.DIRECT_API):
+        if verbose: print(f"{solver_name} has no direct interface, using an lp file")
+        io_api = "lp"
+    model.reset_solution()
+    model.constraints.sanitize_zeros()
+    model.constraints.sanitize_infinities()
+    problem_fn = None if io_api == "direct" else model.get_problem_file(io_api=io_api)
+    solution_fn = None if io_api == "direct" else model.get_solution_file()
+
+    try:
+        start_time = time.perf_counter()
+        build_options = dict(set_names=False) if io_api == "direct" else dict(problem_fn=problem_fn)
+        model.solver = None  # closes any previous solver
+        solver = solvers.Solver.from_name(solver_name, model=model, io_api=io_api, options=solver_options, **build_options)
+        export_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        result = solver.solve(solution_fn=solution_fn)
+        solver_time = time.perf_counter() - start_time
+    finally:
+        for fn in (problem_fn, solution_fn):
+            if fn is not None and os.path.exists(fn) and not keep_files:
+                os.remove(fn)
+
+    start_time = time.perf_counter()
+    model.assign_result(result, solver=solver)
+    readback_time = time.perf_counter() - start_time
+
+    timings = dict(io_api=io_api, export_time_s=export_time, solver_time_s=solver_time, readback_time_s=readback_time,
+                   total_time_s=export_time + solver_time + readback_time)
+    if verbose: print(f"{solver_name} ({io_api}) : export {export_time:.2f} s, solver {solver_time:.2f} s, read back {readback_time:.2f} s")
+    return timings
+
+
+def get_warm_start(model):
+    """
+    returns the starting point given by a solved linopy model, as an xarray dataset indexed by the coordinates of the
+    variables and constraints, so that it can be used on another model with the same structure (e.g. a scenario
+    variant with different parameters) :
+        - primal-<variable name> : solution of the variable
+        - dual-<constraint name> : dual value of the constraint
+        - col_status-<variable name>, row_status-<constraint name> : HiGHS basis status (only if solved with HiGHS)
+    :param model: solved linopy model
+    :return: xarray dataset, NaN where the variable or constraint is masked
+    """
+    warm_start = xr.Dataset()
+    for name, variable in model.variables.items():
+        warm_start["primal-" + name] = variable.solution
+    for name, constraint in model.constraints.items():
+        if "dual" in constraint.data:
+            warm_start["dual-" + name] = constraint.dual
+
+    solver_model = getattr(model, "solver_model", None)
+    if hasattr(solver_model, "getBasis") and solver_model.getBasis().valid:
+        basis = solver_model.getBasis()
+        lp = solver_model.getLp()
+        col_labels = _solver_labels(lp.col_names_, model.matrices.vlabels)
+        row_labels = _solver_labels(lp.row_names_, model.matrices.clabels)
+        col_status = np.array([int(status) for status in basis.col_status])
+        row_status = np.array([int(status) for status in basis.row_status])
+        for name, variable in model.variables.items():
+            warm_start["col_status-" + name] = _values_by_label(variable.labels, col_labels, col_status)
+        for name, constraint in model.constraints.items():
+            warm_start["row_status-" + name] = _values_by_label(constraint.labels, row_labels, row_status)
+    return warm_start
+
+
+def save_warm_start(model, file):
+    """
+    saves the starting point given by a solved linopy model (see get_warm_start) in a netcdf file
+    :param model: solved linopy model
+    :param file: path of the netcdf file
+    """
+    get_warm_start(model).to_netcdf(file)
+
+
+def load_warm_start(file):
+    """
+    loads a starting point saved by save_warm_start
+    :param file: path of the netcdf file
+    :return: xarray dataset
+    """
+    return xr.load_dataset(file)
+
+
+def solve_with_warm_start(model, warm_start=None, solver_name="highs", verbose=False, **solver_options):
+    """
+    Solves a linopy model starting from the solution of a previous solve of a model with the same structure
+    (typically the same model built with other parameters). Columns and rows are matched by variable/constraint name
+    and coordinates, columns and rows that are not in the warm start are respectively set non basic and basic.
+    Warm start is only available with HiGHS, through its basis, other solvers start from scratch.
+    Usage :
+        model.solve(solver_name='highs')
+        save_warm_start(model, "reference_warm_start.nc")
+        ...
+        variant_model = build_single_horizon_multi_energy_LEAP_model(variant_parameters)
+        solve_with_warm_start(variant_model, load_warm_start("reference_warm_start.nc"))
+    :param model: linopy model
+    :param warm_start: xarray dataset as returned by get_warm_start or load_warm_start, or None for a cold start
+    :param solver_name: name of the solver
+    :param verbose: default to False. If True print the warm start used.
+    :param solver_options: other arguments of model.solve
+    :return: what model.solve returns
+    """
+    has_basis = warm_start is not None and any(name.startswith("col_status-") for name in warm_start.data_vars)
+    if solver_name != "highs" or not has_basis:
+        if verbose: print(f"solving {solver_name} without warm start")
+        return model.solve(solver_name=solver_name, **solver_options)
+
+    col_labels, row_labels = np.asarray(model.matrices.vlabels), np.asarray(model.matrices.clabels)
+    col_status = _in_model_order(model.variables, col_labels, lambda name, variable: _matched(warm_start, "col_status-" + name, variable.labels))
+    row_status = _in_model_order(model.constraints, row_labels, lambda name, constraint: _matched(warm_start, "row_status-" + name, constraint.labels))
+    n_new_columns, n_new_rows = np.isnan(col_status).sum(), np.isnan(row_status).sum()
+    # columns that are not in the warm start are non basic at their lower bound (at zero when free)
+    lower = _in_model_order(model.variables, col_labels, lambda name, variable: variable.lower)
+    col_status = np.where(np.isnan(col_status), np.where(np.isfinite(lower), highs_basis_lower, highs_basis_zero), col_status).astype(int)
+    # rows that are not in the warm start are basic (slack in the basis)
+    row_status = np.where(np.isnan(row_status), highs_basis_basic, row_status).astype(int)
+
+    n_basic = (col_status == highs_basis_basic).sum() + (row_status == highs_basis_basic).sum()
+    if n_basic != len(row_labels):
+        if verbose: print(f"warm start basis has {n_basic} basic variables for {len(row_labels)} rows, solving without warm start")
+        return model.solve(solver_name=solver_name, **solver_options)
+    if verbose: print(f"warm start basis with {n_new_columns} new columns and {n_new_rows} new rows")
+
+    basis_file = tempfile.NamedTemporaryFile(suffix=".bas", delete=False).name
+    try:
+        with open(basis_file, "w") as f:
+            f.write(f"HiGHS_basis_file v2\nValid\n# Columns {len(col_labels)}\n")
+            f.writelines(f"x{label} {status}\n" for label, status in zip(col_labels, col_status))
+            f.write(f"# Rows {len(row_labels)}\n")
+            f.writelines(f"c{label} {status}\n" for label, status in zip(row_labels, row_status))
+        return model.solve(solver_name=solver_name, warmstart_fn=basis_file, **solver_options)
+    finally:
+        os.remove(basis_file)
+
+
+def _solver_labels(names, default_labels):
+    # linopy labels of the solver columns (resp. rows), read from their names "x<label>" (resp. "c<label>") when available
+    if len(names) == len(default_labels) and all(len(name) > 1 for name in names[:1]):
+        return np.array([int(name[1:]) for name in names])
+    return np.asarray(default_labels)
+
+
+def _values_by_label(labels, solver_labels, values):
+    # values of the solver columns (resp. rows) arranged as the labels of a variable (resp. constraint), NaN where masked
+    values_by_label = np.full(max(int(labels.max()), int(solver_labels.max())) + 1, np.nan)
+    values_by_label[solver_labels] = values
+    return xr.DataArray(np.where(labels.values != -1, values_by_label[labels.values], np.nan), coords=labels.coords, dims=labels.dims)
+
+
+def _matched(warm_start, name, labels):
+    # warm start values of name matched by coordinates with labels, NaN for the coordinates that are not in the warm start
+    if name not in warm_start:
+        return xr.full_like(labels, np.nan, dtype=float)
+    return warm_start[name].reindex({dim: labels.get_index(dim) for dim in labels.dims})
+
+
+def _in_model_order(items, model_labels, values_of):
+    # values_of(name, item) for all the variables (resp. constraints) of items, arranged in the order of model_labels
+    values_by_label = np.full(int(model_labels.max()) + 1 if len(model_labels) else 0, np.nan)
+    for name, item in items.items():
+        labels = item.labels.values.ravel()
+        values = values_of(name, item).broadcast_like(item.labels).transpose(*item.labels.dims).values.ravel()
+        is_active = (labels != -1) & (labels < len(values_by_label))
+        values_by_label[labels[is_active]] = values[is_active]
+    return values_by_label[model_labels]
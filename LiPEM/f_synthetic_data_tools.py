@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+#### templates of the synthetic technologies, cycled when more technologies are asked
+# conversion : energy_vector_in, efficiency, unit cost (euros/MW/year), ramp rate (0 : no ramp constraint), availability profile
+synthetic_conversion_technologies = [
+    ("nuke", "uranium", 0.33, 4e5, 0.2, "flat"),
+    ("ccgt", "gas", 0.55, 9e4, 0., "flat"),
+    ("wind", "electricity", 0., 1.2e5, 0., "wind"),
+    ("solar", "electricity", 0., 6e4, 0., "solar"),
+    ("ocgt", "gas", 0.35, 5e4, 0., "flat"),
+    ("hydro_river", "electricity", 0., 1.5e5, 0., "seasonal"),
+]
+# storage : unit cost (euros/MWh/year), hours of stock, min energy capacity
+synthetic_storage_technologies = [("battery", 1e4, 4, 0.), ("storage_hydro", 1e3, 500, 1000.)]
+# energy_vector_in : unit cost (euros/MWh)
+synthetic_energy_vector_in = {"uranium": 5., "gas": 50., "electricity": 0., "unserved": 3000.}
+synthetic_flexible_demand_periods = ["day", "week", "year"]
+
+
+def generate_synthetic_parameters (
+        n_areas: int = 2,
+        n_hours: int = 8760,
+        n_conversion_technologies: int = 4,
+        n_storage_technologies: int = 2,
+        n_flexible_demands: int = 3,
+        seed: int = 0,
+        start_date: str = "2018-01-01"
+    ):
+    """
+    Generates a parameters dataset with the same schema as the output of read_EAP_input_parameters, without any
+    input file, for performance and scaling work on instances of arbitrary size.
+    Conversion, storage technologies and flexible demand periods are taken from the synthetic_* templates (cycled with a
+    number suffix when more are asked), a demand_not_served technology is always added. Demands and availabilities are
+    daily and yearly sine profiles with random noise, areas are connected in a ring (and randomly to other areas).
+
+    :param n_areas: number of areas (area_to)
+    :param n_hours: number of hourly dates
+    :param n_conversion_technologies: number of conversion technologies, demand_not_served excluded
+    :param n_storage_technologies: number of storage technologies, 0 for no storage
+    :param n_flexible_demands: number of flexible demands, 0 for no demand side management
+    :param seed: seed of the random profiles
+    :param start_date: first date
+    :return: xarray dataset
+    """
+    rng = np.random.default_rng(seed)
+    area_to = pd.Index([f"area_{i}" for i in range(n_areas)], name="area_to")
+    date = pd.date_range(start_date, periods=n_hours, freq="h", name="date")
+    energy_vector_out = pd.Index(["electricity"], name="energy_vector_out")
+    hour = np.arange(n_hours)
+    daily = np.sin((hour % 24 - 6) / 12 * np.pi)
+    yearly = np.cos((hour / (24 * 365.25)) * 2 * np.pi)
+    to_merge = list()
+
+    # Conversion technologies
+    conversion = [_template(synthetic_conversion_technologies, i) for i in range(n_conversion_technologies)]
+    conversion.append(("demand_not_served", "unserved", 1., 0., 0., "flat"))
+    conversion_technology = pd.Index([technology[0] for technology in conversion], name="conversion_technology")
+    rows = list()
+    for area in area_to:
+        for name, energy_vector_in_value, efficiency, unit_cost, ramp_rate, _ in conversion:
+            rows.append(dict(area_to=area, conversion_technology=name, energy_vector_out="electricity",
+                             energy_vector_in_value=energy_vector_in_value,
+                             operation_conversion_efficiency=efficiency,
+                             planning_conversion_unit_cost=unit_cost,
+                             planning_conversion_max_capacity=1e6 if name == "demand_not_served" else 1e5,
+                             planning_conversion_min_capacity=0.,
+                             operation_max_1h_ramp_rate=ramp_rate,
+                             operation_min_1h_ramp_rate=ramp_rate))
+    to_merge.append(pd.DataFrame(rows).set_index(["area_to", "conversion_technology", "energy_vector_out"]).to_xarray())
+
+    # Energy vector in
+    energy_vector_in = sorted(set(technology[1] for technology in conversion))
+    to_merge.append(xr.DataArray([[synthetic_energy_vector_in[vector] for vector in energy_vector_in]] * n_areas,
+                                 coords=[area_to, pd.Index(energy_vector_in, name="energy_vector_in")]).
+                    rename("operation_energy_unit_cost"))
+
+    # Availability time series
+    availability = np.ones((n_areas, n_hours, len(conversion)))
+    for j, technology in enumerate(conversion):
+        profile = technology[5]
+        if profile == "wind":
+            availability[:, :, j] = np.clip(0.35 + 0.15 * yearly + rng.normal(0, 0.2, (n_areas, n_hours)), 0, 1)
+        elif profile == "solar":
+            availability[:, :, j] = np.clip(daily * (0.75 - 0.25 * yearly), 0, None) * rng.uniform(0.6, 1, (n_areas, 1))
+        elif profile == "seasonal":
+            availability[:, :, j] = 0.5 + 0.3 * yearly
+    to_merge.append(xr.DataArray(availability, coords=[area_to, date, conversion_technology]).
+                    rename("operation_conversion_availability_factor"))
+    to_merge.append(xr.DataArray(data=1, dims=["date"], coords=dict(date=date)).rename("time_stamp_length"))
+
+    # Exchange (interconnections) : ring and random links
+    if n_areas > 1:
+        capacity = np.zeros((n_areas, 1, n_areas))
+        for i in range(n_areas):
+            for j in [(i + 1) % n_areas] + list(rng.choice(n_areas, size=min(2, n_areas), replace=False)):
+                if j != i:
+                    capacity[i, 0, j] = capacity[j, 0, i] = 5000.
+        to_merge.append(xr.DataArray(capacity, coords=[area_to, energy_vector_out, pd.Index(area_to, name="area_from")]).
+                        rename("operation_exchange_max_capacity"))
+
+    # Storage technologies
+    if n_storage_technologies > 0:
+        rows = list()
+        for area in area_to:
+            for i in range(n_storage_technologies):
+                name, unit_cost, hours_of_stock, min_capacity = _template(synthetic_storage_technologies, i)
+                rows.append(dict(energy_vector_out="electricity", area_to=area, storage_technology=name,
+                                 planning_storage_energy_unit_cost=unit_cost,
+                                 operation_storage_dissipation=0.0001,
+                                 operation_storage_efficiency_in=0.9,
+                                 operation_storage_efficiency_out=0.9,
+                                 planning_storage_max_energy_capacity=1e6,
+                                 planning_storage_min_energy_capacity=min_capacity,
+                                 operation_storage_hours_of_stock=hours_of_stock))
+        to_merge.append(pd.DataFrame(rows).set_index(["energy_vector_out", "area_to", "storage_technology"]).to_xarray())
+
+    # Exogenous energy demand
+    demand_level = rng.uniform(20000, 60000, (1, n_areas, 1))
+    demand = demand_level * (1 + 0.2 * daily[None, None, :] + 0.25 * yearly[None, None, :]) + rng.normal(0, 1000, (1, n_areas, n_hours))
+    to_merge.append(xr.DataArray(demand, coords=[energy_vector_out, area_to, date]).rename("exogenous_energy_demand"))
+
+    # Demand-side management
+    if n_flexible_demands > 0:
+        flexible_demand = pd.Index([_template([(f"flexible_{period}",) for period in synthetic_flexible_demand_periods], i)[0]
+                                    for i in range(n_flexible_demands)], name="flexible_demand")
+        profile = demand_level[:, None, :, :] * 0.03 * (1 + 0.5 * rng.uniform(0, 1, (1, n_flexible_demands, n_areas, n_hours)))
+        flexible_demand_to_optimise = xr.DataArray(profile, coords=[energy_vector_out, flexible_demand, area_to, date]).\
+            rename("flexible_demand_to_optimise")
+        to_merge.append(flexible_demand_to_optimise)
+        rows = list()
+        for area in area_to:
+            for i, name in enumerate(flexible_demand):
+                rows.append(dict(area_to=area, energy_vector_out="electricity", flexible_demand=name,
+                                 flexible_demand_planning_unit_cost=1e3,
+                                 flexible_demand_ratio_max=0.5,
+                                 flexible_demand_period=synthetic_flexible_demand_periods[i % len(synthetic_flexible_demand_periods)]))
+        to_merge.append(pd.DataFrame(rows).set_index(["area_to", "energy_vector_out", "flexible_demand"]).to_xarray())
+        to_merge.append(flexible_demand_to_optimise.max(["flexible_demand", "date"]).rename("flexible_demand_max_power"))
+
+    return xr.merge(to_merge)
+
+
+def _template (templates, i):
+    # i-th technology of templates, named with a suffix after the first cycle
+    template = templates[i % len(templates)]
+    if i < len(templates):
+        return template
+    return (f"{template[0]}_{i // len(templates)}",) + tuple(template[1:])
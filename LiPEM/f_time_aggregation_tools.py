@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from LiPEM.f_tools import get_solution
+
+
+def cluster_representative_periods (
+        parameters,
+        n_representative_periods: int,
+        period: str = "day",
+        seed: int = 0,
+        max_iterations: int = 100,
+        verbose: bool = False
+    ):
+    """
+    Clusters the periods (days or weeks) of the year into representative periods and restricts the parameters
+    to the hours of these periods (time slices). The periods are compared on all the time series of the parameters
+    (demand, availability, flexible demand) normalised by their maximum, a k-means is run on these profiles
+    and the period closest to each cluster center is used as the representative period of the cluster.
+    The returned parameters contain, in addition to the reduced time series :
+        - time_slice_weight [date] : number of hours of the year represented by each hour of the representative periods
+        - time_slice_period [date] : representative period of each hour
+        - time_slice_assignment [time_slice_original_period] : representative period assigned to each period of the year
+        - time_slice_original_period_length [time_slice_original_period] : number of hours in each period of the year
+        - time_slice_date [original_date] : hour of the representative periods used for each hour of the year
+        - time_slice_date_original_period [original_date] : period of the year of each hour of the year
+    build_single_horizon_multi_energy_LEAP_model switches to the time slice formulation when time_slice_weight is
+    in the parameters, and expand_time_slice_solution gives back the hourly results on the full year.
+    The storage level of each hour of the year is the level at the beginning of its period of the year plus the level
+    within its representative period. Only the maximum and minimum levels within each representative period are
+    bounded by the capacity and by 0, and the dissipation of the level at the beginning of a period is applied at the
+    end of the period : the expanded levels stay feasible at every hour, but the approximation is conservative, the
+    objective is slightly higher than the hourly one even with each period as its own representative (about 5e-5 on
+    three weeks of the synthetic parameters). The flexible demands with a week period are balanced on the hours of
+    the representative periods falling in each week.
+
+    :param parameters: xarray dataset as returned by read_EAP_input_parameters
+    :param n_representative_periods: number of representative periods
+    :param period: "day" or "week", length of the periods
+    :param seed: seed of the k-means initialisation
+    :param max_iterations: maximum number of k-means iterations
+    :param verbose: default to False. If True print the clustering summary.
+    :return: xarray dataset with the reduced parameters
+    """
+    period_length = {"day": 24, "week": 168}[period]
+    date = parameters.get_index("date")
+    time_stamp_length = parameters["time_stamp_length"].to_numpy()
+    if not (time_stamp_length == 1).all():
+        raise ValueError("cluster_representative_periods expects hourly parameters (time_stamp_length == 1)")
+
+    # periods of the year as consecutive blocks of period_length hours, the last one can be shorter
+    original_period = np.arange(len(date)) // period_length
+    hour_in_period = np.arange(len(date)) % period_length
+    n_original_periods = original_period[-1] + 1
+    original_period_length = np.bincount(original_period)
+    is_full_period = original_period_length == period_length
+
+    features = _period_features(parameters, original_period, hour_in_period, n_original_periods, period_length)
+    n_clusters = min(n_representative_periods, is_full_period.sum())
+    medoids = _k_medoids(features[is_full_period], n_clusters, seed, max_iterations)
+    medoids = np.sort(np.flatnonzero(is_full_period)[medoids])
+
+    # each period of the year (including a truncated last one) is represented by its closest medoid
+    distance = np.stack([
+        np.nansum((features - features[medoid]) ** 2, axis=1) for medoid in medoids], axis=1)
+    assignment = np.argmin(distance, axis=1)
+
+    # hours of the representative periods, and correspondence with the hours of the year
+    representative_date_position = (medoids[:, None] * period_length + np.arange(period_length)[None, :]).ravel()
+    representative_date = date[representative_date_position]
+    time_slice_date = date[medoids[assignment[original_period]] * period_length + hour_in_period]
+    weight = pd.Series(1, index=time_slice_date).groupby(level=0).sum().reindex(representative_date, fill_value=0)
+
+    if verbose:
+        print(f"{n_original_periods} periods of {period_length} hours clustered into {len(medoids)} representative periods")
+
+    original_period_index = pd.Index(range(n_original_periods), name="time_slice_original_period")
+    original_date = pd.Index(date, name="original_date")
+    time_slice_parameters = xr.Dataset({
+        "time_slice_weight": xr.DataArray(weight.to_numpy(), coords=[representative_date]),
+        "time_slice_period": xr.DataArray(np.repeat(np.arange(len(medoids)), period_length), coords=[representative_date]),
+        "time_slice_assignment": xr.DataArray(assignment, coords=[original_period_index]),
+        "time_slice_original_period_length": xr.DataArray(original_period_length, coords=[original_period_index]),
+        "time_slice_date": xr.DataArray(time_slice_date, coords=[original_date]),
+        "time_slice_date_original_period": xr.DataArray(original_period, coords=[original_date]),
+    })
+    return xr.merge([parameters.sel(date=representative_date), time_slice_parameters])
+
+
+def expand_time_slice_solution (model, parameters):
+    """
+    Expands the solution of a model built on representative periods (see cluster_representative_periods)
+    to all the hours of the year. Each hour of the year takes the value of the corresponding hour of its
+    representative period. The storage level is rebuilt by adding the level at the beginning of each period of the
+    year (operation_storage_inter_period_level) to the level within the representative period.
+
+    :param model: solved linopy model or its solution dataset
+    :param parameters: reduced parameters used to build the model
+    :return: xarray dataset with the same variables as model.solution over the full year. It can be used in place of
+    the model in extractCosts_l, extractEnergyCapacity_l and EnergyAndExchange2Prod.
+    """
+    solution = get_solution(model)
+    expanded = solution.sel(date=parameters["time_slice_date"]).drop_vars("date").rename(original_date="date")
+
+    if "operation_storage_inter_period_level" in solution:
+        inter_period_level = solution["operation_storage_inter_period_level"]. \
+            sel(time_slice_original_period=parameters["time_slice_date_original_period"]). \
+            drop_vars("time_slice_original_period").rename(original_date="date")
+        expanded["operation_storage_internal_energy_level"] = expanded["operation_storage_internal_energy_level"] + inter_period_level
+        expanded = expanded.drop_vars("operation_storage_inter_period_level")
+
+    return expanded
+
+
+def resample_parameters (parameters, time_step: int = None, block_lengths=None):
+    """
+    Aggregates the time series of the parameters (demand, availability, temperature, flexible demand...) into blocks
+    of time_step hours or of variable lengths, to build smaller models for quick looks and screening sweeps. Each block
+    is a date (its first hour) whose time_stamp_length is its number of hours and whose values are the mean of the
+    values of its hours (weighted by their time_stamp_length). build_single_horizon_multi_energy_LEAP_model takes
+    time_stamp_length into account in the energies (costs, storage levels, yearly sums), in the ramp rates (given per
+    hour, multiplied by the block length), in the storage dissipation and in the daily and weekly flexible demand sums.
+    The returned parameters also contain time_block_date [original_date] : block of each date of the original
+    parameters, used by expand_resampled_solution to give back hourly results.
+    Usage :
+        model = build_single_horizon_multi_energy_LEAP_model(resample_parameters(parameters, time_step=3))
+
+    :param parameters: xarray dataset as returned by read_EAP_input_parameters
+    :param time_step: length of the blocks in number of dates, from the first date (a divisor of 24 keeps the blocks
+    within the days)
+    :param block_lengths: lengths of the consecutive blocks in number of dates, summing to the number of dates, used
+    instead of time_step for blocks of variable length
+    :return: xarray dataset with the resampled parameters
+    """
+    if "time_slice_weight" in parameters:
+        raise ValueError("resample_parameters expects parameters without time slices")
+    date = parameters.get_index("date")
+    if block_lengths is not None:
+        block_lengths = np.asarray(block_lengths)
+        if block_lengths.sum() != len(date) or (block_lengths <= 0).any():
+            raise ValueError(f"block_lengths should be positive and sum to the number of dates ({len(date)})")
+        block = np.repeat(np.arange(len(block_lengths)), block_lengths)
+    elif time_step is not None:
+        block = np.arange(len(date)) // time_step
+    else:
+        raise ValueError("time_step or block_lengths is needed")
+    block_date = date[np.flatnonzero(np.diff(block, prepend=-1))]
+
+    group = xr.DataArray(block, coords=[date], name="block")
+    length = parameters["time_stamp_length"]
+    time_series = [name for name in parameters.data_vars if "date" in parameters[name].dims and name != "time_stamp_length"]
+    resampled = xr.Dataset(coords={"date": block_date})
+    for name in time_series:
+        series = parameters[name]
+        if np.issubdtype(series.dtype, np.number):
+            # weighted mean, NaN for the blocks with a missing value
+            values = (series * length).groupby(group).sum(skipna=False) / length.groupby(group).sum()
+        else:
+            values = series.groupby(group).first()
+        resampled[name] = values.rename(block="date").assign_coords(date=block_date).transpose(*series.dims)
+    resampled["time_stamp_length"] = length.groupby(group).sum().rename(block="date").assign_coords(date=block_date)
+    resampled["time_block_date"] = xr.DataArray(block_date[block], coords=[pd.Index(date, name="original_date")])
+    return xr.merge([parameters.drop_dims("date"), resampled])
+
+
+def expand_resampled_solution (model, parameters):
+    """
+    Expands the solution of a model built on resampled parameters (see resample_parameters) to the original dates :
+    each date takes the value of its block (power of the block, storage level at the beginning of the block), so that
+    energies are the sums over the original dates.
+
+    :param model: solved linopy model or its solution dataset
+    :param parameters: resampled parameters used to build the model
+    :return: xarray dataset with the same variables as model.solution over the original dates. It can be used in place
+    of the model in extractCosts_l, extractEnergyCapacity_l and EnergyAndExchange2Prod.
+    """
+    solution = get_solution(model)
+    return solution.sel(date=parameters["time_block_date"]).drop_vars("date").rename(original_date="date")
+
+
+def _period_features (parameters, original_period, hour_in_period, n_original_periods, period_length):
+    # one row per period of the year, one column per (time series, hour of the period), NaN for missing hours
+    features = list()
+    for name in parameters.data_vars:
+        if not "date" in parameters[name].dims or name == "time_stamp_length":
+            continue
+        values = parameters[name].fillna(0).transpose("date", ...).to_numpy().reshape(parameters.sizes["date"], -1).astype(float)
+        scale = np.abs(values).max(axis=0)
+        values = values[:, scale > 0] / scale[scale > 0]
+        table = np.full((n_original_periods, period_length, values.shape[1]), np.nan)
+        table[original_period, hour_in_period, :] = values
+        features.append(table.reshape(n_original_periods, -1))
+    return np.concatenate(features, axis=1)
+
+
+def _k_medoids (features, n_clusters, seed, max_iterations):
+    # k-means (with k-means++ initialisation) returning the position of the member closest to each cluster center
+    rng = np.random.default_rng(seed)
+    centers = features[[rng.integers(len(features))]]
+    for _ in range(1, n_clusters):
+        distance = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        probabilities = distance / distance.sum() if distance.sum() > 0 else None
+        centers = np.concatenate([centers, features[[rng.choice(len(features), p=probabilities)]]])
+
+    for _ in range(max_iterations):
+        labels = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        new_centers = np.stack([
+            features[labels == k].mean(axis=0) if (labels == k).any() else centers[k] for k in range(n_clusters)])
+        if np.allclose(new_centers, centers):
+            break
+        centers = new_centers
+
+    medoids = list()
+    for k in range(n_clusters):
+        members = np.flatnonzero(labels == k)
+        if len(members) == 0:
+            continue
+        medoids.append(members[((features[members] - centers[k]) ** 2).sum(axis=1).argmin()])
+    return np.unique(medoids)
@@ -1,3 +1,11 @@
+import collections
+import hashlib
+import shutil
+import zipfile
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
 import requests
 import numpy as np
 import pandas as pd
@@ -8,6 +16,21 @@ import linopy
 
 from LiPEM.f_demand_tools import *
 
+#### components of read_EAP_input_parameters already read, by component name and key (see get_cached_input_component)
+input_components_cache = dict()
+#### options of pd.read_excel for the sheets of read_EAP_input_parameters
+excel_sheets_read_options = {
+    "operation_conversion_availabili": dict(parse_dates=["date"]),
+    "electricity_demand": dict(parse_dates=["date"]),
+    "temperature": dict(parse_dates=["date"]),
+}
+#### long sheets of read_EAP_input_parameters that can be read from parquet datasets (see convert_excel_to_parquet) :
+# sheet -> columns filtered with the selections of read_EAP_input_parameters
+parquet_sheets = {
+    "operation_conversion_availabili": ["area_to", "conversion_technology"],
+    "electricity_demand": ["area_to"],
+    "temperature": ["area_to"],
+}
 
 
 def read_EAP_input_parameters (
@@ -18,6 +41,10 @@ def read_EAP_input_parameters (
         selected_area_to = None,
         selected_conversion_technology = None,
         selected_storage_technology = None,
+        date_range: tuple = None,
+        use_cache: bool = True,
+        excel_engine: str = None,
+        max_workers: int = 1,
         verbose: bool = False
     ):
     """
@@ -28,6 +55,10 @@ def read_EAP_input_parameters (
     conversion_technology, energy_vector_in, operation_conversion_availabili, electricity_demand
     if multiple area reads also interconnexions
     if is_storage also reads storage_technology
+    The long tables operation_conversion_availabili, electricity_demand and temperature are read from the netcdf files
+    {file_id}_availability.nc, {file_id}_exogeneous_energy_demand.nc, {file_id}_temperature.nc if they exist, otherwise
+    from the parquet datasets {file_id}_parquet/<sheet> if they exist (see convert_excel_to_parquet, only the
+    partitions of the selected areas are read), otherwise from the excel file.
     TODO: implement demand management
 
     :param InputExcelFolder: folder where the excel file can be found. Should finish with "/" if not empty.
@@ -37,7 +68,20 @@ def read_EAP_input_parameters (
     :param selected_area_to: list of selected areas. If None (default) all existing areas in the excel file are used
     :param selected_conversion_technology: list of selected conversion technologies. If None (default) all existing technologies in the excel file are used
     :param selected_storage_technology: list of selected storage technologies. If None (default) all existing storage technologies in the excel file are used
-    :param verbose: default to False. If True print a message for each step.
+    :param date_range: (first date, last date) of the time series, e.g. ("2018-01-01", "2018-01-31 23:00") to run one
+    month. If None (default) all the dates of the input files are used. Only the dates of the window are read from the
+    netcdf files and parquet datasets. The thermal sensitivity is then estimated on the window, and the yearly energy
+    of the flexible demands is scaled by the share of the year covered by the window.
+    :param use_cache: default to True. Each component (conversion_technology, energy_vector_in, availability,
+    interconnexions, storage, recomposed demand, flexible demand) is kept in memory under a key made of the content
+    of its sheets or netcdf files and of the selections, so that the scenario workbooks sharing sheets reuse the
+    components already read and computed (see get_cached_input_component)
+    :param excel_engine: engine of pd.read_excel, default to None (openpyxl). "calamine" (python-calamine package)
+    parses the sheets several times faster.
+    :param max_workers: number of processes parsing the sheets at the same time (see read_input_sources), default to 1
+    (sheets parsed in the current process). None for the number of cores, the calling script should then run under
+    if __name__ == "__main__": on windows and macOS.
+    :param verbose: default to False. If True print a message for each step and the time spent on each source.
     :return:
     """
 
@@ -49,9 +93,63 @@ def read_EAP_input_parameters (
     # List to be filled by the different xarray tables obtained from the excel file
     to_merge = list()
 
-    # Load excel file
-    xls_file = pd.ExcelFile(f'{input_data_folder}{file_id}.xlsx')  # TODO: create an excel file with only two country to accelerate the code here
-    
+    # Sources : the sheets and netcdf files that can be needed, and whose components are not in the cache, are read
+    # at the same time (see read_input_sources). Other sources are read when a component is missing.
+    excel_path = f'{input_data_folder}{file_id}.xlsx'  # TODO: create an excel file with only two country to accelerate the code here
+    sheet_keys = get_excel_sheet_keys(excel_path)
+    selections = {"area_to": selected_area_to, "conversion_technology": selected_conversion_technology}
+    path_availability = f'{input_data_folder}{file_id}_availability.nc'
+    path_exogenous_energy_demand = f'{input_data_folder}{file_id}_exogeneous_energy_demand.nc'  # TODO: typo in filename (exogeneous -> exogenous)
+    path_temperature = f'{input_data_folder}{file_id}_temperature.nc'
+    # netcdf file used instead of a sheet when it exists : sheet -> (file, subsets)
+    netcdf_files = {
+        "operation_conversion_availabili": (path_availability, {dim: selections[dim] for dim in ["conversion_technology", "area_to"]}),
+        "electricity_demand": (path_exogenous_energy_demand, {"area_to": selected_area_to}),
+        "temperature": (path_temperature, {"area_to": selected_area_to}),
+    }
+    netcdf_files = {sheet: (file, subsets) for sheet, (file, subsets) in netcdf_files.items() if os.path.isfile(file)}
+    # parquet dataset used instead of a sheet when it exists : sheet -> (folder, subsets)
+    parquet_files = {sheet: (f'{input_data_folder}{file_id}_parquet/{sheet}', {dim: selections[dim] for dim in dims})
+                     for sheet, dims in parquet_sheets.items() if sheet not in netcdf_files}
+    parquet_files = {sheet: (folder, subsets) for sheet, (folder, subsets) in parquet_files.items() if os.path.isdir(folder)}
+    for sheet, (folder, _) in parquet_files.items():
+        sheet_keys[sheet] = get_file_hash(folder)  # the content of the parquet dataset identifies the table
+    sheets = ["conversion_technology", "energy_vector_in", "interconnexions", "thermal_sensitivity"] + \
+             (["storage_technology"] if is_storage else []) + (["flexible_demand", "demand_profile"] if is_demand_management else []) + \
+             [sheet for sheet in parquet_sheets if sheet not in netcdf_files and sheet not in parquet_files]
+    in_date_range = lambda data: data if date_range is None else data.sel(date=slice(*date_range))
+    is_read = lambda source_key: not use_cache or not any(source_key in key for key in input_components_cache)
+    sources, timings = read_input_sources(
+        excel_path,
+        sheets=[sheet for sheet in sheets if sheet in sheet_keys and is_read(sheet_keys[sheet])],
+        netcdf_subsets={file: subsets for file, subsets in netcdf_files.values() if is_read(get_file_hash(file))},
+        parquet_subsets={folder: subsets for sheet, (folder, subsets) in parquet_files.items() if is_read(sheet_keys[sheet])},
+        date_range=date_range, excel_engine=excel_engine, max_workers=max_workers)
+    xls_file = list()
+    def read_sheet (sheet):
+        if sheet in sources:
+            return sources[sheet]
+        start_time = perf_counter()
+        if sheet in parquet_files:
+            folder, subsets = parquet_files[sheet]
+            table = sources[folder] if folder in sources else read_parquet_table(folder, subsets, date_range)
+            timings.setdefault(sheet + " (parquet)", perf_counter() - start_time)
+            return table
+        if not xls_file:
+            xls_file.append(pd.ExcelFile(excel_path, engine=excel_engine))
+        table = pd.read_excel(xls_file[0], sheet, **excel_sheets_read_options.get(sheet, dict()))
+        timings[sheet] = perf_counter() - start_time
+        return table
+    def read_netcdf (file, subsets):
+        if file in sources:
+            return select_existing_values(sources[file], subsets)
+        start_time = perf_counter()
+        data = get_subset_netcdf_data(file, subsets, date_range)
+        timings[os.path.basename(file)] = perf_counter() - start_time
+        return data
+    # component read by compute, or taken from the cache if already read with the same key
+    component = lambda name, key, compute: get_cached_input_component((name,) + key, compute, use_cache)
+
 
 
     ########
@@ -60,7 +158,8 @@ def read_EAP_input_parameters (
 
     # Conversion technology (conversion_technology)
     if verbose: print("Reading conversion_technology")
-    conversion_technology_parameters = pd.read_excel(xls_file, "conversion_technology").dropna().set_index(["area_to", "conversion_technology", "energy_vector_out"]).to_xarray()
+    conversion_technology_parameters = component("conversion_technology", (sheet_keys["conversion_technology"],), lambda:
+        read_sheet("conversion_technology").dropna().set_index(["area_to", "conversion_technology", "energy_vector_out"]).to_xarray())
     if selected_area_to == None:
         selected_area_to = list(conversion_technology_parameters["area_to"].to_numpy())
     if selected_conversion_technology == None:
@@ -70,21 +169,22 @@ def read_EAP_input_parameters (
     # Energy vector in (energy_vector_in)
     if verbose: print("Reading energy_vector_in")
     selected_energy_vector_in_value = list(np.unique(conversion_technology_parameters.select({"conversion_technology" : selected_conversion_technology, "area_to": selected_area_to})["energy_vector_in_value"].squeeze().to_numpy()))
-    to_merge.append(
-        pd.read_excel(xls_file, "energy_vector_in").dropna().set_index(["area_to", "energy_vector_in"]). \
-        to_xarray().loc[{"energy_vector_in" : selected_energy_vector_in_value, "area_to": selected_area_to}])
+    to_merge.append(component("energy_vector_in", (sheet_keys["energy_vector_in"],), lambda:
+        read_sheet("energy_vector_in").dropna().set_index(["area_to", "energy_vector_in"]).to_xarray()). \
+        loc[{"energy_vector_in" : selected_energy_vector_in_value, "area_to": selected_area_to}])
 
     # Availability time series for conversion means
     if verbose: print("Reading operation_conversion_availabili")
-    path_availability = f'{input_data_folder}{file_id}_availability.nc'
     if (os.path.isfile(path_availability)):
-        availability = get_subset_netcdf_data(
-            file = input_data_folder + "EU_7_2050_availability.nc",  # TODO: replace with path_availability
-            subsets= {"conversion_technology": selected_conversion_technology, "area_to": selected_area_to})
+        availability = component("availability", (get_file_hash(path_availability), repr(selected_conversion_technology), repr(selected_area_to), repr(date_range)), lambda:
+            read_netcdf(
+                file = path_availability,
+                subsets= {"conversion_technology": selected_conversion_technology, "area_to": selected_area_to}))
     else:
-        availability = pd.read_excel(xls_file, "operation_conversion_availabili", parse_dates=['date']). \
+        availability = component("availability", (sheet_keys["operation_conversion_availabili"], repr(selected_conversion_technology), repr(selected_area_to), repr(date_range)), lambda:
+            in_date_range(read_sheet("operation_conversion_availabili"). \
             dropna().set_index(["area_to", "date", "conversion_technology"]). \
-            to_xarray().select({"conversion_technology": selected_conversion_technology, "area_to": selected_area_to})
+            to_xarray().select({"conversion_technology": selected_conversion_technology, "area_to": selected_area_to})))
     time_stamp_length = xr.DataArray(data=1, dims=["date"], coords=dict(date=availability.get_index("date"))). \
         rename(new_name_or_name_dict="time_stamp_length")
     # availability.to_netcdf("EU_7_2050_availability.nc")
@@ -94,16 +194,17 @@ def read_EAP_input_parameters (
     # Exchange (interconnections)
     if len(selected_area_to) > 1:
         if verbose: print("Reading interconnexions")
-        to_merge.append(
-            pd.read_excel(xls_file, "interconnexions").dropna(). \
+        to_merge.append(component("interconnexions", (sheet_keys["interconnexions"], repr(selected_area_to)), lambda:
+            read_sheet("interconnexions").dropna(). \
             set_index(["area_to", "area_from"]).to_xarray(). \
             expand_dims(dim={"energy_vector_out": ["electricity"]}, axis=1).fillna(0). \
-            select({"area_to": selected_area_to, "area_from": selected_area_to}))
+            select({"area_to": selected_area_to, "area_from": selected_area_to})))
 
     # Storage technology
     if is_storage:
         if verbose: print("Reading storage_technology")
-        storage_technology= pd.read_excel(xls_file, "storage_technology").set_index(["energy_vector_out", "area_to", "storage_technology"]).to_xarray()
+        storage_technology = component("storage_technology", (sheet_keys["storage_technology"],), lambda:
+            read_sheet("storage_technology").set_index(["energy_vector_out", "area_to", "storage_technology"]).to_xarray())
         if selected_storage_technology == None:
             selected_conversion_technology = list(storage_technology["storage_technology"].to_numpy())
         to_merge.append(storage_technology.select({"area_to": selected_area_to, "storage_technology": selected_storage_technology}))
@@ -116,15 +217,18 @@ def read_EAP_input_parameters (
 
     # Exogenous energy demand
     if verbose: print("Reading electricity_demand")
-    path_exogenous_energy_demand = f'{input_data_folder}{file_id}_exogeneous_energy_demand.nc'  # TODO: typo in filename (exogeneous -> exogenous)
     if os.path.isfile(path_exogenous_energy_demand):
-        exogenous_energy_demand = get_subset_netcdf_data(
-            file = input_data_folder + "EU_7_2050_exogeneous_energy_demand.nc",  # TODO: replace with path_exogenous_energy_demand
-            subsets= {"area_to" : selected_area_to})
+        demand_key = (get_file_hash(path_exogenous_energy_demand), repr(selected_area_to), repr(date_range))
+        exogenous_energy_demand = component("electricity_demand", demand_key, lambda:
+            read_netcdf(
+                file = path_exogenous_energy_demand,
+                subsets= {"area_to" : selected_area_to}))
     else:
-        exogenous_energy_demand = pd.read_excel(xls_file, "electricity_demand", parse_dates=['date']).dropna(). \
+        demand_key = (sheet_keys["electricity_demand"], repr(selected_area_to), repr(date_range))
+        exogenous_energy_demand = component("electricity_demand", demand_key, lambda:
+            in_date_range(read_sheet("electricity_demand").dropna(). \
             set_index(["area_to", "date"]).to_xarray().expand_dims(dim={"energy_vector_out": ["electricity"]}, axis=1). \
-            transpose("energy_vector_out", "area_to", "date").select({"area_to": selected_area_to})
+            transpose("energy_vector_out", "area_to", "date").select({"area_to": selected_area_to})))
 
     # Extract year (?)
     years = list(set(exogenous_energy_demand.date.to_numpy().astype('datetime64[Y]').astype(int) + 1970))
@@ -132,50 +236,70 @@ def read_EAP_input_parameters (
 
     # Change in thermal sensitivity
     if verbose: print("Reading temperature")
-    path_temperature = f'{input_data_folder}{file_id}_temperature.nc'
     if os.path.isfile(path_temperature):
-        temperature = get_subset_netcdf_data(
-            file = input_data_folder + "EU_7_2050_temperature.nc",  # TODO: replace with path_temperature
-            subsets= {"area_to" : selected_area_to})
+        temperature_key = (get_file_hash(path_temperature), repr(selected_area_to), repr(date_range))
+        temperature = component("temperature", temperature_key, lambda:
+            read_netcdf(
+                file = path_temperature,
+                subsets= {"area_to" : selected_area_to}))
     else:
-        temperature = pd.read_excel(xls_file, "temperature", parse_dates=['date']). \
+        temperature_key = (sheet_keys["temperature"], repr(selected_area_to), str(year), repr(date_range))
+        temperature = component("temperature", temperature_key, lambda:
+            in_date_range(read_sheet("temperature"). \
             set_index(["date", "area_to"]).loc[str(year)].to_xarray(). \
             expand_dims(dim={"energy_vector_out": ["electricity"]}, axis=1).\
-            drop_duplicates(dim="date").select({"area_to": selected_area_to})
-    thermal_sensitivity = pd.read_excel(xls_file, "thermal_sensitivity").set_index(["area_to"]).to_xarray().expand_dims(dim={"energy_vector_out": ["electricity"]}, axis=1)
-    
-    warnings.filterwarnings("ignore")  # TODO: remove FutureWarning here
-    decomposed_demand = decompose_demand(temperature, exogenous_energy_demand, temperature_threshold=15)
-    exogenous_energy_demand = recompose_demand(decomposed_demand,temperature,thermal_sensitivity,temperature_threshold=15)
-    warnings.filterwarnings("default")
+            drop_duplicates(dim="date").select({"area_to": selected_area_to})))
+
+    def compute_recomposed_demand ():
+        thermal_sensitivity = read_sheet("thermal_sensitivity").set_index(["area_to"]).to_xarray().expand_dims(dim={"energy_vector_out": ["electricity"]}, axis=1)
+        decomposed_demand = decompose_demand(temperature, exogenous_energy_demand, temperature_threshold=15)
+        return recompose_demand(decomposed_demand,temperature,thermal_sensitivity,temperature_threshold=15)
     # TODO: add temperature_threshold as a global parameter here
+    recomposed_demand_key = demand_key + temperature_key + (sheet_keys["thermal_sensitivity"],)
+    start_time = perf_counter()
+    exogenous_energy_demand = component("recomposed_demand", recomposed_demand_key, compute_recomposed_demand)
+    timings["recomposed demand"] = perf_counter() - start_time
     to_merge.append(exogenous_energy_demand)
 
     # Demand-side management
     if is_demand_management:
         if verbose: print("Reading demand side management")
-        flexible_demand_table = pd.read_excel(xls_file, "flexible_demand").set_index(["area_to", "flexible_demand"]).to_xarray().expand_dims(dim={"energy_vector_out": ["electricity"]}, axis=1)
-        demand_profile = pd.read_excel(xls_file, "demand_profile")
-        warnings.filterwarnings("ignore")  # TODO: remove FutureWarning here
-        flexible_demand_to_optimise = compute_flexible_demand_to_optimise(flexible_demand_table, demand_profile, exogenous_energy_demand, temperature)
-        # flexible_demand_to_optimise.to_dataframe().groupby(["energy_vector_out", "area_to", "flexible_demand"]).sum()
-        warnings.filterwarnings("default")
-        to_merge.append(flexible_demand_to_optimise.select({"area_to": selected_area_to}))
-
-        # Generate parameter "max power" and add it to flexible_demand_table
-        flexible_demand_table = flexible_demand_table.merge(flexible_demand_to_optimise.to_dataframe().\
-            groupby(["energy_vector_out","area_to"]).max().to_xarray().flexible_demand_to_optimise. \
-            rename(new_name_or_name_dict="flexible_demand_max_power"))
-
-        to_merge.append(flexible_demand_table)
-
+        def compute_flexible_demand ():
+            flexible_demand_table = read_sheet("flexible_demand").set_index(["area_to", "flexible_demand"]).to_xarray().expand_dims(dim={"energy_vector_out": ["electricity"]}, axis=1)
+            demand_profile = read_sheet("demand_profile")
+            warnings.filterwarnings("ignore")  # TODO: remove FutureWarning here
+            flexible_demand_to_optimise = compute_flexible_demand_to_optimise(flexible_demand_table, demand_profile, exogenous_energy_demand, temperature)
+            # flexible_demand_to_optimise.to_dataframe().groupby(["energy_vector_out", "area_to", "flexible_demand"]).sum()
+            warnings.filterwarnings("default")
+            if date_range is not None:
+                # the yearly energy is spread on the dates of the window : scaled by the share of the year they cover
+                hours_in_year = (pd.Timestamp(year + 1, 1, 1) - pd.Timestamp(year, 1, 1)) / pd.Timedelta(hours=1)
+                flexible_demand_to_optimise = flexible_demand_to_optimise * len(exogenous_energy_demand.get_index("date")) / hours_in_year
+
+            # Generate parameter "max power" and add it to flexible_demand_table
+            flexible_demand_table = flexible_demand_table.merge(flexible_demand_to_optimise.to_dataframe().\
+                groupby(["energy_vector_out","area_to"]).max().to_xarray().flexible_demand_to_optimise. \
+                rename(new_name_or_name_dict="flexible_demand_max_power"))
+            return xr.merge([flexible_demand_to_optimise.select({"area_to": selected_area_to}), flexible_demand_table])
+
+        start_time = perf_counter()
+        to_merge.append(component("flexible_demand", recomposed_demand_key + (sheet_keys["flexible_demand"], sheet_keys["demand_profile"]), compute_flexible_demand))
+        timings["flexible demand"] = perf_counter() - start_time
+
+
+    for opened_file in xls_file:
+        opened_file.close()
 
     # TODO: add chp_production
     # Final merge
     parameters = xr.merge(to_merge)
     parameters["operation_conversion_availability_factor"] = parameters["operation_conversion_availability_factor"].fillna(1) ## 1 is the default value for availability factor
     parameters["operation_conversion_efficiency"] = parameters["operation_conversion_efficiency"].fillna(0)
-    
+
+    if verbose:
+        print("Time spent on each source (s) :")
+        for source, elapsed in timings.items():
+            print(f"    {source} : {elapsed:.2f}")
     return parameters
 
 
@@ -208,6 +332,76 @@ def read_EAP_input_parameters (
 
 # TODO: add labour_ratio_cost to demand_side_management
 # This is an operation cost
+def get_cached_input_component (key, compute, use_cache: bool = True):
+    """
+    returns a copy of the component of input_components_cache with the given key, computed (and stored) if it is not
+    in the cache yet. The copy can be modified (e.g. scenario overrides) without changing the cached component.
+    :param key: tuple identifying the component : name, keys of the sources (see get_excel_sheet_keys and
+    get_file_hash) and selections
+    :param compute: function without arguments returning the component (xarray dataset or dataarray)
+    :param use_cache: if False the component is computed and not stored
+    """
+    if not use_cache:
+        return compute()
+    if key not in input_components_cache:
+        input_components_cache[key] = compute()
+    return input_components_cache[key].copy(deep=True)
+
+
+def clear_input_components_cache ():
+    """
+    empties the cache of the components of read_EAP_input_parameters, e.g. to free the memory after a scenario sweep
+    """
+    input_components_cache.clear()
+
+
+def get_excel_sheet_keys (file):
+    """
+    returns a dictionary {sheet name: key} where the key identifies the content of the sheet without reading it : crc
+    and size of the sheet and of the shared strings in the xlsx archive. Identical sheets of two workbooks then have
+    the same key as long as their shared strings are the same. For other formats all sheets have the file hash as key.
+    :param file: path of the excel file
+    """
+    if not zipfile.is_zipfile(file):
+        return collections.defaultdict(lambda: get_file_hash(file))
+    namespaces = {"main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+                  "relationships": "http://schemas.openxmlformats.org/package/2006/relationships",
+                  "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships"}
+    with zipfile.ZipFile(file) as archive:
+        members = {info.filename: info for info in archive.infolist()}
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {relationship.get("Id"): relationship.get("Target").lstrip("/").removeprefix("xl/")
+               for relationship in relationships.findall("relationships:Relationship", namespaces)}
+    member_key = lambda name: f"{members[name].CRC:08x}-{members[name].file_size}" if name in members else ""
+    shared_strings_key = member_key("xl/sharedStrings.xml")
+    return {sheet.get("name"): member_key("xl/" + targets[sheet.get(f"{{{namespaces['r']}}}id")]) + "-" + shared_strings_key
+            for sheet in workbook.findall("main:sheets/main:sheet", namespaces)}
+
+
+def get_file_hash (file):
+    """
+    returns the sha256 hash of the content of a file, kept in input_components_cache while the file is not modified.
+    For a folder (e.g. a parquet dataset) returns the hash of the relative paths and hashes of all its files.
+    """
+    if os.path.isdir(file):
+        digest = hashlib.sha256()
+        for folder, _, names in sorted(os.walk(file)):
+            for name in sorted(names):
+                path = os.path.join(folder, name)
+                digest.update(f"{os.path.relpath(path, file)}:{get_file_hash(path)}".encode())
+        return digest.hexdigest()
+    status = os.stat(file)
+    key = ("file_hash", os.path.abspath(file), status.st_size, status.st_mtime_ns)
+    if key not in input_components_cache:
+        digest = hashlib.sha256()
+        with open(file, "rb") as opened_file:
+            for block in iter(lambda: opened_file.read(2 ** 20), b""):
+                digest.update(block)
+        input_components_cache[key] = digest.hexdigest()
+    return input_components_cache[key]
+
+
 def labour_ratio_cost(df: pd.DataFrame) -> float:  # Higher labour costs at night
     if df.hour in range(7, 17):
         return 1.
@@ -225,30 +419,146 @@ def download_file (url: str, filename: str, verbose: bool = False):
         print(f"Downloaded file {filename}")
 
 
-def get_subset_netcdf_data (file, subsets):
-    ds = xr.open_dataset(file)
+def get_subset_netcdf_data (file, subsets, date_range: tuple = None, chunks: dict = None):
+    """
+    returns the data of a netcdf file restricted to subsets and to a date window. The file is opened lazily with dask
+    chunks, the selections are applied before loading, so that only the chunks containing selected values are read.
+    :param file: path of the netcdf file
+    :param subsets: dictionary {dimension: list of values} (no restriction for None values, missing values are ignored)
+    :param date_range: (first date, last date) of the window, default to None (all dates)
+    :param chunks: dask chunks, default to the chunks of the file
+    :return: xarray dataset in memory
+    """
+    with xr.open_dataset(file, chunks={} if chunks is None else chunks) as ds:
+        if date_range is not None:
+            ds = ds.sel(date=slice(*date_range))
+        return select_existing_values(ds, subsets).load()
+
+
+def select_existing_values (ds, subsets):
+    """
+    returns ds restricted to the values of subsets {dimension: values} that exist in ds (no restriction for None values)
+    """
     subset_with_existing_values = dict()
     for dim_name in subsets.keys():
-        if not subsets[dim_name] == None:
-            existing_values = ds.get_index(dim_name)
-            subset_with_existing_values[dim_name] = [v for v in subsets[dim_name] if v in existing_values]
-    return ds.sel(subset_with_existing_values).load()
+        if not subsets[dim_name] is None:
+            values = pd.Index(subsets[dim_name])
+            subset_with_existing_values[dim_name] = values[values.isin(ds.get_index(dim_name))]
+    return ds.sel(subset_with_existing_values)
 
 
-def period_boolean_table (date, period):
+def read_input_sources (excel_file, sheets, netcdf_subsets, parquet_subsets: dict = None, date_range: tuple = None,
+                        excel_engine: str = None, max_workers: int = 1):
+    """
+    reads sheets of an excel file, netcdf files and parquet datasets at the same time : the sheets can be parsed in a pool
+    of processes (parsing is limited by the cpu, see max_workers) while the netcdf files and parquet datasets are read
+    in threads. On windows and macOS the processes are spawned, a script using several processes should then run under
+    if __name__ == "__main__":
+    :param excel_file: path of the excel file
+    :param sheets: list of the sheets to read, read with the options of excel_sheets_read_options
+    :param netcdf_subsets: dictionary {netcdf file: subsets} (see get_subset_netcdf_data)
+    :param parquet_subsets: dictionary {parquet dataset folder: subsets} (see read_parquet_table)
+    :param date_range: (first date, last date) of the netcdf and parquet data, default to None (all dates)
+    :param excel_engine: engine of pd.read_excel, default to None (openpyxl)
+    :param max_workers: maximum number of processes, default to 1 : the sheets are parsed one after the other in the
+    current process. None for the number of cores.
+    :return: dictionary {sheet, file or folder: dataframe or xarray dataset}, dictionary {sheet or file name: time spent (s)}
+    """
+    sources, timings = dict(), dict()
+    parquet_subsets = parquet_subsets or dict()
+    n_workers = min(len(sheets), max_workers or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(1, len(netcdf_subsets) + len(parquet_subsets))) as netcdf_executor:
+        netcdf_futures = {file: netcdf_executor.submit(_timed, get_subset_netcdf_data, file, subsets, date_range)
+                          for file, subsets in netcdf_subsets.items()}
+        netcdf_futures.update({folder: netcdf_executor.submit(_timed, read_parquet_table, folder, subsets, date_range)
+                               for folder, subsets in parquet_subsets.items()})
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                sheet_futures = {sheet: executor.submit(_timed, _read_excel_sheet, excel_file, sheet, excel_engine) for sheet in sheets}
+                sheet_results = {sheet: future.result() for sheet, future in sheet_futures.items()}
+        elif sheets:
+            with pd.ExcelFile(excel_file, engine=excel_engine) as opened_file:
+                sheet_results = {sheet: _timed(_read_excel_sheet, opened_file, sheet) for sheet in sheets}
+        else:
+            sheet_results = dict()
+        netcdf_results = {file: future.result() for file, future in netcdf_futures.items()}
+
+    for sheet, (table, elapsed) in sheet_results.items():
+        sources[sheet], timings[sheet] = table, elapsed
+    for file, (data, elapsed) in netcdf_results.items():
+        name = os.path.basename(file) + (" (parquet)" if file in parquet_subsets else "")
+        sources[file], timings[name] = data, elapsed
+    return sources, timings
+
+
+def convert_excel_to_parquet (input_data_folder, file_id, sheets: list = None, verbose: bool = False):
+    """
+    writes the long sheets of an input excel file as parquet datasets read by read_EAP_input_parameters instead of the
+    sheets. Layout : one dataset per sheet {input_data_folder}{file_id}_parquet/<sheet>/, with the columns of the sheet,
+    partitioned by area (one folder area_to=<area> per area) and sorted by the other filtered columns (see
+    parquet_sheets), so that only the partitions and row groups of the selected areas and technologies are read.
+    Usage :
+        convert_excel_to_parquet("case_studies/eu_7_nodes/data/", "EU_7_2050_reference", verbose=True)
+        parameters = read_EAP_input_parameters("case_studies/eu_7_nodes/data/", "EU_7_2050_reference")
+    :param input_data_folder: folder of the excel file
+    :param file_id: name of the excel file without extension
+    :param sheets: list of sheets to convert, default to the sheets of parquet_sheets
+    :param verbose: default to False. If True print a message for each sheet.
+    """
+    with pd.ExcelFile(f'{input_data_folder}{file_id}.xlsx') as xls_file:
+        for sheet in sheets or list(parquet_sheets):
+            if verbose: print(f"Converting {sheet}")
+            table = pd.read_excel(xls_file, sheet, **excel_sheets_read_options.get(sheet, dict()))
+            folder = f'{input_data_folder}{file_id}_parquet/{sheet}'
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+            table.sort_values(parquet_sheets.get(sheet, ["area_to"]) + ["date"]). \
+                to_parquet(folder, engine="pyarrow", partition_cols=["area_to"], index=False)
+
+
+def read_parquet_table (folder, subsets, date_range: tuple = None):
+    """
+    returns the rows of a parquet dataset written by convert_excel_to_parquet with the values of subsets, as the
+    dataframe of the sheet : only the partitions of the selected areas and the row groups that can contain the selected
+    values are read.
+    :param folder: folder of the parquet dataset
+    :param subsets: dictionary {column: list of values} (no restriction for None values)
+    :param date_range: (first date, last date) of the rows, default to None (all dates)
     """
-    returns a boolean xarray table with the dimension date x value(period) with date == value(period)
+    filters = [(column, "in", list(values)) for column, values in subsets.items() if values is not None]
+    if date_range is not None:
+        # last date given as a string includes its whole period (e.g. the whole day), as in xarray selections
+        last_date = pd.Period(date_range[1]).end_time if isinstance(date_range[1], str) else pd.Timestamp(date_range[1])
+        filters += [("date", ">=", pd.Timestamp(date_range[0])), ("date", "<=", last_date)]
+    table = pd.read_parquet(folder, engine="pyarrow", filters=filters or None)
+    table["area_to"] = table["area_to"].astype(str)  # partition column read as categorical
+    return table
+
+
+def _read_excel_sheet (excel_file, sheet, excel_engine=None):
+    # excel_file is a path (in the pool of processes) or an opened pd.ExcelFile
+    return pd.read_excel(excel_file, sheet, engine=excel_engine, **excel_sheets_read_options.get(sheet, dict()))
+
+
+def _timed (function, *args):
+    # returns the result of function(*args) and the time it took
+    start_time = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start_time
+
+
+def period_index (date, period):
+    """
+    returns an xarray table with the dimension date giving value(period) for each date, e.g. the day of year of each hour.
+    It is meant to be used as a grouper (expression.groupby(period_index(date, period)).sum()) so that each date
+    appears once in the period sums.
     :param date:
     :param period: "day_of_year", "weekofyear"
     see https://pandas.pydata.org/docs/reference/api/pandas.Period.html
     :return:
     """
-    x_of_year = getattr(date.to_period(), period)
-    x_of_year_xr = xr.DataArray(x_of_year, coords={'date': date})
-    x_of_year_values = pd.DataFrame(x_of_year).date.unique()
-    x_of_year_values_xr = xr.DataArray(x_of_year_values, coords={period: x_of_year_values})
-    x_of_year_table = (x_of_year_xr == x_of_year_values_xr)
-    return x_of_year_table
+    x_of_year = getattr(date.to_period(freq="h"), period)
+    return xr.DataArray(np.asarray(x_of_year), coords={'date': date}, name=period)
 
 
 # TODO: move to top of file
@@ -267,54 +577,111 @@ xr.Dataset.get_index_in = get_index_in
 xr.Dataset.select = select
 
 
-def extractCosts_l (model):
+def get_solution (model):
+    """
+    returns the solution dataset of a solved linopy model. Solution datasets (e.g. from expand_time_slice_solution)
+    are returned as is, so that the extract functions can be used on both. Scalar coordinates left by a selection
+    (e.g. solution.sel(weather_year=1995)) are dropped, they would be columns of the extracted tables.
+    """
+    return _drop_scalar_coords(model.solution if isinstance(model, linopy.Model) else model)
+
+
+def _drop_scalar_coords (dataset):
+    return dataset.drop_vars([name for name, coord in dataset.coords.items() if coord.ndim == 0])
+
+
+def get_solution_with_costs (model, parameters=None):
+    """
+    returns the solution dataset (see get_solution) with the variables that are not created by the compact formulation
+    (build_single_horizon_multi_energy_LEAP_model with compact=True) recomputed from the primal solution and the
+    parameters : planning_conversion_cost, operation_energy_cost, operation_total_hourly_demand,
+    planning_storage_energy_cost and planning_flexible_demand_cost.
+    :param model: solved linopy model or its solution dataset
+    :param parameters: parameters used to build the model, only needed with the compact formulation
+    """
+    solution = get_solution(model)
+    if "planning_conversion_cost" in solution:
+        return solution
+    if parameters is None:
+        raise ValueError("the model has the compact formulation, the parameters are needed to recompute the costs")
+
+    solution = solution.copy()
+    # recomputed variable : (unit cost or value, variable of the solution it is defined from)
+    definitions = {
+        "planning_conversion_cost": ("planning_conversion_unit_cost", "planning_conversion_power_capacity"),
+        "operation_energy_cost": ("operation_energy_unit_cost", "operation_yearly_importation"),
+        "planning_storage_energy_cost": ("planning_storage_energy_unit_cost", "planning_storage_energy_capacity"),
+        "planning_flexible_demand_cost": ("flexible_demand_planning_unit_cost", "planning_flexible_demand_max_power_increase"),
+    }
+    for name, (unit_cost, variable) in definitions.items():
+        if variable in solution:
+            solution[name] = (parameters[unit_cost] * solution[variable]).transpose(*solution[variable].dims)
+    solution["operation_total_hourly_demand"] = parameters["exogenous_energy_demand"].transpose(..., "energy_vector_out", "area_to", "date")
+    return _drop_scalar_coords(solution)
+
+
+def extractCosts_l (model, parameters=None):
+    """
+    returns the cost tables of a solved model
+    :param model: solved linopy model or its solution dataset
+    :param parameters: parameters used to build the model, needed to recompute the costs with the compact formulation
+    """
+
+    solution = get_solution_with_costs(model, parameters)
 
     # Initialize results dictionary
     res = dict()
-    res["operation_energy_cost"] = (model.solution["operation_energy_cost"]/ 10 ** 9).to_dataframe()
+    res["operation_energy_cost"] = (solution["operation_energy_cost"]/ 10 ** 9).to_dataframe()
     res["operation_energy_cost"].columns = ["Cost_10e9_euros"]
     res["operation_energy_cost"]["type"] = "annual_energy"
-    res["planning_conversion_cost"] = (model.solution["planning_conversion_cost"]/ 10 ** 9).to_dataframe()
+    res["planning_conversion_cost"] = (solution["planning_conversion_cost"]/ 10 ** 9).to_dataframe()
     res["planning_conversion_cost"].columns = ["Cost_10e9_euros"]
     res["planning_conversion_cost"]["type"] = "installed_capacity"
     
-    if "planning_flexible_demand_cost" in model.solution :
-        res["flexible_demand_capacity_cost"]= (model.solution["planning_flexible_demand_cost"]/ 10 ** 9).to_dataframe()
+    if "planning_flexible_demand_cost" in solution :
+        res["flexible_demand_capacity_cost"]= (solution["planning_flexible_demand_cost"]/ 10 ** 9).to_dataframe()
         res["flexible_demand_capacity_cost"].columns = ["Cost_10e9_euros"]
         res["flexible_demand_capacity_cost"]["type"] = "flexible_demand_capacity"
     
-    if "planning_storage_energy_cost" in model.solution:
-        res["planning_storage_energy_cost"] = (model.solution["planning_storage_energy_cost"]/ 10 ** 9).to_dataframe()
+    if "planning_storage_energy_cost" in solution:
+        res["planning_storage_energy_cost"] = (solution["planning_storage_energy_cost"]/ 10 ** 9).to_dataframe()
         res["planning_storage_energy_cost"].columns = ["Cost_10e9_euros"]
         res["planning_storage_energy_cost"]["type"] = "planning_storage_energy_cost"
     
     return res  # TODO: Implicitly assuming that the second index is conversion_technology... strange
 
 
-def extractEnergyCapacity_l (model):
+def extractEnergyCapacity_l (model, parameters=None):
+    """
+    returns the energy and capacity tables of a solved model
+    :param model: solved linopy model or its solution dataset
+    :param parameters: parameters used to build the model, needed with the compact formulation
+    """
+
+    solution = get_solution_with_costs(model, parameters)
 
     # Initialize results dictionary
     res = dict()
-    res["production"] = (model.solution["operation_conversion_power"]/ 10 ** 6).sum(["date"]).to_dataframe()
+    res["production"] = (solution["operation_conversion_power"]/ 10 ** 6).sum(["date"]).to_dataframe()
     res["production"].columns = ["Energy_TWh"]
     res["production"]["type"] = "annual_energy"
-    res["capacity"] = (model.solution["planning_conversion_power_capacity"]/ 10 ** 3).to_dataframe()
+    res["capacity"] = (solution["planning_conversion_power_capacity"]/ 10 ** 3).to_dataframe()
     res["capacity"].columns = ["Capacity_GW"]
     res["capacity"]["type"] = "installed_capacity"
 
-    if "planning_flexible_demand_max_power_increase" in model.solution:
-        res["flexconso_capacity"]= (model.solution["planning_flexible_demand_cost"]/ 10 ** 3).to_dataframe()
+    if "planning_flexible_demand_max_power_increase" in solution:
+        res["flexconso_capacity"]= (solution["planning_flexible_demand_cost"]/ 10 ** 3).to_dataframe()
         res["flexconso_capacity"].columns = ["Capacity_GW"]
         res["flexconso_capacity"]["type"] = "flexible_demand_capacity"
     
-    if "planning_storage_energy_cost" in model.solution:
-        res["storage_capacity"] = (model.solution["planning_storage_power_capacity"]/ 10 ** 3).to_dataframe()
+    if "planning_storage_energy_cost" in solution:
+        res["storage_capacity"] = (solution["planning_storage_power_capacity"]/ 10 ** 3).to_dataframe()
         res["storage_capacity"].columns = ["Capacity_GW"]
         res["storage_capacity"]["type"] = "storage_capacity"
-        res["Variable_storage_in"] = (model.solution["operation_storage_power_in"] / 10 ** 6).sum(["date"]).to_dataframe()
+        res["Variable_storage_in"] = (solution["operation_storage_power_in"] / 10 ** 6).sum(["date"]).to_dataframe()
         res["Variable_storage_in"].columns = ["Energy_TWh"]
         res["Variable_storage_in"]["type"] = "storage_in"
-        res["Variable_storage_out"] = (model.solution["operation_storage_power_out"] / 10 ** 6).sum(["date"]).to_dataframe()
+        res["Variable_storage_out"] = (solution["operation_storage_power_out"] / 10 ** 6).sum(["date"]).to_dataframe()
         res["Variable_storage_out"].columns = ["Energy_TWh"]
         res["Variable_storage_out"]["type"] = "storage_out"
 
@@ -328,7 +695,9 @@ def extractEnergyCapacity_l (model):
 def EnergyAndExchange2Prod (model, EnergyName: str = 'energy', exchangeName: str = 'Exchange'):
 
     # Create variables dictionary
-    variables_dict = {name: model.solution[name].to_dataframe().reset_index() for name in list(model.solution.keys())}
+    solution = get_solution(model)
+    # only the hourly variables used below are converted (and loaded, for a solution opened with open_results)
+    variables_dict = {name: solution[name].to_dataframe().reset_index() for name in ["operation_conversion_power", "exchange_op_power"]}
     # variables_dict['exchange_op_power'].columns = ['area_from', 'area_from_1', 'exchange_op_power']
     # area_to = variables_dict['operation_conversion_power'].area_to.unique()
 
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from LiPEM.f_tools import get_solution
+
+#### prefixes of the solution variables defined for each weather year (the other ones are shared planning variables)
+weather_year_variable_prefixes = ("operation_", "exchange_")
+
+
+def add_weather_years (parameters, weather_year_series, weights=None):
+    """
+    Returns the parameters with time series given for several weather years (e.g. the demand of
+    f_demand_tools.apply_thermal_sensitivity, availability factors of several climate years) and the probability of
+    each weather year. With these parameters build_single_horizon_multi_energy_LEAP_model creates the operation
+    variables (conversion, storage, exchanges, flexible demand) for each weather year, shares the planning variables
+    and weights the operation costs by weather_year_weight : capacities are planned against all the weather years.
+    The problem can also be solved by a Benders decomposition with one operation subproblem per weather year (see
+    f_decomposition_tools.solve_benders), so that it stays tractable as weather years are added.
+    Usage :
+        exogenous_energy_demand = apply_thermal_sensitivity(fitted, get_weather_year_temperature(temperature, date))
+        parameters = add_weather_years(parameters, exogenous_energy_demand)
+        model = build_single_horizon_multi_energy_LEAP_model(parameters)
+        model.solve(solver_name='highs')
+        extractCosts_l(model.solution.sel(weather_year=1995), select_weather_year(parameters, 1995))
+
+    :param parameters: xarray dataset as returned by read_EAP_input_parameters
+    :param weather_year_series: xarray dataset with the time series of the weather years [weather_year x ... x date],
+    on the dates of the parameters, replacing the ones of the parameters
+    :param weights: probability of each weather year, summing to 1. Default to the same probability for all.
+    :return: xarray dataset with weather_year_weight [weather_year] in addition
+    """
+    weather_year = weather_year_series.get_index("weather_year")
+    weights = np.full(len(weather_year), 1 / len(weather_year)) if weights is None else np.asarray(weights, dtype=float)
+    if len(weights) != len(weather_year) or not np.isclose(weights.sum(), 1):
+        raise ValueError(f"weights should be the probabilities of the {len(weather_year)} weather years, summing to 1")
+    if not weather_year_series.get_index("date").equals(parameters.get_index("date")):
+        raise ValueError("weather_year_series should be given on the dates of the parameters")
+    return parameters.assign(weather_year_series.data_vars).assign(
+        weather_year_weight=xr.DataArray(weights, coords=[weather_year]))
+
+
+def select_weather_year (parameters, weather_year):
+    """
+    returns the parameters of one weather year, without weather year dimension
+    """
+    return parameters.sel(weather_year=weather_year).drop_vars(["weather_year", "weather_year_weight"])
+
+
+def split_weather_years (parameters):
+    """
+    returns the parameters of each weather year (see select_weather_year) and their probabilities
+    :param parameters: xarray dataset with weather_year_weight (see add_weather_years)
+    :return: list of xarray datasets, numpy array of weights
+    """
+    weather_year = parameters.get_index("weather_year")
+    return [select_weather_year(parameters, year) for year in weather_year], parameters["weather_year_weight"].to_numpy()
+
+
+def concat_weather_year_solutions (solutions, weather_year):
+    """
+    gathers the solutions of the weather years (e.g. the subproblems of solve_benders) in one dataset with the same
+    layout as the solution of the model built with weather years : weather_year dimension on the operation variables
+    (see weather_year_variable_prefixes), planning variables of the first solution
+    :param solutions: list of solved linopy models or solution datasets, one per weather year
+    :param weather_year: weather years of the solutions
+    :return: xarray dataset
+    """
+    solutions = [get_solution(solution) for solution in solutions]
+    weather_year = pd.Index(weather_year, name="weather_year")
+    return xr.Dataset({name: xr.concat([solution[name] for solution in solutions], dim=weather_year).transpose(..., "weather_year")
+                       if name.startswith(weather_year_variable_prefixes) else variable
+                       for name, variable in solutions[0].data_vars.items()})
@@ -1,23 +1,38 @@
 import linopy
+import numpy as np
 import xarray as xr
 from linopy import Model
 import os
 import pandas as pd
 import subprocess as sub
 from LiPEM.f_tools import *
+from LiPEM.f_profiling_tools import record_build_step, set_build_block, end_build
 
 
-def build_single_horizon_multi_energy_LEAP_model(parameters):
+def build_single_horizon_multi_energy_LEAP_model(parameters, profiler=None, compact=False):
     """
     This function creates the pyomo model and initlize the parameters and (pyomo) Set values
     :param parameters is a dictionnary with different panda tables :
         - energy_demand: panda table with consumption
         - operation_conversion_availability_factor: panda table
         - conversion_technology_parameters : panda tables indexed by conversion_technology with eco and tech parameters
+        - time_slice_weight (optional): if present the dates are the hours of representative periods
+          (see f_time_aggregation_tools.cluster_representative_periods), yearly quantities are weighted and storage
+          levels are linked between the periods of the year
+        - exchange_link (optional): if present the exchanges are modelled on this list of interconnectors (see
+          f_exchange_tools.add_exchange_links) instead of all the pairs of areas
+        - weather_year_weight (optional): if present the operation variables have a weather_year dimension (one
+          operation per weather year, see f_weather_year_tools.add_weather_years), the planning variables are shared and
+          the operation costs are weighted by the probability of each weather year
+    :param profiler: optional f_profiling_tools.BuildProfiler recording time, memory and size of each build step
+    :param compact: default to False. If True the variables only defined by an equality (planning_conversion_cost,
+    operation_energy_cost, operation_total_hourly_demand, planning_storage_energy_cost, planning_flexible_demand_cost)
+    are not created, their expressions are used in the objective and in Ctr_Op_operation_demand (whose dual is then the
+    opposite of the energy price). The costs are recomputed from the solution by extractCosts_l(model, parameters).
     """
 
     ## Starting with an empty model object
-    m = linopy.Model()
+    m = linopy.Model() if profiler is None else profiler.model()
 
     ### Obtaining dimensions values
     date = parameters.get_index('date').unique()
@@ -27,22 +42,48 @@ def build_single_horizon_multi_energy_LEAP_model(parameters):
     conversion_technology = parameters.get_index('conversion_technology').unique()
     #TODO : remove french
 
-    # Variables - Base - Operation & Planning
-    operation_conversion_power = m.add_variables(name="operation_conversion_power", lower=0, coords=[energy_vector_out,area_to,date,conversion_technology]) ### Energy produced by a production mean at time t
-    operation_energy_cost = m.add_variables(name="operation_energy_cost", lower=0, coords=[area_to,energy_vector_in]) ### Energy total marginal cost for production mean p
-    operation_total_hourly_demand = m.add_variables(name="operation_total_hourly_demand",lower=0, coords=[energy_vector_out, area_to,date])
-    operation_yearly_importation = m.add_variables(name="operation_yearly_importation",lower=0, coords=[area_to, energy_vector_in])
+    ### Time slices : dates can be the hours of representative periods, each hour representing time_slice_weight hours of the year
+    is_time_slice = "time_slice_weight" in parameters
+    time_stamp_weight, date_period = get_time_stamp_weight_and_period(parameters)
+    # True for dates in the same period as the date n steps before (resp. after for negative n)
+    is_same_period_as_shifted_date = lambda n : date_period == date_period.shift(date=n)
+
+    ### Weather years : operation variables defined for each weather year, their costs weighted by its probability
+    weather_year = [parameters.get_index('weather_year')] if "weather_year_weight" in parameters else []
+    operation_weight = get_weather_year_weight(parameters)
+    if is_time_slice and len(weather_year) > 0:
+        raise ValueError("weather years can not be combined with time slices")
 
-    planning_conversion_cost = m.add_variables(name="planning_conversion_cost", lower=0, coords=[energy_vector_out,area_to,conversion_technology]) ### Energy produced by a production mean at time t
-    planning_conversion_power_capacity = m.add_variables(name="planning_conversion_power_capacity", lower=0, coords=[energy_vector_out,area_to,conversion_technology]) ### Energy produced by a production mean at time t
+    ### Existing conversion means : (energy_vector_out, area_to, conversion_technology) triples defined in the conversion_technology table
+    # conversion variables and constraints are only created for them
+    conversion_technology_exists = parameters["energy_vector_in_value"].notnull()
+    if compact and parameters["exogenous_energy_demand"].isnull().any():
+        raise ValueError("compact formulation needs exogenous_energy_demand for all energy_vector_out, area_to and date")
+
+    # Variables - Base - Operation & Planning
+    set_build_block(profiler, "0 - Variables")
+    operation_conversion_power = m.add_variables(name="operation_conversion_power", lower=0, coords=[energy_vector_out,area_to,date,conversion_technology]+weather_year, mask=conversion_technology_exists) ### Energy produced by a production mean at time t
+    if not compact:
+        operation_energy_cost = m.add_variables(name="operation_energy_cost", lower=0, coords=[area_to,energy_vector_in]+weather_year) ### Energy total marginal cost for production mean p
+        operation_total_hourly_demand = m.add_variables(name="operation_total_hourly_demand",lower=0, coords=[energy_vector_out, area_to,date]+weather_year)
+    operation_yearly_importation = m.add_variables(name="operation_yearly_importation",lower=0, coords=[area_to, energy_vector_in]+weather_year)
+
+    if not compact:
+        planning_conversion_cost = m.add_variables(name="planning_conversion_cost", lower=0, coords=[energy_vector_out,area_to,conversion_technology], mask=conversion_technology_exists) ### Energy produced by a production mean at time t
+    ### simple limits on a single variable are bounds of the variable (see get_single_horizon_variable_bounds)
+    bounds = lambda name : dict(zip(["lower", "upper"], get_single_horizon_variable_bounds(parameters, name)))
+    planning_conversion_power_capacity = m.add_variables(name="planning_conversion_power_capacity", **bounds("planning_conversion_power_capacity"), coords=[energy_vector_out,area_to,conversion_technology], mask=conversion_technology_exists) ### Energy produced by a production mean at time t
 
     #operation_total_yearly_demand = m.add_variables(name="operation_total_yearly_demand",lower=0, coords=[energy_vector_out, area_to])
 
     # Variable - Storage - Operation & Planning
     # Objective Function (terms to be added later in the code for storage and flexibility)
-    cost_function = planning_conversion_cost.sum()+ operation_energy_cost.sum()
+    if compact:
+        cost_function = (parameters["planning_conversion_unit_cost"] * planning_conversion_power_capacity).sum() + (operation_weight * parameters["operation_energy_unit_cost"] * operation_yearly_importation).sum()
+    else:
+        cost_function = planning_conversion_cost.sum()+ (operation_weight * operation_energy_cost).sum()
     m.add_objective( cost_function)
-    #TODO : implement time slices
+    record_build_step(profiler, m, "objective", "add_objective")
     #################
     # Constraints   #
     #################
@@ -57,110 +98,123 @@ def build_single_horizon_multi_energy_LEAP_model(parameters):
 
     #####################
     # 1 - a - Main Constraints - Operation (Op) & Planning (Pl)
+    set_build_block(profiler, "1 - Main")
 
-    Ctr_Op_operation_costs = m.add_constraints(name="Ctr_Op_operation_costs",
-        # [ area_to x energy_vector_in ]
-        lhs = operation_energy_cost == parameters["operation_energy_unit_cost"] * operation_yearly_importation)
+    if not compact:
+        Ctr_Op_operation_costs = m.add_constraints(name="Ctr_Op_operation_costs",
+            # [ area_to x energy_vector_in ]
+            lhs = operation_energy_cost == parameters["operation_energy_unit_cost"] * operation_yearly_importation)
 
-    Ctr_Op_conso_hourly = m.add_constraints(name="Ctr_Op_conso_hourly",
-        # [area_to x energy_vector_out x date]
-        lhs = operation_total_hourly_demand == parameters["exogenous_energy_demand"])
+        Ctr_Op_conso_hourly = m.add_constraints(name="Ctr_Op_conso_hourly",
+            # [area_to x energy_vector_out x date]
+            lhs = operation_total_hourly_demand == parameters["exogenous_energy_demand"])
 
     conversion_mean_energy_vector_in = (parameters['energy_vector_in'] == parameters["energy_vector_in_value"])/parameters["operation_conversion_efficiency"]
     Ctr_Op_conso_yearly_1 = m.add_constraints(#name="Ctr_Op_conso_yearly_1",
         # [energy_vector_in x area_to ]
         ## case where energy_vector_in value is not in energy_vector_out (e.g. all but elec), meaning that there is no Ctr_Op_conso_hourly associated constraint
-        operation_yearly_importation == (conversion_mean_energy_vector_in * parameters["time_stamp_length"]*operation_conversion_power).sum(["date","energy_vector_out","conversion_technology"]),
+        operation_yearly_importation == (conversion_mean_energy_vector_in * time_stamp_weight*operation_conversion_power).sum(["date","energy_vector_out","conversion_technology"]),
         mask= ~parameters["operation_energy_unit_cost"]['energy_vector_in'].isin(energy_vector_out))
 
     #parameters["operation_energy_unit_cost"]['energy_vector_in_value']
     #(operation_conversion_power * parameters["operation_conversion_efficiency"]).sum(["conversion_technology"]))
     energy_vector_in_in_energy_vector_out = parameters["operation_energy_unit_cost"]['energy_vector_in']==parameters["energy_vector_out"]
-    Ctr_Op_operation_demand = m.add_constraints(name="Ctr_Op_operation_demand",
-        # [energy_vector_out x area_to ]
-        ## case where energy_vector_in value is in energy_vector_out, meaning that there is Ctr_Op_conso_hourly associated constraint
-        lhs =  operation_total_hourly_demand  == operation_conversion_power.sum(["conversion_technology"])
-    )
+    if compact:
+        Ctr_Op_operation_demand = m.add_constraints(name="Ctr_Op_operation_demand",
+            # [energy_vector_out x area_to ]
+            ## operation_total_hourly_demand replaced by exogenous_energy_demand, moved to the rhs (the terms added below keep the same sign)
+            lhs = - operation_conversion_power.sum(["conversion_technology"]) == - parameters["exogenous_energy_demand"]
+        )
+    else:
+        Ctr_Op_operation_demand = m.add_constraints(name="Ctr_Op_operation_demand",
+            # [energy_vector_out x area_to ]
+            ## case where energy_vector_in value is in energy_vector_out, meaning that there is Ctr_Op_conso_hourly associated constraint
+            lhs =  operation_total_hourly_demand  == operation_conversion_power.sum(["conversion_technology"])
+        )
     #(operation_yearly_importation * energy_vector_in_in_energy_vector_out).sum(["energy_vector_in"]) +
 
     Ctr_Pl_capacity = m.add_constraints(name="Ctr_Pl_capacity", # contrainte de maximum de production
-        lhs = operation_conversion_power <= planning_conversion_power_capacity * parameters["operation_conversion_availability_factor"])
+        lhs = operation_conversion_power <= planning_conversion_power_capacity * parameters["operation_conversion_availability_factor"],
+        mask=conversion_technology_exists)
 
-    Ctr_Pl_planning_conversion_costs = m.add_constraints(name="Ctr_Pl_planning_conversion_costs", # contrainte de définition de planning_conversion_costs
-        lhs = planning_conversion_cost == parameters["planning_conversion_unit_cost"] * planning_conversion_power_capacity )
+    if not compact:
+        Ctr_Pl_planning_conversion_costs = m.add_constraints(name="Ctr_Pl_planning_conversion_costs", # contrainte de définition de planning_conversion_costs
+            lhs = planning_conversion_cost == parameters["planning_conversion_unit_cost"] * planning_conversion_power_capacity,
+            mask=conversion_technology_exists)
 
-    Ctr_Pl_planning_max_capacity = m.add_constraints(name="Ctr_Pl_planning_max_capacity",
-        lhs = planning_conversion_power_capacity <= parameters["planning_conversion_max_capacity"])
-
-    Ctr_Pl_planning_min_capacity = m.add_constraints(name="Ctr_Pl_planning_min_capacity",
-        lhs = planning_conversion_power_capacity >= parameters["planning_conversion_min_capacity"],
-        mask=parameters["planning_conversion_min_capacity"] > 0)
 
 
     #####################
     # 2 - Optional Constraints - Operation (Op) & Planning (Pl)
+    set_build_block(profiler, "2 - Optional")
 
     if "operation_conversion_maximum_working_hours" in parameters: Ctr_Op_stock = m.add_constraints(name="stockCtr",
-            lhs = parameters["operation_conversion_maximum_working_hours"] * planning_conversion_power_capacity >= (parameters["time_stamp_length"]*operation_conversion_power).sum(["date"]),
-            mask = parameters["operation_conversion_maximum_working_hours"] > 0)
+            lhs = parameters["operation_conversion_maximum_working_hours"] * planning_conversion_power_capacity >= (time_stamp_weight*operation_conversion_power).sum(["date"]),
+            mask = conversion_technology_exists * (parameters["operation_conversion_maximum_working_hours"] > 0))
 
     if "operation_max_1h_ramp_rate" in parameters: Ctr_Op_rampPlus = m.add_constraints(name="Ctr_Op_rampPlus",
             lhs = operation_conversion_power.diff("date", n=1) <=planning_conversion_power_capacity
-                  * (parameters["operation_max_1h_ramp_rate"] * parameters["operation_conversion_availability_factor"])  ,
-            mask= (parameters["operation_max_1h_ramp_rate"] > 0) *
-                  (xr.DataArray(date, coords=[date])!=date[0]))
+                  * (parameters["operation_max_1h_ramp_rate"] * parameters["time_stamp_length"] * parameters["operation_conversion_availability_factor"])  ,
+            mask= conversion_technology_exists * (parameters["operation_max_1h_ramp_rate"] > 0) *
+                  is_same_period_as_shifted_date(1))
 
     if "operation_min_1h_ramp_rate" in parameters: Ctr_Op_rampMoins = m.add_constraints(name="Ctr_Op_rampMoins",
             lhs = operation_conversion_power.diff("date", n=1) + planning_conversion_power_capacity
-                  * (parameters["operation_min_1h_ramp_rate"] * parameters["operation_conversion_availability_factor"]) >= 0,
+                  * (parameters["operation_min_1h_ramp_rate"] * parameters["time_stamp_length"] * parameters["operation_conversion_availability_factor"]) >= 0,
             # remark : "-" sign not possible in lhs, hence the inequality alternative formulation
-            mask=(parameters["operation_min_1h_ramp_rate"] > 0) *
-                 (xr.DataArray(date, coords=[date])!=date[0]))
+            mask=conversion_technology_exists * (parameters["operation_min_1h_ramp_rate"] > 0) *
+                 is_same_period_as_shifted_date(1))
 
     if "operation_max_1h_ramp_rate2" in parameters:
         Ctr_Op_rampPlus2 = m.add_constraints(name="Ctr_Op_rampPlus2",
             lhs = operation_conversion_power.diff("date", n=2) <= planning_conversion_power_capacity
-                  * (parameters["operation_max_1h_ramp_rate2"] * parameters["operation_conversion_availability_factor"]),
-            mask=(parameters["operation_max_1h_ramp_rate2"] > 0) *
-                 (xr.DataArray(date, coords=[date])!=date[0]))
+                  * (parameters["operation_max_1h_ramp_rate2"] * parameters["time_stamp_length"] * parameters["operation_conversion_availability_factor"]),
+            mask=conversion_technology_exists * (parameters["operation_max_1h_ramp_rate2"] > 0) *
+                 is_same_period_as_shifted_date(2))
 
     if "operation_min_1h_ramp_rate2" in parameters:
         Ctr_Op_rampMoins2 = m.add_constraints(name="Ctr_Op_rampMoins2",
             lhs = operation_conversion_power.diff("date", n=2)+planning_conversion_power_capacity
-                  * (parameters["operation_min_1h_ramp_rate2"] * parameters["operation_conversion_availability_factor"]) >= 0,
-            mask=(parameters["operation_min_1h_ramp_rate2"] > 0) *
-                 (xr.DataArray(date, coords=[date])!=date[0]))
+                  * (parameters["operation_min_1h_ramp_rate2"] * parameters["time_stamp_length"] * parameters["operation_conversion_availability_factor"]) >= 0,
+            mask=conversion_technology_exists * (parameters["operation_min_1h_ramp_rate2"] > 0) *
+                 is_same_period_as_shifted_date(2))
 
 
 
     #####################
     # 3 -  Storage Constraints - Operation (Op) & Planning (Pl)
+    set_build_block(profiler, "3 - Storage")
 
     if "storage_technology" in parameters:
         storage_technology = parameters.get_index('storage_technology')
 
-        operation_storage_power_in = m.add_variables(name="operation_storage_power_in", lower=0,coords = [date,area_to,energy_vector_out,storage_technology])  ### Energy stored in a storage mean at time t
-        operation_storage_power_out = m.add_variables(name="operation_storage_power_out", lower=0,coords = [date,area_to,energy_vector_out,storage_technology])  ### Energy taken out of a storage mean at time t
-        operation_storage_internal_energy_level = m.add_variables(name="operation_storage_internal_energy_level", lower=0,coords = [date,area_to,energy_vector_out,storage_technology])  ### level of the energy stock in a storage mean at time t
-        planning_storage_energy_cost = m.add_variables(name="planning_storage_energy_cost",coords = [area_to,energy_vector_out,storage_technology])  ### Cost of storage for a storage mean, explicitely defined by definition planning_storage_capacity_costsDef
-        planning_storage_energy_capacity = m.add_variables(name="planning_storage_energy_capacity",coords = [area_to,energy_vector_out,storage_technology])  # Maximum capacity of a storage mean
+        operation_storage_power_in = m.add_variables(name="operation_storage_power_in", lower=0,coords = [date,area_to,energy_vector_out,storage_technology]+weather_year)  ### Energy stored in a storage mean at time t
+        operation_storage_power_out = m.add_variables(name="operation_storage_power_out", lower=0,coords = [date,area_to,energy_vector_out,storage_technology]+weather_year)  ### Energy taken out of a storage mean at time t
+        ### level of the energy stock in a storage mean at time t (with time slices, level relative to the beginning of the representative period)
+        operation_storage_internal_energy_level = m.add_variables(name="operation_storage_internal_energy_level", lower=-np.inf if is_time_slice else 0,coords = [date,area_to,energy_vector_out,storage_technology]+weather_year)
+        if not compact:
+            planning_storage_energy_cost = m.add_variables(name="planning_storage_energy_cost",coords = [area_to,energy_vector_out,storage_technology])  ### Cost of storage for a storage mean, explicitely defined by definition planning_storage_capacity_costsDef
+        planning_storage_energy_capacity = m.add_variables(name="planning_storage_energy_capacity", **bounds("planning_storage_energy_capacity"),coords = [area_to,energy_vector_out,storage_technology])  # Maximum capacity of a storage mean
         planning_storage_power_capacity = m.add_variables(name="planning_storage_power_capacity",coords = [area_to,energy_vector_out,storage_technology])  # Maximum flow of energy in/out of a storage mean
         #storage_op_stockLevel_ini = m.add_variables(name="storage_op_stockLevel_ini",coords = [area_from,storage_technology], lower=0)
 
         #update of the cost function and of the prod = conso constraint
-        m.objective += planning_storage_energy_cost.sum()
+        if compact:
+            m.objective += (parameters["planning_storage_energy_unit_cost"] * planning_storage_energy_capacity).sum()
+        else:
+            m.objective += planning_storage_energy_cost.sum()
+        record_build_step(profiler, m, "objective", "objective +=")
         m.constraints['Ctr_Op_operation_demand'].lhs += -operation_storage_power_out.sum(['storage_technology'])+operation_storage_power_in.sum(['storage_technology'])
+        record_build_step(profiler, m, "Ctr_Op_operation_demand", "lhs +=")
 
-        Ctr_Pl_planning_storage_capacity_costs = m.add_constraints(name="Ctr_Pl_planning_storage_capacity_costs",
-             lhs=planning_storage_energy_cost == parameters["planning_storage_energy_unit_cost"] * planning_storage_energy_capacity)
+        if not compact:
+            Ctr_Pl_planning_storage_capacity_costs = m.add_constraints(name="Ctr_Pl_planning_storage_capacity_costs",
+                 lhs=planning_storage_energy_cost == parameters["planning_storage_energy_unit_cost"] * planning_storage_energy_capacity)
 
         Ctr_Op_storage_level_definition = m.add_constraints(name="Ctr_Op_storage_level_definition",
-            lhs=operation_storage_internal_energy_level.shift(date=-1) == operation_storage_internal_energy_level * (1 - parameters["operation_storage_dissipation"])+parameters["time_stamp_length"]*operation_storage_power_in* parameters["operation_storage_efficiency_in"]
+            lhs=operation_storage_internal_energy_level.shift(date=-1) == operation_storage_internal_energy_level * (1 - parameters["operation_storage_dissipation"]) ** parameters["time_stamp_length"]+parameters["time_stamp_length"]*operation_storage_power_in* parameters["operation_storage_efficiency_in"]
                                                         - parameters["time_stamp_length"]*operation_storage_power_out / parameters["operation_storage_efficiency_out"],
-            mask=xr.DataArray(date, coords=[date]) != date[-1]) # voir si ce filtre est vraiment nécessaire
-
-        Ctr_Op_storage_initial_level = m.add_constraints(name="Ctr_Op_storage_initial_level",
-            lhs= operation_storage_internal_energy_level.loc[{"date" : date[0] }] == operation_storage_internal_energy_level.loc[{"date" : date[-1] }])
+            mask=is_same_period_as_shifted_date(-1)) # voir si ce filtre est vraiment nécessaire
 
         Ctr_Op_storage_power_in_max = m.add_constraints(name="Ctr_Op_storage_power_in_max",
             lhs=operation_storage_power_in <= planning_storage_power_capacity)
@@ -168,87 +222,332 @@ def build_single_horizon_multi_energy_LEAP_model(parameters):
         Ctr_Op_storage_power_out_max = m.add_constraints(name="Ctr_Op_storage_power_out_max",
             lhs=operation_storage_power_out <= planning_storage_power_capacity)
 
-        Ctr_Op_storage_capacity_max = m.add_constraints(name="Ctr_Op_storage_capacity_max",
-            lhs=operation_storage_internal_energy_level <= planning_storage_energy_capacity)
+        if not is_time_slice:
+            Ctr_Op_storage_initial_level = m.add_constraints(name="Ctr_Op_storage_initial_level",
+                lhs= operation_storage_internal_energy_level.loc[{"date" : date[0] }] == operation_storage_internal_energy_level.loc[{"date" : date[-1] }])
 
-        # TODO problem when parameters["planning_storage_max_capacity"] is set to zero
+            Ctr_Op_storage_capacity_max = m.add_constraints(name="Ctr_Op_storage_capacity_max",
+                lhs=operation_storage_internal_energy_level <= planning_storage_energy_capacity)
+        else:
+            # Storage level linked between the periods of the year, each one being represented by a representative period :
+            # level at the beginning of each period + level relative to the beginning of its representative period
+            original_period = parameters.get_index('time_slice_original_period')
+            representative_period = pd.Index(np.unique(date_period), name='time_slice_period')
+            operation_storage_inter_period_level = m.add_variables(name="operation_storage_inter_period_level", lower=0, coords = [original_period,area_to,energy_vector_out,storage_technology])
+            operation_storage_intra_period_max_level = m.add_variables(name="operation_storage_intra_period_max_level", coords = [representative_period,area_to,energy_vector_out,storage_technology])
+            operation_storage_intra_period_min_level = m.add_variables(name="operation_storage_intra_period_min_level", coords = [representative_period,area_to,energy_vector_out,storage_technology])
+            representative_period_last_date = date_period.to_series().reset_index().groupby("time_slice_period")["date"].max()
+            original_period_last_date = xr.DataArray(representative_period_last_date[parameters["time_slice_assignment"].to_numpy()].to_numpy(), coords=[original_period])
+
+            Ctr_Op_storage_intra_period_initial_level = m.add_constraints(name="Ctr_Op_storage_intra_period_initial_level",
+                lhs=operation_storage_internal_energy_level == 0,
+                mask=~is_same_period_as_shifted_date(1))
 
-        Ctr_Pl_storage_max_capacity = m.add_constraints(name="Ctr_Pl_storage_max_capacity",
-             lhs=planning_storage_energy_capacity <= parameters["planning_storage_max_energy_capacity"])
+            Ctr_Op_storage_inter_period_level_definition = m.add_constraints(name="Ctr_Op_storage_inter_period_level_definition",
+                lhs=operation_storage_inter_period_level.roll(time_slice_original_period=-1) == operation_storage_inter_period_level * (1 - parameters["operation_storage_dissipation"]) ** parameters["time_slice_original_period_length"]
+                    + (operation_storage_internal_energy_level * (1 - parameters["operation_storage_dissipation"]) ** parameters["time_stamp_length"] + parameters["time_stamp_length"]*operation_storage_power_in* parameters["operation_storage_efficiency_in"]
+                       - parameters["time_stamp_length"]*operation_storage_power_out / parameters["operation_storage_efficiency_out"]).sel(date=original_period_last_date))
 
-        Ctr_Pl_storage_min_capacity = m.add_constraints(name="Ctr_Pl_storage_min_capacity",
-             lhs=planning_storage_energy_capacity >= parameters["planning_storage_min_energy_capacity"])
+            Ctr_Op_storage_intra_period_max_level = m.add_constraints(name="Ctr_Op_storage_intra_period_max_level",
+                lhs=operation_storage_internal_energy_level <= operation_storage_intra_period_max_level.sel(time_slice_period=date_period))
+
+            Ctr_Op_storage_intra_period_min_level = m.add_constraints(name="Ctr_Op_storage_intra_period_min_level",
+                lhs=operation_storage_internal_energy_level >= operation_storage_intra_period_min_level.sel(time_slice_period=date_period))
+
+            Ctr_Op_storage_capacity_max = m.add_constraints(name="Ctr_Op_storage_capacity_max",
+                lhs=operation_storage_inter_period_level + operation_storage_intra_period_max_level.sel(time_slice_period=parameters["time_slice_assignment"]) <= planning_storage_energy_capacity)
+
+            Ctr_Op_storage_capacity_min = m.add_constraints(name="Ctr_Op_storage_capacity_min",
+                lhs=operation_storage_inter_period_level + operation_storage_intra_period_min_level.sel(time_slice_period=parameters["time_slice_assignment"]) >= 0)
+
+        # TODO problem when parameters["planning_storage_max_capacity"] is set to zero
 
         Ctr_Pl_storage_max_power = m.add_constraints(name="Ctr_Pl_storage_max_power",
              lhs=planning_storage_energy_capacity == planning_storage_power_capacity * parameters["operation_storage_hours_of_stock"])
     #####################
     # 4 -  Exchange Constraints - Operation (Op) & Planning (Pl)
-
-    if len(area_to)>1:
+    set_build_block(profiler, "4 - Exchange")
+
+    if "exchange_link" in parameters:
+        # explicit interconnectors (see f_exchange_tools.add_exchange_links) : one power per link, positive from exchange_link_area_from to exchange_link_area_to
+        exchange_link = parameters.get_index('exchange_link')
+        exchange_link_power = m.add_variables(name="exchange_link_power", **bounds("exchange_link_power"), coords = [date, exchange_link, energy_vector_out]+weather_year)
+        # imports and exports of each area, reindexed on all the areas (linopy aligns expressions of the same size by position)
+        exchange_link_import = exchange_link_power.groupby(parameters["exchange_link_area_to"].rename("area_to")).sum().reindex(area_to=area_to)
+        exchange_link_export = exchange_link_power.groupby(parameters["exchange_link_area_from"].rename("area_to")).sum().reindex(area_to=area_to)
+        m.constraints['Ctr_Op_operation_demand'].lhs += - exchange_link_import + exchange_link_export
+        record_build_step(profiler, m, "Ctr_Op_operation_demand", "lhs +=")
+        # one way links are penalised as exchange_op_power, the power of two way links can not be penalised linearly
+        m.objective += 0.01 * (operation_weight * time_stamp_weight * exchange_link_power.where(parameters["operation_exchange_link_reverse_max_capacity"] == 0)).sum()
+        record_build_step(profiler, m, "objective", "objective +=")
+
+    elif len(area_to)>1:
         area_from=  parameters.get_index('area_from')
-        exchange_op_power = m.add_variables(name="exchange_op_power", lower=0,coords = [date, area_to,area_from,energy_vector_out])  ### Energy stored in a storage mean at time t
+        exchange_op_power = m.add_variables(name="exchange_op_power", **bounds("exchange_op_power"),coords = [date, area_to,area_from,energy_vector_out]+weather_year)  ### Energy stored in a storage mean at time t
         #TODO utiliser swap_dims https://docs.xarray.dev/en/stable/generated/xarray.Dataset.swap_dims.html#xarray.Dataset.swap_dims
         m.constraints['Ctr_Op_operation_demand'].lhs += - exchange_op_power.sum(['area_from']) + exchange_op_power.rename({'area_to':'area_from','area_from':'area_to'}).sum(['area_from'])
-        Ctr_Op_exchange_max = m.add_constraints(name="Ctr_Op_exchange_max",
-            lhs=exchange_op_power<= parameters["operation_exchange_max_capacity"])
-        m.objective += 0.01 * exchange_op_power.sum()
+        record_build_step(profiler, m, "Ctr_Op_operation_demand", "lhs +=")
+        m.objective += 0.01 * (operation_weight * time_stamp_weight * exchange_op_power).sum()
+        record_build_step(profiler, m, "objective", "objective +=")
         #TODO change area_from_1 area_from_from  area_from_to
 
 
     # Flex consumption
+    set_build_block(profiler, "5 - DSM")
     if "flexible_demand" in parameters:
         flexible_demand = parameters.get_index('flexible_demand')
         # inscrire les équations ici ?
         # planning_flexible_demand_max_power_increase_cost_costs = "flexible_demand_planning_cost" * planning_flexible_demand_max_power_increase_cost
         # operation_total_hourly_demand <= planning_flexible_demand_max_power_increase_cost + "max_power"
-        # operation_flexible_demand +"flexible_demand_to_optimise"*operation_flexible_demand_variation_ratio == "flexible_demand_to_optimise"
+        # "flexible_demand_to_optimise"*(1-"flexible_demand_ratio_max") <= operation_flexible_demand <= "flexible_demand_to_optimise"*(1+"flexible_demand_ratio_max")
         operation_flexible_demand = m.add_variables(name="operation_flexible_demand",
-                                             lower=0, coords=[date, area_to,energy_vector_out,flexible_demand])
+                                             **bounds("operation_flexible_demand"), coords=[date, area_to,energy_vector_out,flexible_demand]+weather_year)
         planning_flexible_demand_max_power_increase = m.add_variables(name="planning_flexible_demand_max_power_increase",
                                                  lower=0, coords=[area_to,energy_vector_out,flexible_demand])
-        planning_flexible_demand_cost = m.add_variables(name="planning_flexible_demand_cost",
-                                                        lower=0,   coords=[area_to,energy_vector_out,flexible_demand])
-        operation_flexible_demand_variation_ratio = m.add_variables(name="operation_flexible_demand_variation_ratio",coords=[date,area_to,energy_vector_out,flexible_demand])
+        if not compact:
+            planning_flexible_demand_cost = m.add_variables(name="planning_flexible_demand_cost",
+                                                            lower=0,   coords=[area_to,energy_vector_out,flexible_demand])
 
         # update of the cost function and of the prod = conso constraint
-        m.objective += planning_flexible_demand_cost.sum()
+        if compact:
+            m.objective += (parameters["flexible_demand_planning_unit_cost"] * planning_flexible_demand_max_power_increase).sum()
+        else:
+            m.objective += planning_flexible_demand_cost.sum()
+        record_build_step(profiler, m, "objective", "objective +=")
         m.constraints['Ctr_Op_operation_demand'].lhs += operation_flexible_demand.sum(['flexible_demand'])
+        record_build_step(profiler, m, "Ctr_Op_operation_demand", "lhs +=")
 
-        Ctr_Op_planning_flexible_demand_max_power_increase_def = m.add_constraints(name="Ctr_Op_planning_flexible_demand_max_power_increase_def",
-            lhs=planning_flexible_demand_cost == parameters["flexible_demand_planning_unit_cost"] * planning_flexible_demand_max_power_increase)
+        if not compact:
+            Ctr_Op_planning_flexible_demand_max_power_increase_def = m.add_constraints(name="Ctr_Op_planning_flexible_demand_max_power_increase_def",
+                lhs=planning_flexible_demand_cost == parameters["flexible_demand_planning_unit_cost"] * planning_flexible_demand_max_power_increase)
 
         Ctr_Oplanning_storage_max_power_power = m.add_constraints(name="Ctr_Oplanning_storage_max_power_power",
             lhs=operation_flexible_demand <= planning_flexible_demand_max_power_increase + parameters["flexible_demand_max_power"])
 
-        Ctr_Op_conso_flex = m.add_constraints(name="Ctr_Op_conso_flex",
-            lhs=operation_flexible_demand +parameters["flexible_demand_to_optimise"]*operation_flexible_demand_variation_ratio == parameters["flexible_demand_to_optimise"])
-
-        Ctr_Op_conso_flex_sup_rule = m.add_constraints(name="Ctr_Op_conso_flex_sup_rule",
-            lhs=operation_flexible_demand_variation_ratio <= parameters["flexible_demand_ratio_max"])
 
-        Ctr_Op_conso_flex_inf_rule = m.add_constraints(name="Ctr_Op_conso_flex_inf_rule",
-            lhs=operation_flexible_demand_variation_ratio + parameters["flexible_demand_ratio_max"] >= 0 )
-
-
-        week_of_year_table = period_boolean_table(date, period="weekofyear")
+        week_of_year = period_index(date, period="weekofyear")
         Ctr_Op_consum_eq_week = m.add_constraints(name="Ctr_Op_consum_eq_week",
-            lhs=(operation_flexible_demand*week_of_year_table).sum(["date"])
-                == (parameters["flexible_demand_to_optimise"]*week_of_year_table).sum(["date"]),
+            lhs=(parameters["time_stamp_length"]*operation_flexible_demand).groupby(week_of_year).sum()
+                == (parameters["time_stamp_length"]*parameters["flexible_demand_to_optimise"]).groupby(week_of_year).sum(),
             mask = parameters["flexible_demand_period"] == "week")
 
-        day_of_year_table = period_boolean_table(date, period="day_of_year")
+        day_of_year = period_index(date, period="day_of_year")
         Ctr_Op_consum_eq_day = m.add_constraints(name="Ctr_Op_consum_eq_day",
-            lhs=(operation_flexible_demand*day_of_year_table).sum(["date"])
-                == (parameters["flexible_demand_to_optimise"]*day_of_year_table).sum(["date"]),
+            lhs=(parameters["time_stamp_length"]*operation_flexible_demand).groupby(day_of_year).sum()
+                == (parameters["time_stamp_length"]*parameters["flexible_demand_to_optimise"]).groupby(day_of_year).sum(),
             mask = parameters["flexible_demand_period"] == "day")
 
         Ctr_Op_consum_eq_year = m.add_constraints(name="Ctr_Op_consum_eq_year",
-            lhs=(operation_flexible_demand).sum(["date"])
-                == (parameters["flexible_demand_to_optimise"]).sum(["date"]),
+            lhs=(time_stamp_weight*operation_flexible_demand).sum(["date"])
+                == (time_stamp_weight*parameters["flexible_demand_to_optimise"]).sum(["date"]),
             mask = parameters["flexible_demand_period"] == "year")
 
-
+    end_build(profiler)
     return m;
 
 
+def get_time_stamp_weight_and_period(parameters):
+    """
+    returns the number of hours of the year represented by each date (time_stamp_length, multiplied by
+    time_slice_weight with time slices) and the representative period of each date (0 for all dates without time slices)
+    """
+    if "time_slice_weight" in parameters:
+        return parameters["time_stamp_length"] * parameters["time_slice_weight"], parameters["time_slice_period"]
+    return parameters["time_stamp_length"], xr.DataArray(0, coords=[parameters.get_index('date').unique()])
+
+
+def get_weather_year_weight(parameters):
+    """
+    returns the weight of the operation costs : the probability of each weather year (weather_year_weight) if the
+    parameters have weather years, 1 otherwise
+    """
+    return parameters["weather_year_weight"] if "weather_year_weight" in parameters else 1
 
+
+def get_single_horizon_variable_bounds(parameters, name):
+    """
+    returns the (lower, upper) bounds of variable name in build_single_horizon_multi_energy_LEAP_model : capacity and
+    exchange limits, and flexible demand within flexible_demand_ratio_max of flexible_demand_to_optimise. Missing
+    parameters give infinite bounds (no limit).
+    """
+    if name == "planning_conversion_power_capacity":
+        return parameters["planning_conversion_min_capacity"].fillna(0).clip(min=0), parameters["planning_conversion_max_capacity"].fillna(np.inf)
+    if name == "planning_storage_energy_capacity":
+        return parameters["planning_storage_min_energy_capacity"].fillna(-np.inf), parameters["planning_storage_max_energy_capacity"].fillna(np.inf)
+    if name == "exchange_op_power":
+        return 0, parameters["operation_exchange_max_capacity"].fillna(np.inf)
+    if name == "exchange_link_power":
+        return -parameters["operation_exchange_link_reverse_max_capacity"].fillna(np.inf), parameters["operation_exchange_link_max_capacity"].fillna(np.inf)
+    if name == "operation_flexible_demand":
+        flexible_demand_to_optimise, ratio_max = parameters["flexible_demand_to_optimise"], parameters["flexible_demand_ratio_max"]
+        return (flexible_demand_to_optimise * (1 - ratio_max)).clip(min=0).fillna(0), (flexible_demand_to_optimise * (1 + ratio_max)).fillna(np.inf)
+    raise ValueError(f"{name} has no bounds depending on the parameters")
+
+
+### constraints of build_single_horizon_multi_energy_LEAP_model depending on each updatable parameter
+single_horizon_updated_constraints = {
+    "operation_conversion_availability_factor" : ["Ctr_Pl_capacity", "Ctr_Op_rampPlus", "Ctr_Op_rampMoins", "Ctr_Op_rampPlus2", "Ctr_Op_rampMoins2"],
+    "operation_energy_unit_cost" : ["Ctr_Op_operation_costs"],
+    "exogenous_energy_demand" : ["Ctr_Op_conso_hourly"],
+    "planning_conversion_unit_cost" : ["Ctr_Pl_planning_conversion_costs"],
+    "operation_conversion_maximum_working_hours" : ["stockCtr"],
+    "operation_max_1h_ramp_rate" : ["Ctr_Op_rampPlus"],
+    "operation_min_1h_ramp_rate" : ["Ctr_Op_rampMoins"],
+    "operation_max_1h_ramp_rate2" : ["Ctr_Op_rampPlus2"],
+    "operation_min_1h_ramp_rate2" : ["Ctr_Op_rampMoins2"],
+    "planning_storage_energy_unit_cost" : ["Ctr_Pl_planning_storage_capacity_costs"],
+    "operation_storage_hours_of_stock" : ["Ctr_Pl_storage_max_power"],
+    "flexible_demand_planning_unit_cost" : ["Ctr_Op_planning_flexible_demand_max_power_increase_def"],
+    "flexible_demand_max_power" : ["Ctr_Oplanning_storage_max_power_power"],
+    "flexible_demand_to_optimise" : ["Ctr_Op_consum_eq_week", "Ctr_Op_consum_eq_day", "Ctr_Op_consum_eq_year"],
+}
+### variables of build_single_horizon_multi_energy_LEAP_model whose bounds depend on each updatable parameter
+single_horizon_updated_bounds = {
+    "planning_conversion_max_capacity" : ["planning_conversion_power_capacity"],
+    "planning_conversion_min_capacity" : ["planning_conversion_power_capacity"],
+    "planning_storage_max_energy_capacity" : ["planning_storage_energy_capacity"],
+    "planning_storage_min_energy_capacity" : ["planning_storage_energy_capacity"],
+    "operation_exchange_max_capacity" : ["exchange_op_power"],
+    "operation_exchange_link_max_capacity" : ["exchange_link_power"],
+    "operation_exchange_link_reverse_max_capacity" : ["exchange_link_power"],
+    "flexible_demand_ratio_max" : ["operation_flexible_demand"],
+    "flexible_demand_to_optimise" : ["operation_flexible_demand"],
+}
+### parameters of single_horizon_updated_constraints that are objective coefficients in the compact formulation
+single_horizon_compact_objective_parameters = ["operation_energy_unit_cost", "planning_conversion_unit_cost",
+                                               "planning_storage_energy_unit_cost", "flexible_demand_planning_unit_cost"]
+
+
+def update_single_horizon_multi_energy_LEAP_model(model, parameters, updated_parameters, verbose=False):
+    """
+    Updates in place a model built by build_single_horizon_multi_energy_LEAP_model after a change of some parameters,
+    so that scenarios can be solved without rebuilding the model : only the coefficients and right hand sides of the
+    constraints, and the bounds of the variables, depending on the updated parameters are rewritten (see
+    single_horizon_updated_constraints and single_horizon_updated_bounds).
+    Usage :
+        parameters["planning_conversion_max_capacity"].loc[{"conversion_technology" :"old_nuke"}]=80000
+        update_single_horizon_multi_energy_LEAP_model(model, parameters, ["planning_conversion_max_capacity"])
+        model.solve(solver_name='highs')
+    A constraint that was not created at build time (e.g. a ramp constraint of a technology with a zero ramp rate,
+    or a maximum working hours that was zero) cannot be created by an update, a ValueError is raised and the model has to be
+    rebuilt. Constraints that are no longer needed (e.g. a ramp rate set to zero) are relaxed.
+    With the compact formulation, unit costs are updated in the objective and exogenous_energy_demand in the right
+    hand side of Ctr_Op_operation_demand.
+    :param model: linopy model built by build_single_horizon_multi_energy_LEAP_model
+    :param parameters: xarray dataset with the updated values, with the same coordinates as the one used to build the model
+    :param updated_parameters: list of the names of the updated parameters, keys of single_horizon_updated_constraints
+    or single_horizon_updated_bounds
+    :param verbose: default to False. If True print the updated constraints and variables.
+    """
+    updatable_parameters = list(dict.fromkeys(list(single_horizon_updated_constraints) + list(single_horizon_updated_bounds)))
+    unknown_parameters = [name for name in updated_parameters if name not in updatable_parameters]
+    if len(unknown_parameters) > 0:
+        raise ValueError(f"parameters {unknown_parameters} can not be updated, the model has to be rebuilt. "
+                         f"Updatable parameters are {updatable_parameters}")
+
+    constraint_names = [name for parameter in updated_parameters for name in single_horizon_updated_constraints.get(parameter, [])]
+    for name in dict.fromkeys(constraint_names):
+        if name not in model.constraints:
+            continue
+        constraint, mask = _single_horizon_constraint_definition(model, parameters, name)
+        _update_constraint(model, model.constraints[name], constraint, mask)
+        if verbose: print(f"{name} updated")
+
+    variable_names = [name for parameter in updated_parameters for name in single_horizon_updated_bounds.get(parameter, [])]
+    for name in dict.fromkeys(variable_names):
+        if name not in model.variables:
+            continue
+        variable = model.variables[name]
+        lower, upper = get_single_horizon_variable_bounds(parameters, name)
+        as_variable = lambda bound : xr.DataArray(bound).broadcast_like(variable.labels).transpose(*variable.labels.dims)
+        variable.lower, variable.upper = as_variable(lower), as_variable(upper)
+        if verbose: print(f"{name} bounds updated")
+
+    if "operation_total_hourly_demand" not in model.variables: # compact formulation
+        if any(parameter in single_horizon_compact_objective_parameters for parameter in updated_parameters):
+            model.add_objective(_single_horizon_compact_objective(model, parameters), overwrite=True)
+            if verbose: print("objective updated")
+        if "exogenous_energy_demand" in updated_parameters:
+            model.constraints["Ctr_Op_operation_demand"].rhs = - parameters["exogenous_energy_demand"]
+            if verbose: print("Ctr_Op_operation_demand updated")
+
+
+def _single_horizon_compact_objective(model, parameters):
+    # same objective as in build_single_horizon_multi_energy_LEAP_model with compact=True
+    v = model.variables
+    time_stamp_weight, _ = get_time_stamp_weight_and_period(parameters)
+    operation_weight = get_weather_year_weight(parameters)
+    objective = (parameters["planning_conversion_unit_cost"] * v["planning_conversion_power_capacity"]).sum() + \
+                (operation_weight * parameters["operation_energy_unit_cost"] * v["operation_yearly_importation"]).sum()
+    if "planning_storage_energy_capacity" in v:
+        objective += (parameters["planning_storage_energy_unit_cost"] * v["planning_storage_energy_capacity"]).sum()
+    if "exchange_op_power" in v:
+        objective += 0.01 * (operation_weight * time_stamp_weight * v["exchange_op_power"]).sum()
+    if "exchange_link_power" in v:
+        objective += 0.01 * (operation_weight * time_stamp_weight * v["exchange_link_power"].where(parameters["operation_exchange_link_reverse_max_capacity"] == 0)).sum()
+    if "planning_flexible_demand_max_power_increase" in v:
+        objective += (parameters["flexible_demand_planning_unit_cost"] * v["planning_flexible_demand_max_power_increase"]).sum()
+    return objective
+
+
+def _single_horizon_constraint_definition(model, parameters, name):
+    # same definition and mask as in build_single_horizon_multi_energy_LEAP_model for the constraints of single_horizon_updated_constraints
+    v = model.variables
+    time_stamp_weight, date_period = get_time_stamp_weight_and_period(parameters)
+    is_same_period_as_shifted_date = lambda n : date_period == date_period.shift(date=n)
+    conversion_technology_exists = parameters["energy_vector_in_value"].notnull()
+
+    if name == "Ctr_Op_operation_costs":
+        return v["operation_energy_cost"] == parameters["operation_energy_unit_cost"] * v["operation_yearly_importation"], None
+    if name == "Ctr_Op_conso_hourly":
+        return v["operation_total_hourly_demand"] == parameters["exogenous_energy_demand"], None
+    if name == "Ctr_Pl_capacity":
+        return v["operation_conversion_power"] <= v["planning_conversion_power_capacity"] * parameters["operation_conversion_availability_factor"], conversion_technology_exists
+    if name == "Ctr_Pl_planning_conversion_costs":
+        return v["planning_conversion_cost"] == parameters["planning_conversion_unit_cost"] * v["planning_conversion_power_capacity"], conversion_technology_exists
+    if name == "stockCtr":
+        return parameters["operation_conversion_maximum_working_hours"] * v["planning_conversion_power_capacity"] >= (time_stamp_weight*v["operation_conversion_power"]).sum(["date"]), \
+               conversion_technology_exists * (parameters["operation_conversion_maximum_working_hours"] > 0)
+    if name in ["Ctr_Op_rampPlus", "Ctr_Op_rampMoins", "Ctr_Op_rampPlus2", "Ctr_Op_rampMoins2"]:
+        n = 2 if name.endswith("2") else 1
+        ramp_rate = parameters[{"Ctr_Op_rampPlus": "operation_max_1h_ramp_rate", "Ctr_Op_rampMoins": "operation_min_1h_ramp_rate",
+                                "Ctr_Op_rampPlus2": "operation_max_1h_ramp_rate2", "Ctr_Op_rampMoins2": "operation_min_1h_ramp_rate2"}[name]]
+        ramp_capacity = v["planning_conversion_power_capacity"] * (ramp_rate * parameters["time_stamp_length"] * parameters["operation_conversion_availability_factor"])
+        mask = conversion_technology_exists * (ramp_rate > 0) * is_same_period_as_shifted_date(n)
+        if "Plus" in name:
+            return v["operation_conversion_power"].diff("date", n=n) <= ramp_capacity, mask
+        return v["operation_conversion_power"].diff("date", n=n) + ramp_capacity >= 0, mask
+    if name == "Ctr_Pl_planning_storage_capacity_costs":
+        return v["planning_storage_energy_cost"] == parameters["planning_storage_energy_unit_cost"] * v["planning_storage_energy_capacity"], None
+    if name == "Ctr_Pl_storage_max_power":
+        return v["planning_storage_energy_capacity"] == v["planning_storage_power_capacity"] * parameters["operation_storage_hours_of_stock"], None
+    if name == "Ctr_Op_planning_flexible_demand_max_power_increase_def":
+        return v["planning_flexible_demand_cost"] == parameters["flexible_demand_planning_unit_cost"] * v["planning_flexible_demand_max_power_increase"], None
+    if name == "Ctr_Oplanning_storage_max_power_power":
+        return v["operation_flexible_demand"] <= v["planning_flexible_demand_max_power_increase"] + parameters["flexible_demand_max_power"], None
+    if name in ["Ctr_Op_consum_eq_week", "Ctr_Op_consum_eq_day"]:
+        period = period_index(parameters.get_index('date').unique(), period="weekofyear" if name.endswith("week") else "day_of_year")
+        return (parameters["time_stamp_length"]*v["operation_flexible_demand"]).groupby(period).sum() == (parameters["time_stamp_length"]*parameters["flexible_demand_to_optimise"]).groupby(period).sum(), \
+               parameters["flexible_demand_period"] == name.split("_")[-1]
+    if name == "Ctr_Op_consum_eq_year":
+        return (time_stamp_weight*v["operation_flexible_demand"]).sum(["date"]) == (time_stamp_weight*parameters["flexible_demand_to_optimise"]).sum(["date"]), \
+               parameters["flexible_demand_period"] == "year"
+    raise ValueError(f"{name} is not an updatable constraint")
+
+
+def _update_constraint(model, constraint, definition, mask):
+    # rewrites lhs and rhs of constraint, rows masked in the new definition lose their variables and are masked as
+    # well, whatever their sign (an infinite rhs would only relax inequalities)
+    lhs, rhs = definition.lhs, definition.rhs
+    if mask is not None:
+        mask = mask.broadcast_like(constraint.labels).astype(bool)
+        if (mask & (constraint.labels == -1)).any():
+            raise ValueError(f"new rows of {constraint.name} would be needed by the update, the model has to be rebuilt")
+        if (~mask & (constraint.labels != -1)).any():
+            lhs, rhs = lhs.where(mask), rhs.where(mask, 0)
+    constraint.lhs = lhs
+    constraint.rhs = rhs
+    constraint.sanitize_missings()
+    constraint.sanitize_infinities()
+    # registering the constraint again resets the label index cached by the model since the previous solve
+    model.constraints.add(constraint)
@@ -0,0 +1,50 @@
+import os
+import sys
+sys.path.extend(['.'])
+import itertools
+import pandas as pd
+
+pd.options.display.width = 0
+pd.set_option('display.max_columns', 500)
+
+from LiPEM.f_synthetic_data_tools import generate_synthetic_parameters
+from LiPEM.f_profiling_tools import BuildProfiler
+from LiPEM.f_solver_tools import solve_model
+from LiPEM.model_single_horizon_multi_energy import build_single_horizon_multi_energy_LEAP_model
+
+results_folder = "case_studies/synthetic_scaling/results/"
+if not os.path.exists(results_folder):
+    os.makedirs(results_folder)
+
+#### grid of instance sizes, edit to explore other sizes
+grid = dict(n_areas=[1, 3, 7],
+            n_hours=[24 * 7, 24 * 28, 24 * 91],
+            n_conversion_technologies=[4, 8],
+            n_storage_technologies=[2],
+            n_flexible_demands=[3])
+solve = True # set to False to only benchmark the build
+io_api = "direct" # "direct" passes the model to HiGHS in memory, "lp" or "mps" through a file
+trace_memory = True # memory tracing slows down the build, set to False for build times closer to untraced runs
+
+benchmark = list()
+for sizes in itertools.product(*grid.values()):
+    sizes = dict(zip(grid.keys(), sizes))
+    parameters = generate_synthetic_parameters(**sizes)
+
+    profiler = BuildProfiler(trace_memory=trace_memory)
+    model = build_single_horizon_multi_energy_LEAP_model(parameters, profiler=profiler)
+    profile = profiler.to_dataframe()
+    total = profile.iloc[-1]
+    result = dict(sizes, build_time_s=total["wall_time_s"], build_peak_memory_increase_MB=total["peak_memory_increase_MB"],
+                  n_variables=model.variables.nvars, n_constraints=model.constraints.ncons, n_nonzeros=total["n_nonzeros"])
+
+    if solve:
+        timings = solve_model(model, solver_name='highs', io_api=io_api)
+        result.update({"solve_" + name: value for name, value in timings.items()})
+        result["objective"] = model.objective.value
+    print(result)
+    benchmark.append(result)
+
+benchmark = pd.DataFrame(benchmark)
+benchmark.to_csv(results_folder + "benchmark_scaling.csv", index=False)
+print(benchmark)
@@ -0,0 +1,40 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import warnings
+
+import pytest
+
+from LiPEM.f_synthetic_data_tools import generate_synthetic_parameters
+from LiPEM.model_single_horizon_multi_energy import build_single_horizon_multi_energy_LEAP_model
+
+#### options of the HiGHS solves of the tests
+solver_options = dict(io_api="direct", output_flag=False)
+
+
+@pytest.fixture(autouse=True)
+def ignore_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+
+@pytest.fixture(scope="session")
+def synthetic_parameters():
+    """
+    small synthetic instance : 2 areas, 2 days, storage and flexible demands. Copy it before modifying it.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return generate_synthetic_parameters(n_areas=2, n_hours=48, seed=0)
+
+
+def solve(parameters, **build_options):
+    """
+    builds build_single_horizon_multi_energy_LEAP_model and solves it with HiGHS
+    :return: solved linopy model
+    """
+    model = build_single_horizon_multi_energy_LEAP_model(parameters, **build_options)
+    model.solve(solver_name="highs", **solver_options)
+    assert model.status == "ok"
+    return model
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from LiPEM.f_decomposition_tools import solve_rolling_horizon_dispatch, solve_benders
+from LiPEM.f_tools import extractCosts_l
+from conftest import solve, solver_options
+
+
+def test_dispatch_in_one_window_gives_the_full_operation_cost(synthetic_parameters):
+    model = solve(synthetic_parameters)
+    dispatch = solve_rolling_horizon_dispatch(synthetic_parameters, model, window_length=48, look_ahead=0,
+                                              solver_options=solver_options, max_workers=1)
+    operation_cost = lambda solution: extractCosts_l(solution)["operation_energy_cost"]["Cost_10e9_euros"].sum()
+    assert np.isclose(operation_cost(dispatch), operation_cost(model), rtol=1e-6)
+
+
+def test_dispatch_windows_share_the_working_hours_budget(synthetic_parameters):
+    # capacities planned without working hours limit, dispatched with a budget of 10 hours over the 2 days
+    model = solve(synthetic_parameters)
+    parameters = synthetic_parameters.copy(deep=True)
+    parameters["operation_conversion_maximum_working_hours"] = xr.zeros_like(parameters["planning_conversion_unit_cost"])
+    parameters["operation_conversion_maximum_working_hours"].loc[dict(conversion_technology="ccgt")] = 10.
+    dispatch = solve_rolling_horizon_dispatch(parameters, model, window_length=12, look_ahead=6,
+                                              solver_options=solver_options, max_workers=1)
+    assert dispatch.get_index("date").equals(parameters.get_index("date"))
+    ccgt = dict(conversion_technology="ccgt")
+    budget = 10. * model.solution["planning_conversion_power_capacity"].sel(ccgt)
+    assert (model.solution["operation_conversion_power"].sel(ccgt).sum("date") > budget).all()
+    assert (dispatch["operation_conversion_power"].sel(ccgt).sum("date") <= budget * (1 + 1e-6)).all()
+
+
+def test_benders_converges_to_the_full_objective(synthetic_parameters):
+    full_objective = solve(synthetic_parameters).objective.value
+    solutions, report = solve_benders(synthetic_parameters, solver_options=dict(solver_options, threads=1), tolerance=1e-4)
+    assert report["gap"].iloc[-1] <= 1e-4
+    assert report["upper_bound"].iloc[-1] == pytest.approx(full_objective, rel=1e-4)
+    assert report["lower_bound"].iloc[-1] <= full_objective * (1 + 1e-6)
+    assert (report["lower_bound"].diff().dropna() >= -1e-6 * full_objective).all()
+    assert len(solutions) == 1 and "planning_conversion_power_capacity" in solutions[0]
+
+
+def test_benders_subproblems_need_a_capacity_without_planning_cost(synthetic_parameters):
+    parameters = synthetic_parameters.copy()
+    parameters["planning_conversion_unit_cost"] = parameters["planning_conversion_unit_cost"].where(
+        parameters["conversion_technology"] != "demand_not_served", 1.)
+    with pytest.raises(ValueError, match="demand_not_served"):
+        solve_benders(parameters, solver_options=dict(solver_options, threads=1), max_iterations=2)
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from LiPEM.f_demand_tools import apply_thermal_sensitivity, decompose_demand, fit_thermal_sensitivity, \
+    get_weather_year_temperature, load_thermal_sensitivity, recompose_demand, save_thermal_sensitivity
+
+#### thermal sensitivity (MW/°C) of the synthetic demand below 15°C
+synthetic_thermal_sensitivity = 1500.
+
+
+@pytest.fixture(scope="module")
+def temperature_and_demand():
+    """
+    one year of hourly temperatures and demands of 2 areas, with a demand increasing linearly below 15°C
+    """
+    rng = np.random.default_rng(0)
+    date = pd.date_range("2018-01-01", periods=8760, freq="h", name="date")
+    area_to = pd.Index(["area_0", "area_1"], name="area_to")
+    energy_vector_out = pd.Index(["electricity"], name="energy_vector_out")
+    temperature = 10 + 10 * np.cos(np.arange(8760) / 8760 * 2 * np.pi) + rng.normal(0, 3, (2, 8760))
+    demand = 50000 - synthetic_thermal_sensitivity * np.minimum(temperature - 15, 0) + rng.normal(0, 1000, (2, 8760))
+    temperature = xr.DataArray(temperature[None], coords=[energy_vector_out, area_to, date]).rename("temperature")
+    demand = xr.DataArray(demand[None], coords=[energy_vector_out, area_to, date]).rename("exogenous_energy_demand")
+    return temperature.to_dataset(), demand.to_dataset()
+
+
+@pytest.fixture(scope="module")
+def thermal_sensitivity(temperature_and_demand):
+    temperature, _ = temperature_and_demand
+    return xr.DataArray([[-2000., -1000.]], coords=[temperature.get_index("energy_vector_out"),
+                                                    temperature.get_index("area_to")]).rename("thermal_sensitivity").to_dataset()
+
+
+def test_decompose_demand(temperature_and_demand):
+    temperature, demand = temperature_and_demand
+    decomposed = decompose_demand(temperature, demand)
+    assert decomposed["thermal_sensitivity_estimate"].sizes["hour"] == 24
+    assert np.allclose(decomposed["thermal_sensitivity_estimate"], -synthetic_thermal_sensitivity, rtol=0.1)
+    xr.testing.assert_allclose(decomposed["thermal_sensitive"] + decomposed["non_thermal_sensitive"],
+                               demand["exogenous_energy_demand"])
+
+
+def test_recompose_demand_with_the_target_thermal_sensitivity(temperature_and_demand, thermal_sensitivity):
+    temperature, demand = temperature_and_demand
+    decomposed = decompose_demand(temperature, demand)
+    recomposed = recompose_demand(decomposed, temperature, thermal_sensitivity)
+    cold_dates = temperature["temperature"] <= 15
+    expected = decomposed["non_thermal_sensitive"] - \
+               cold_dates * thermal_sensitivity["thermal_sensitivity"] * (temperature["temperature"] - 15)
+    xr.testing.assert_allclose(recomposed["exogenous_energy_demand"], expected.transpose(*recomposed["exogenous_energy_demand"].dims))
+
+
+def test_apply_thermal_sensitivity_to_the_reference_year(temperature_and_demand, thermal_sensitivity, tmp_path):
+    temperature, demand = temperature_and_demand
+    save_thermal_sensitivity(fit_thermal_sensitivity(temperature, demand, thermal_sensitivity), tmp_path / "fitted.nc")
+    fitted = load_thermal_sensitivity(tmp_path / "fitted.nc")
+    expected = recompose_demand(decompose_demand(temperature, demand), temperature, thermal_sensitivity)
+    xr.testing.assert_allclose(apply_thermal_sensitivity(fitted, temperature), expected)
+    # without target, the demand of the reference year is given back
+    fitted = fit_thermal_sensitivity(temperature, demand)
+    xr.testing.assert_allclose(apply_thermal_sensitivity(fitted, temperature), demand)
+
+
+def test_weather_year_temperature(temperature_and_demand):
+    temperature, _ = temperature_and_demand
+    series_date = pd.date_range("2015-01-01", "2017-12-31 23:00", freq="h", name="date")
+    series = xr.DataArray(np.arange(len(series_date), dtype=float), coords=[series_date]).rename("temperature").to_dataset()
+    weather_year_temperature = get_weather_year_temperature(series, temperature.get_index("date"))
+    assert weather_year_temperature.get_index("weather_year").tolist() == [2015, 2016, 2017]
+    assert weather_year_temperature.get_index("date").equals(temperature.get_index("date"))
+    assert float(weather_year_temperature["temperature"].sel(weather_year=2016, date="2018-03-01 05:00")) == \
+           float(series["temperature"].sel(date="2016-02-29 05:00"))  # same hour of the year
+    # leap reference year : the last day takes the temperature of the previous day
+    leap_date = pd.date_range("2020-01-01", periods=8784, freq="h", name="date")
+    leap_temperature = get_weather_year_temperature(series, leap_date)["temperature"]
+    assert int(leap_temperature.isnull().sum()) == 0
+    assert float(leap_temperature.sel(weather_year=2015, date="2020-12-31 00:00")) == \
+           float(series["temperature"].sel(date="2015-12-31 00:00"))
+    # applied to the fitted demand, one demand per weather year
+    fitted = fit_thermal_sensitivity(*temperature_and_demand)
+    demand = apply_thermal_sensitivity(fitted, temperature.expand_dims(weather_year=[2015, 2016]))
+    assert demand["exogenous_energy_demand"].dims == ("weather_year", "energy_vector_out", "area_to", "date")
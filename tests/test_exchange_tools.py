@@ -0,0 +1,26 @@
+import numpy as np
+
+from LiPEM.f_exchange_tools import add_exchange_links, expand_exchange_link_solution
+from conftest import solve
+
+
+def test_one_way_links_give_the_objective_of_the_pairs_of_areas(synthetic_parameters):
+    full = solve(synthetic_parameters)
+    parameters = add_exchange_links(synthetic_parameters, signed=False)
+    links = solve(parameters)
+    assert np.isclose(links.objective.value, full.objective.value, rtol=1e-6)
+    exchange = expand_exchange_link_solution(links, parameters)["exchange_op_power"]
+    assert exchange.dims == full.solution["exchange_op_power"].dims
+    assert np.isclose(exchange.sum(), full.solution["exchange_op_power"].sum(), rtol=1e-3)
+
+
+def test_signed_links(synthetic_parameters):
+    parameters = add_exchange_links(synthetic_parameters)
+    # one link per pair of connected areas, bounded by the capacities of both directions
+    assert parameters.sizes["exchange_link"] == 1
+    model = solve(parameters)
+    # same feasible set as the pairs of areas, without the penalty of the two way exchanges
+    assert model.objective.value <= solve(synthetic_parameters).objective.value * (1 + 1e-6)
+    exchange = expand_exchange_link_solution(model, parameters)["exchange_op_power"]
+    assert (exchange >= 0).all()
+    assert (exchange <= synthetic_parameters["operation_exchange_max_capacity"].fillna(np.inf) * (1 + 1e-6)).all()
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from LiPEM.f_tools import period_index, extractCosts_l
+from LiPEM.model_single_horizon_multi_energy import build_single_horizon_multi_energy_LEAP_model, update_single_horizon_multi_energy_LEAP_model, \
+    get_single_horizon_variable_bounds
+from conftest import solve, solver_options
+
+
+def test_flexible_demand_period_sums(synthetic_parameters):
+    solution = solve(synthetic_parameters).solution
+    date = synthetic_parameters.get_index("date")
+    period = synthetic_parameters["flexible_demand_period"]
+    for name, group in [("day", period_index(date, period="day_of_year")), ("week", period_index(date, period="weekofyear"))]:
+        optimised = solution["operation_flexible_demand"].groupby(group).sum()
+        to_optimise = synthetic_parameters["flexible_demand_to_optimise"].groupby(group).sum()
+        assert_close_where(optimised, to_optimise, period == name)
+    assert_close_where(solution["operation_flexible_demand"].sum("date"), synthetic_parameters["flexible_demand_to_optimise"].sum("date"), period == "year")
+
+
+def assert_close_where(actual, expected, condition, rtol=1e-6):
+    actual, expected = actual.where(condition, 0), expected.where(condition, 0)
+    xr.testing.assert_allclose(actual, expected.transpose(*actual.dims), rtol=rtol)
+
+
+def test_conversion_variables_only_for_existing_conversion_means(synthetic_parameters):
+    # nuke removed from area_1 : no variables instead of variables bounded to zero
+    removed = dict(area_to="area_1", conversion_technology="nuke")
+    without_nuke = synthetic_parameters.copy(deep=True)
+    without_nuke["energy_vector_in_value"].loc[removed] = np.nan
+    zero_capacity = synthetic_parameters.copy(deep=True)
+    zero_capacity["planning_conversion_max_capacity"].loc[removed] = 0
+
+    model = solve(without_nuke)
+    labels = model.variables["operation_conversion_power"].labels
+    assert (labels.sel(removed) == -1).all()
+    assert (labels.sel(area_to="area_0") != -1).all()
+    assert np.isclose(model.objective.value, solve(zero_capacity).objective.value, rtol=1e-6)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_update_gives_the_objective_of_a_rebuild(synthetic_parameters, compact):
+    model = solve(synthetic_parameters, compact=compact)
+    variant = synthetic_parameters.copy(deep=True)
+    variant["planning_conversion_max_capacity"].loc[dict(conversion_technology="nuke")] = 1000.
+    variant["exogenous_energy_demand"] = variant["exogenous_energy_demand"] * 1.1
+    variant["operation_conversion_availability_factor"] = variant["operation_conversion_availability_factor"] * 0.9
+    variant["operation_energy_unit_cost"] = variant["operation_energy_unit_cost"] * 1.5
+    update_single_horizon_multi_energy_LEAP_model(model, variant, ["planning_conversion_max_capacity", "exogenous_energy_demand",
+                                                                  "operation_conversion_availability_factor", "operation_energy_unit_cost"])
+    model.solve(solver_name="highs", **solver_options)
+    assert np.isclose(model.objective.value, solve(variant, compact=compact).objective.value, rtol=1e-6)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_update_of_equality_constraints_gives_the_objective_of_a_rebuild(synthetic_parameters, compact):
+    model = solve(synthetic_parameters, compact=compact)
+    variant = synthetic_parameters.copy(deep=True)
+    variant["exogenous_energy_demand"] = variant["exogenous_energy_demand"] * 1.1
+    variant["flexible_demand_to_optimise"] = variant["flexible_demand_to_optimise"] * 1.2
+    # the yearly energy of the yearly flexible demand is no longer imposed : its equality rows are masked
+    variant["flexible_demand_period"] = variant["flexible_demand_period"].where(variant["flexible_demand_period"] != "year", "none")
+    update_single_horizon_multi_energy_LEAP_model(model, variant, ["exogenous_energy_demand", "flexible_demand_to_optimise"])
+    assert (model.constraints["Ctr_Op_consum_eq_year"].labels == -1).all()
+    model.solve(solver_name="highs", **solver_options)
+    assert model.status == "ok"
+    assert np.isclose(model.objective.value, solve(variant, compact=compact).objective.value, rtol=1e-6)
+
+
+def test_update_of_a_missing_constraint_raises(synthetic_parameters):
+    model = build_single_horizon_multi_energy_LEAP_model(synthetic_parameters)
+    variant = synthetic_parameters.copy(deep=True)
+    variant["operation_max_1h_ramp_rate"] = variant["operation_max_1h_ramp_rate"] * 0 + 0.1
+    with pytest.raises(ValueError):
+        update_single_horizon_multi_energy_LEAP_model(model, variant, ["operation_max_1h_ramp_rate"])
+
+
+def test_compact_formulation_gives_the_full_objective_and_costs(synthetic_parameters):
+    full, compact = solve(synthetic_parameters), solve(synthetic_parameters, compact=True)
+    assert "operation_total_hourly_demand" not in compact.variables
+    assert np.isclose(compact.objective.value, full.objective.value, rtol=1e-6)
+    full_costs, compact_costs = extractCosts_l(full), extractCosts_l(compact, synthetic_parameters)
+    for name, table in full_costs.items():
+        assert np.isclose(compact_costs[name]["Cost_10e9_euros"].sum(), table["Cost_10e9_euros"].sum(), rtol=1e-6)
+
+
+def test_bounds_give_the_objective_of_explicit_constraints(synthetic_parameters):
+    bounded = solve(synthetic_parameters)
+    # same limits written as constraints, the variables only keep their sign
+    model = build_single_horizon_multi_energy_LEAP_model(synthetic_parameters)
+    for name in ["planning_conversion_power_capacity", "exchange_op_power", "operation_flexible_demand"]:
+        variable = model.variables[name]
+        lower, upper = get_single_horizon_variable_bounds(synthetic_parameters, name)
+        lower, upper = [xr.DataArray(bound).broadcast_like(variable.labels) for bound in (lower, upper)]
+        variable.lower, variable.upper = xr.zeros_like(variable.lower), xr.full_like(variable.upper, np.inf)
+        model.add_constraints(variable <= upper.fillna(0), name=f"Ctr_upper_{name}", mask=np.isfinite(upper))
+        model.add_constraints(variable >= lower.fillna(0), name=f"Ctr_lower_{name}", mask=lower > 0)
+    model.solve(solver_name="highs", **solver_options)
+    assert np.isclose(model.objective.value, bounded.objective.value, rtol=1e-6)
+    upper = bounded.variables["planning_conversion_power_capacity"].upper
+    xr.testing.assert_equal(upper, synthetic_parameters["planning_conversion_max_capacity"].fillna(np.inf).transpose(*upper.dims))
@@ -0,0 +1,26 @@
+import tracemalloc
+
+from LiPEM.f_profiling_tools import BuildProfiler
+from LiPEM.model_single_horizon_multi_energy import build_single_horizon_multi_energy_LEAP_model
+
+
+def test_build_profile(synthetic_parameters):
+    profiler = BuildProfiler()
+    model = build_single_horizon_multi_energy_LEAP_model(synthetic_parameters, profiler=profiler)
+    profile = profiler.to_dataframe()
+    total = profile.iloc[-1]
+    assert total["name"] == "total"
+    assert total["n_variables"] == model.variables.nvars
+    assert total["n_constraints"] == model.constraints.ncons
+    assert total["peak_memory_increase_MB"] > 0
+    # tracing started by the profiler is stopped at the end of the build
+    assert not tracemalloc.is_tracing()
+
+
+def test_build_profile_keeps_tracing_started_before(synthetic_parameters):
+    tracemalloc.start()
+    try:
+        build_single_horizon_multi_energy_LEAP_model(synthetic_parameters, profiler=BuildProfiler())
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
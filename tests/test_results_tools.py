@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+import xarray as xr
+
+from LiPEM.f_results_tools import save_results, open_results, solve_with_cache
+from LiPEM.f_tools import extractCosts_l
+from conftest import solve, solver_options
+
+
+def test_saved_results_open_lazily(synthetic_parameters, tmp_path):
+    model = solve(synthetic_parameters)
+    save_results(model, tmp_path / "results.nc", synthetic_parameters, date_chunk=24)
+    solution, parameters, duals = open_results(tmp_path / "results.nc")
+    assert solution["operation_conversion_power"].chunks is not None
+    xr.testing.assert_allclose(solution["operation_conversion_power"].load(), model.solution["operation_conversion_power"])
+    xr.testing.assert_allclose(parameters["exogenous_energy_demand"].load(), synthetic_parameters["exogenous_energy_demand"])
+    xr.testing.assert_allclose(duals["Ctr_Op_operation_demand"].load(), model.constraints["Ctr_Op_operation_demand"].dual)
+    for name, table in extractCosts_l(model).items():
+        assert np.isclose(extractCosts_l(solution)[name]["Cost_10e9_euros"].sum(), table["Cost_10e9_euros"].sum())
+
+
+def test_solution_only_results(synthetic_parameters, tmp_path):
+    save_results(solve(synthetic_parameters).solution, tmp_path / "results.nc")
+    solution, parameters, duals = open_results(tmp_path / "results.nc")
+    assert parameters is None and duals is None
+
+
+def test_solve_with_cache(synthetic_parameters, tmp_path):
+    options = dict(solver_options=solver_options)
+    solution, _, _ = solve_with_cache(synthetic_parameters, tmp_path, **options)
+    assert len(os.listdir(tmp_path)) == 1
+    # hit : same entry, no new solve
+    cached_solution, _, _ = solve_with_cache(synthetic_parameters, tmp_path, **options)
+    assert len(os.listdir(tmp_path)) == 1
+    xr.testing.assert_identical(cached_solution.load(), solution.load())
+    # other parameters : new entry, the least recently used one is evicted when the cache is full
+    variant = synthetic_parameters.copy(deep=True)
+    variant["exogenous_energy_demand"] = variant["exogenous_energy_demand"] * 1.1
+    variant_solution, _, _ = solve_with_cache(variant, tmp_path, max_cache_size_GB=0., **options)
+    assert len(os.listdir(tmp_path)) == 1
+    assert not variant_solution["operation_conversion_power"].load().equals(solution["operation_conversion_power"])
@@ -0,0 +1,30 @@
+import numpy as np
+
+from LiPEM import f_scenario_tools
+from LiPEM.f_scenario_tools import run_scenario_sweep, get_max_parallel_workers
+from conftest import solver_options
+
+
+def test_scenario_sweep(synthetic_parameters, monkeypatch):
+    # the synthetic instance stands for the workbooks of the scenarios
+    read_options = list()
+    def read_EAP_input_parameters(**options):
+        read_options.append(options)
+        return synthetic_parameters.copy(deep=True)
+    monkeypatch.setattr(f_scenario_tools, "read_EAP_input_parameters", read_EAP_input_parameters)
+
+    results = run_scenario_sweep(
+        scenarios={"reference": {}, "no_ccgt": {"workbook": "reference",
+                                                "overrides": [("planning_conversion_max_capacity", {"conversion_technology": "ccgt"}, 0.)]}},
+        input_data_folder="", solver_options=solver_options, max_workers=1)
+    assert list(results.get_index("scenario")) == ["reference", "no_ccgt"]
+    assert [options["file_id"] for options in read_options] == ["EU_7_2050_reference", "EU_7_2050_reference"]
+    # the sheets are parsed in the scenario process
+    assert all(options["max_workers"] == 1 for options in read_options)
+    ccgt_capacity = results["Capacity_GW-installed_capacity"].sel(conversion_technology="ccgt").sum("area_to")
+    assert np.isclose(ccgt_capacity.sel(scenario="no_ccgt"), 0) and ccgt_capacity.sel(scenario="reference") > 0
+
+
+def test_max_parallel_workers():
+    assert get_max_parallel_workers(threads_per_worker=1, memory_per_worker_GB=1.) >= 1
+    assert get_max_parallel_workers(threads_per_worker=10 ** 6, memory_per_worker_GB=10. ** 6) == 1
@@ -0,0 +1,26 @@
+import numpy as np
+
+from LiPEM.f_solver_tools import solve_model, save_warm_start, load_warm_start, solve_with_warm_start
+from LiPEM.model_single_horizon_multi_energy import build_single_horizon_multi_energy_LEAP_model
+from conftest import solve, solver_options
+
+
+def test_warm_start_gives_the_objective_of_a_cold_start(synthetic_parameters, tmp_path):
+    model = solve(synthetic_parameters)
+    save_warm_start(model, tmp_path / "warm_start.nc")
+    variant = synthetic_parameters.copy(deep=True)
+    variant["exogenous_energy_demand"] = variant["exogenous_energy_demand"] * 1.05
+    variant_model = build_single_horizon_multi_energy_LEAP_model(variant)
+    solve_with_warm_start(variant_model, load_warm_start(tmp_path / "warm_start.nc"), **solver_options)
+    assert variant_model.status == "ok"
+    assert np.isclose(variant_model.objective.value, solve(variant).objective.value, rtol=1e-6)
+
+
+def test_solve_model_timings(synthetic_parameters):
+    reference = solve(synthetic_parameters).objective.value
+    for io_api in ["direct", "lp"]:
+        model = build_single_horizon_multi_energy_LEAP_model(synthetic_parameters)
+        timings = solve_model(model, solver_name="highs", io_api=io_api, output_flag=False)
+        assert timings["io_api"] == io_api
+        assert np.isclose(timings["total_time_s"], timings["export_time_s"] + timings["solver_time_s"] + timings["readback_time_s"])
+        assert np.isclose(model.objective.value, reference, rtol=1e-6)
@@ -0,0 +1,16 @@
+import xarray as xr
+
+from LiPEM.f_synthetic_data_tools import generate_synthetic_parameters
+
+
+def test_synthetic_parameters_sizes_and_seed():
+    parameters = generate_synthetic_parameters(n_areas=3, n_hours=72, n_conversion_technologies=6,
+                                               n_storage_technologies=1, n_flexible_demands=0, seed=1)
+    assert parameters.sizes["area_to"] == 3 and parameters.sizes["date"] == 72
+    # demand_not_served is always added
+    assert parameters.sizes["conversion_technology"] == 7
+    assert parameters.sizes["storage_technology"] == 1
+    assert "flexible_demand" not in parameters.dims
+    xr.testing.assert_identical(parameters, generate_synthetic_parameters(n_areas=3, n_hours=72, n_conversion_technologies=6,
+                                                                          n_storage_technologies=1, n_flexible_demands=0, seed=1))
+    assert not parameters["exogenous_energy_demand"].equals(generate_synthetic_parameters(n_areas=3, n_hours=72, seed=2)["exogenous_energy_demand"])
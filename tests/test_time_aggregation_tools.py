@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from LiPEM.f_synthetic_data_tools import generate_synthetic_parameters
+from LiPEM.f_time_aggregation_tools import cluster_representative_periods, expand_resampled_solution, \
+    expand_time_slice_solution, resample_parameters
+from conftest import solve
+
+
+def test_time_slices_with_all_periods_give_the_full_objective(synthetic_parameters):
+    # each day represents itself : same model as the hourly one, storage levels linked between the days
+    reduced = cluster_representative_periods(synthetic_parameters, n_representative_periods=2, period="day")
+    assert (reduced["time_slice_weight"] == 1).all()
+    full_objective = solve(synthetic_parameters).objective.value
+    assert np.isclose(solve(reduced).objective.value, full_objective, rtol=1e-6)
+
+
+def test_expand_time_slice_solution(synthetic_parameters):
+    reduced = cluster_representative_periods(synthetic_parameters, n_representative_periods=1, period="day")
+    assert len(reduced.get_index("date")) == 24
+    expanded = expand_time_slice_solution(solve(reduced), reduced)
+    assert expanded.get_index("date").equals(synthetic_parameters.get_index("date"))
+    assert (expanded["operation_storage_internal_energy_level"] >= -1e-6).all()
+
+
+@pytest.fixture(scope="module")
+def three_weeks_parameters():
+    """
+    three weeks of parameters with a calm second week, the seasonal storage (storage_hydro) being cheap enough to
+    carry energy from the windy weeks, and the hourly objective
+    """
+    parameters = generate_synthetic_parameters(n_areas=2, n_hours=21 * 24, seed=0)
+    parameters["planning_storage_energy_unit_cost"].loc[dict(storage_technology="storage_hydro")] = 10.
+    wind_factor = xr.DataArray(np.repeat([1., 0.2, 1.], 7 * 24), coords=[parameters.get_index("date")])
+    parameters["operation_conversion_availability_factor"].loc[dict(conversion_technology="wind")] *= wind_factor
+    return parameters, solve(parameters).objective.value
+
+
+@pytest.mark.parametrize("n_representative_periods", [3, 7])
+def test_representative_days_of_three_weeks(three_weeks_parameters, n_representative_periods):
+    parameters, full_objective = three_weeks_parameters
+    assert set(parameters["flexible_demand_period"].to_numpy().ravel()) == {"day", "week", "year"}
+    reduced = cluster_representative_periods(parameters, n_representative_periods=n_representative_periods, period="day")
+    assert len(reduced.get_index("date")) == 24 * n_representative_periods
+    model = solve(reduced)
+    # objective within 0.5% of the hourly one (about 0.2% with 3 days, 0.05% with 7 days)
+    assert model.objective.value == pytest.approx(full_objective, rel=5e-3)
+    # seasonal storage : the level at the beginning of the days varies, the hourly levels stay within the capacity
+    inter_period_level = model.solution["operation_storage_inter_period_level"].sel(storage_technology="storage_hydro")
+    assert float(inter_period_level.max() - inter_period_level.min()) > 1e4
+    expanded = expand_time_slice_solution(model, reduced)
+    level = expanded["operation_storage_internal_energy_level"]
+    assert (level >= -1e-6).all()
+    assert (level <= model.solution["planning_storage_energy_capacity"] + 1e-6).all()
+    # yearly flexible demand of the expanded solution : the one of the representative days repeated on the year
+    is_year = parameters["flexible_demand_period"] == "year"
+    yearly_flexible_demand = expanded["operation_flexible_demand"].sum("date").where(is_year, 0)
+    represented_flexible_demand = reduced["flexible_demand_to_optimise"].sel(date=reduced["time_slice_date"]).sum("original_date")
+    xr.testing.assert_allclose(yearly_flexible_demand, represented_flexible_demand.where(is_year, 0).
+                               transpose(*yearly_flexible_demand.dims), rtol=1e-6)
+
+
+def test_resampling_by_one_hour_gives_the_hourly_objective(synthetic_parameters):
+    resampled = resample_parameters(synthetic_parameters, time_step=1)
+    assert np.isclose(solve(resampled).objective.value, solve(synthetic_parameters).objective.value, rtol=1e-6)
+
+
+def test_expand_resampled_solution(synthetic_parameters):
+    resampled = resample_parameters(synthetic_parameters, time_step=3)
+    assert len(resampled.get_index("date")) == 16
+    assert (resampled["time_stamp_length"] == 3).all()
+    model = solve(resampled)
+    expanded = expand_resampled_solution(model, resampled)
+    assert expanded.get_index("date").equals(synthetic_parameters.get_index("date"))
+    # energies over the original hours are the energies of the blocks
+    power = model.solution["operation_conversion_power"]
+    assert np.isclose(float(expanded["operation_conversion_power"].sum()), float((power * 3).sum()), rtol=1e-9)
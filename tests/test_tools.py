@@ -0,0 +1,198 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import LiPEM.f_tools
+from LiPEM.f_synthetic_data_tools import generate_synthetic_parameters
+from LiPEM.f_tools import clear_input_components_cache, convert_excel_to_parquet, get_cached_input_component, \
+    get_excel_sheet_keys, get_file_hash, get_subset_netcdf_data, input_components_cache, read_EAP_input_parameters, \
+    read_input_sources, read_parquet_table, select_existing_values
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_input_components_cache()
+    yield
+    clear_input_components_cache()
+
+
+def write_workbook(file, demand):
+    """
+    writes a small workbook with a demand sheet and a technologies sheet
+    """
+    with pd.ExcelWriter(file) as writer:
+        pd.DataFrame({"area_to": ["FR", "DE"], "value": demand}).to_excel(writer, sheet_name="demand", index=False)
+        pd.DataFrame({"conversion_technology": ["ccgt", "nuke"], "value": [1., 2.]}). \
+            to_excel(writer, sheet_name="technologies", index=False)
+
+
+def test_cached_input_component_is_computed_once_and_copied():
+    calls = []
+    compute = lambda: calls.append(1) or xr.DataArray([1., 2.], dims="area_to")
+    component = get_cached_input_component(("component",), compute)
+    component[0] = 0.
+    assert get_cached_input_component(("component",), compute).values.tolist() == [1., 2.]
+    assert len(calls) == 1
+    get_cached_input_component(("component",), compute, use_cache=False)
+    assert len(calls) == 2
+    clear_input_components_cache()
+    assert len(input_components_cache) == 0
+
+
+def test_excel_sheet_keys_change_with_the_modified_sheet_only(tmp_path):
+    write_workbook(tmp_path / "reference.xlsx", [1., 2.])
+    write_workbook(tmp_path / "scenario.xlsx", [1., 3.])
+    reference_keys = get_excel_sheet_keys(tmp_path / "reference.xlsx")
+    scenario_keys = get_excel_sheet_keys(tmp_path / "scenario.xlsx")
+    assert set(reference_keys) == {"demand", "technologies"}
+    assert reference_keys["technologies"] == scenario_keys["technologies"]
+    assert reference_keys["demand"] != scenario_keys["demand"]
+
+
+def test_file_hash_of_files_and_folders(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("a")
+    folder_hash = get_file_hash(tmp_path / "data")
+    assert get_file_hash(tmp_path / "data" / "a.txt") == get_file_hash(tmp_path / "b.txt")
+    (tmp_path / "data" / "c.txt").write_text("c")
+    assert get_file_hash(tmp_path / "data") != folder_hash
+
+
+def write_netcdf(file):
+    """
+    writes a small netcdf file of availability factors [area_to x date]
+    """
+    date = pd.date_range("2018-01-01", periods=72, freq="h")
+    xr.Dataset({"availability_factor": (("area_to", "date"), [[0.5] * 72, [0.25] * 72])},
+               coords=dict(area_to=["FR", "DE"], date=date)).to_netcdf(file)
+
+
+def test_select_existing_values_ignores_missing_values():
+    ds = xr.Dataset({"value": ("area_to", [1., 2.])}, coords=dict(area_to=["FR", "DE"]))
+    assert select_existing_values(ds, dict(area_to=["DE", "ES"])).get_index("area_to").tolist() == ["DE"]
+    assert select_existing_values(ds, dict(area_to=None)).sizes["area_to"] == 2
+
+
+def test_read_input_sources_in_the_current_process(tmp_path):
+    write_workbook(tmp_path / "input.xlsx", [1., 2.])
+    write_netcdf(tmp_path / "availability.nc")
+    sources, timings = read_input_sources(tmp_path / "input.xlsx", ["demand", "technologies"],
+                                          {tmp_path / "availability.nc": dict(area_to=["FR"])}, max_workers=1)
+    pd.testing.assert_frame_equal(sources["demand"], pd.read_excel(tmp_path / "input.xlsx", "demand"))
+    assert sources[tmp_path / "availability.nc"].get_index("area_to").tolist() == ["FR"]
+    assert set(timings) == {"demand", "technologies", "availability.nc"}
+
+
+def test_parquet_table_gives_the_selected_rows_of_the_sheet(tmp_path):
+    date = pd.date_range("2018-01-01", periods=48, freq="h")
+    demand = pd.DataFrame({"area_to": ["FR"] * 48 + ["DE"] * 48, "date": list(date) * 2, "value": range(96)})
+    demand.to_excel(tmp_path / "input.xlsx", sheet_name="electricity_demand", index=False)
+    convert_excel_to_parquet(f"{tmp_path}/", "input", sheets=["electricity_demand"])
+    table = read_parquet_table(tmp_path / "input_parquet" / "electricity_demand", dict(area_to=["DE"]),
+                               date_range=("2018-01-01", "2018-01-01"))
+    expected = demand[(demand["area_to"] == "DE") & (demand["date"] < "2018-01-02")]
+    pd.testing.assert_frame_equal(table.sort_values("date")[list(demand.columns)].reset_index(drop=True),
+                                  expected.reset_index(drop=True), check_dtype=False)
+
+
+def test_subset_netcdf_data_in_a_date_window(tmp_path):
+    write_netcdf(tmp_path / "availability.nc")
+    data = get_subset_netcdf_data(tmp_path / "availability.nc", dict(area_to=["DE"]),
+                                  date_range=("2018-01-02", "2018-01-02"))
+    assert data.get_index("area_to").tolist() == ["DE"]
+    assert data.get_index("date").equals(pd.date_range("2018-01-02", periods=24, freq="h"))
+    assert (data["availability_factor"] == 0.25).all()
+
+
+def write_input_workbook(file, parameters, nuke_unit_cost=None):
+    """
+    writes the sheets read by read_EAP_input_parameters (without demand side management) from synthetic parameters,
+    with temperatures above the threshold of 15°C so that the demand is given back unchanged whatever the dates read
+    """
+    conversion_technology = parameters[["energy_vector_in_value", "operation_conversion_efficiency",
+                                        "planning_conversion_unit_cost", "planning_conversion_max_capacity",
+                                        "planning_conversion_min_capacity", "operation_max_1h_ramp_rate",
+                                        "operation_min_1h_ramp_rate"]].to_dataframe().reset_index()
+    if nuke_unit_cost is not None:
+        conversion_technology.loc[conversion_technology["conversion_technology"] == "nuke", "planning_conversion_unit_cost"] = nuke_unit_cost
+    storage_technology = parameters[["planning_storage_energy_unit_cost", "operation_storage_dissipation",
+                                     "operation_storage_efficiency_in", "operation_storage_efficiency_out",
+                                     "planning_storage_max_energy_capacity", "planning_storage_min_energy_capacity",
+                                     "operation_storage_hours_of_stock"]].to_dataframe().reset_index()
+    electricity = lambda name: parameters[name].sel(energy_vector_out="electricity", drop=True).to_dataframe().reset_index()
+    temperature = 20 + np.random.default_rng(0).uniform(0, 5, (parameters.sizes["date"], parameters.sizes["area_to"]))
+    temperature = pd.DataFrame(temperature, index=parameters.get_index("date"), columns=parameters.get_index("area_to"))
+    with pd.ExcelWriter(file) as writer:
+        conversion_technology.to_excel(writer, sheet_name="conversion_technology", index=False)
+        parameters["operation_energy_unit_cost"].to_dataframe().reset_index().to_excel(writer, sheet_name="energy_vector_in", index=False)
+        parameters["operation_conversion_availability_factor"].to_dataframe().reset_index(). \
+            to_excel(writer, sheet_name="operation_conversion_availabili", index=False)
+        electricity("operation_exchange_max_capacity").to_excel(writer, sheet_name="interconnexions", index=False)
+        storage_technology.to_excel(writer, sheet_name="storage_technology", index=False)
+        electricity("exogenous_energy_demand").to_excel(writer, sheet_name="electricity_demand", index=False)
+        temperature.stack().rename("temperature").reset_index().to_excel(writer, sheet_name="temperature", index=False)
+        pd.DataFrame({"area_to": parameters.get_index("area_to"), "thermal_sensitivity": -1000.}). \
+            to_excel(writer, sheet_name="thermal_sensitivity", index=False)
+
+
+@pytest.fixture(scope="module")
+def input_workbooks(tmp_path_factory):
+    """
+    folder with a reference workbook and a scenario workbook differing by the conversion_technology sheet only
+    """
+    folder = tmp_path_factory.mktemp("input")
+    parameters = generate_synthetic_parameters(n_areas=2, n_hours=24 * 7, n_flexible_demands=0)
+    write_input_workbook(folder / "reference.xlsx", parameters)
+    write_input_workbook(folder / "scenario.xlsx", parameters, nuke_unit_cost=1.)
+    return f"{folder}/", parameters
+
+
+def read_input_workbook(folder, file_id, **kwargs):
+    return read_EAP_input_parameters(folder, file_id, is_demand_management=False,
+                                     selected_storage_technology=["battery", "storage_hydro"], **kwargs)
+
+
+def test_read_input_parameters_reuses_the_cached_sheets_of_another_workbook(input_workbooks, monkeypatch):
+    folder, _ = input_workbooks
+    read_sheets = []
+    def spy_read_input_sources(excel_file, sheets, *args, **kwargs):
+        read_sheets.append(sorted(sheets))
+        return read_input_sources(excel_file, sheets, *args, **kwargs)
+    monkeypatch.setattr(LiPEM.f_tools, "read_input_sources", spy_read_input_sources)
+    reference = read_input_workbook(folder, "reference")
+    assert len(read_sheets[0]) == 8 and len(input_components_cache) > 0  # miss : every sheet is read
+    xr.testing.assert_identical(read_input_workbook(folder, "reference"), reference)
+    assert read_sheets[1] == []  # hit : nothing is read
+    scenario = read_input_workbook(folder, "scenario")
+    assert read_sheets[2] == ["conversion_technology"]  # only the modified sheet is read again
+    assert (scenario["planning_conversion_unit_cost"].sel(conversion_technology="nuke") == 1.).all()
+    xr.testing.assert_identical(scenario.drop_vars("planning_conversion_unit_cost"),
+                                reference.drop_vars("planning_conversion_unit_cost"))
+    xr.testing.assert_identical(read_input_workbook(folder, "reference", use_cache=False), reference)
+
+
+def test_read_input_parameters_from_parquet_as_from_excel(input_workbooks, tmp_path):
+    folder, parameters = input_workbooks
+    shutil.copy(f"{folder}reference.xlsx", tmp_path)
+    convert_excel_to_parquet(f"{tmp_path}/", "reference")
+    excel = read_input_workbook(folder, "reference", use_cache=False)
+    xr.testing.assert_allclose(excel["exogenous_energy_demand"],
+                               parameters["exogenous_energy_demand"].transpose(*excel["exogenous_energy_demand"].dims))
+    xr.testing.assert_allclose(read_input_workbook(f"{tmp_path}/", "reference", use_cache=False), excel)
+
+
+@pytest.mark.parametrize("is_parquet", [False, True])
+def test_read_input_parameters_in_a_date_window(input_workbooks, tmp_path, is_parquet):
+    folder, _ = input_workbooks
+    if is_parquet:
+        shutil.copy(f"{folder}reference.xlsx", tmp_path)
+        convert_excel_to_parquet(f"{tmp_path}/", "reference")
+        folder = f"{tmp_path}/"
+    date_range = ("2018-01-03", "2018-01-05 23:00")
+    window = read_input_workbook(folder, "reference", date_range=date_range, use_cache=False)
+    assert window.sizes["date"] == 72
+    xr.testing.assert_allclose(window, read_input_workbook(folder, "reference", use_cache=False).sel(date=slice(*date_range)))
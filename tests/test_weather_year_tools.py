@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from LiPEM.f_decomposition_tools import solve_benders
+from LiPEM.f_tools import extractCosts_l
+from LiPEM.f_weather_year_tools import add_weather_years, select_weather_year
+from conftest import solve, solver_options
+
+
+def weather_year_demand(parameters, factors):
+    """
+    returns the demand of the parameters scaled by a factor for each weather year
+    """
+    factors = xr.DataArray(factors, coords=dict(weather_year=1990 + np.arange(len(factors))))
+    return (parameters[["exogenous_energy_demand"]] * factors).transpose("weather_year", ...)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_identical_weather_years_give_the_objective_without_weather_years(synthetic_parameters, compact):
+    parameters = add_weather_years(synthetic_parameters, weather_year_demand(synthetic_parameters, [1., 1.]))
+    assert np.isclose(solve(parameters, compact=compact).objective.value,
+                      solve(synthetic_parameters, compact=compact).objective.value, rtol=1e-6)
+
+
+def test_costs_of_one_weather_year(synthetic_parameters):
+    parameters = add_weather_years(synthetic_parameters, weather_year_demand(synthetic_parameters, [1., 1.1]),
+                                   weights=[0.75, 0.25])
+    model = solve(parameters)
+    assert "weather_year" in model.solution["operation_conversion_power"].dims
+    assert "weather_year" not in model.solution["planning_conversion_power_capacity"].dims
+    for weather_year in parameters.get_index("weather_year"):
+        costs = extractCosts_l(model.solution.sel(weather_year=weather_year), select_weather_year(parameters, weather_year))
+        assert costs["operation_energy_cost"]["Cost_10e9_euros"].sum() > 0
+
+
+def test_costs_of_all_weather_years_with_the_compact_formulation(synthetic_parameters):
+    parameters = add_weather_years(synthetic_parameters, weather_year_demand(synthetic_parameters, [1., 1.1]),
+                                   weights=[0.75, 0.25])
+    full, compact = solve(parameters), solve(parameters, compact=True)
+    full_costs, compact_costs = extractCosts_l(full), extractCosts_l(compact, parameters)
+    operation_cost = compact_costs["operation_energy_cost"]["Cost_10e9_euros"]
+    assert operation_cost.index.get_level_values("weather_year").unique().tolist() == [1990, 1991]
+    for name, table in full_costs.items():
+        assert np.isclose(compact_costs[name]["Cost_10e9_euros"].sum(), table["Cost_10e9_euros"].sum(), rtol=1e-6)
+
+
+def test_benders_converges_to_the_objective_with_weather_years(synthetic_parameters):
+    parameters = add_weather_years(synthetic_parameters, weather_year_demand(synthetic_parameters, [1., 1.1]),
+                                   weights=[0.75, 0.25])
+    solution, report = solve_benders(parameters, solver_options=dict(solver_options, threads=1), tolerance=1e-4)
+    assert report["gap"].iloc[-1] <= 1e-4
+    assert report["upper_bound"].iloc[-1] == pytest.approx(solve(parameters).objective.value, rel=1e-4)
+    assert solution["operation_conversion_power"].sizes["weather_year"] == 2
+    assert "weather_year" not in solution["planning_conversion_power_capacity"].dims
+
+
+def test_add_weather_years_checks_the_weights_and_dates(synthetic_parameters):
+    demand = weather_year_demand(synthetic_parameters, [1., 1.1])
+    with pytest.raises(ValueError):
+        add_weather_years(synthetic_parameters, demand, weights=[0.5, 0.6])
+    with pytest.raises(ValueError):
+        add_weather_years(synthetic_parameters, demand.isel(date=slice(24)))